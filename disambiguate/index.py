@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+index.py - an on-disk index of the people in vivo by name pattern
+
+The index is built once from the csv file of vivo people used by
+get_vivo_disambiguation_data_from_csv().  Each line of the index file is
+
+    case <tab> key <tab> uri1 <tab> uri2 ...
+
+Lines are sorted by case and key.  The file is memory mapped and searched
+by bisection, so opening the index does not read the file and a lookup
+reads a few pages.  People added to vivo are merged into the index
+without computing the name patterns of the people already in it.
+"""
+
+import mmap
+import os
+
+from disambiguate.vivo_name import VivoName, CASE_0
+from disambiguate.utils import read_vivo_people_csv, \
+    get_vivo_disambiguation_data_from_csv
+
+__author__ = "Michael Conlon"
+__copyright__ = "Copyright (c) 2016 Michael Conlon"
+__license__ = "New BSD license"
+__version__ = "0.8.5"
+
+# divider for the fields of an index line
+
+FIELD_DIV = '\t'
+
+
+def encode_key(key):
+    """
+    :return the key as utf-8 bytes, as stored in the index
+    """
+    if isinstance(key, unicode):
+        return key.encode('utf-8')
+    return key
+
+
+def format_index_line(case, key, uris):
+    """
+    :return a line of the index file
+    """
+    return str(case) + FIELD_DIV + encode_key(key) + FIELD_DIV + \
+        FIELD_DIV.join(uris) + '\n'
+
+
+def parse_index_line(line):
+    """
+    :return a tuple of (case, key) and the list of uris of an index line
+    """
+    fields = line.rstrip('\n').split(FIELD_DIV)
+    return (int(fields[0]), fields[1]), fields[2:]
+
+
+def write_disambiguation_index(data, index_file):
+    """
+    Write the disambiguation data to an index file.  The file is replaced
+    only when the new index is complete.
+
+    :param data: dictionary of name patterns by case, as returned by
+        get_vivo_disambiguation_data_from_csv()
+    :return the number of lines in the index
+    """
+    entries = sorted(((case, encode_key(key)), uris)
+                     for case, keys in data.items()
+                     for key, uris in keys.items())
+    _write_entries(entries, index_file)
+    return len(entries)
+
+
+def build_disambiguation_index(csv_file, index_file):
+    """
+    Build the index file from the csv file of vivo people
+
+    :return the number of lines in the index
+    """
+    return write_disambiguation_index(
+        get_vivo_disambiguation_data_from_csv(csv_file), index_file)
+
+
+def add_to_disambiguation_index(index_file, people):
+    """
+    Merge people into the index file.  The lines of the index are read in
+    order and merged with the name patterns of the people.
+
+    :param people: iterable of (uri, fname, lname, mname)
+    :return the number of people added
+    """
+    added = {}
+    count = 0
+    for uri, fname, lname, mname in people:
+        count += 1
+        for case, key in VivoName(lname, fname, mname).get_keys():
+            uris = added.setdefault((case, encode_key(key)), [])
+            if uri not in uris:
+                uris.append(uri)
+    if count == 0:
+        return 0
+
+    def merged():
+        entries = sorted(added.items())
+        i = 0
+        if os.path.exists(index_file):
+            with open(index_file, 'rb') as index_fp:
+                for line in index_fp:
+                    case_key, uris = parse_index_line(line)
+                    while i < len(entries) and entries[i][0] < case_key:
+                        yield entries[i]
+                        i += 1
+                    if i < len(entries) and entries[i][0] == case_key:
+                        uris += [uri for uri in entries[i][1]
+                                 if uri not in uris]
+                        i += 1
+                    yield case_key, uris
+        for entry in entries[i:]:
+            yield entry
+
+    _write_entries(merged(), index_file)
+    return count
+
+
+def refresh_disambiguation_index(index_file, csv_file):
+    """
+    Add the people in the csv file who are not in the index file
+
+    :return the number of people added
+    """
+    with DisambiguationIndex(index_file) as index:
+        known = index.get_uris()
+    return add_to_disambiguation_index(
+        index_file, (person for person in read_vivo_people_csv(csv_file)
+                     if person[0] not in known))
+
+
+def open_disambiguation_index(index_file, csv_file):
+    """
+    Open the index file, building it from the csv file if there is no index,
+    and adding the new people in the csv file if the csv file has changed
+    since the index was written
+
+    :return a DisambiguationIndex
+    """
+    if not os.path.exists(index_file):
+        build_disambiguation_index(csv_file, index_file)
+    elif os.path.getmtime(csv_file) > os.path.getmtime(index_file):
+        if refresh_disambiguation_index(index_file, csv_file) == 0:
+            os.utime(index_file, None)
+    return DisambiguationIndex(index_file)
+
+
+def _write_entries(entries, index_file):
+    """
+    Write sorted ((case, key), uris) entries to a temporary file, then
+    rename it to the index file
+    """
+    temp_file = index_file + '.tmp'
+    with open(temp_file, 'wb') as index_fp:
+        for (case, key), uris in entries:
+            index_fp.write(format_index_line(case, key, uris))
+    os.rename(temp_file, index_file)
+
+
+class DisambiguationIndex(object):
+    """
+    Read only access to an index file written by
+    write_disambiguation_index().  index[case].get(key, []) finds the uris
+    of a name pattern, as with the dictionaries of
+    get_vivo_disambiguation_data_from_csv(), so the index can be passed to
+    get_author_disambiguation_data().
+    """
+    def __init__(self, index_file):
+        self.index_file = index_file
+        self.index_fp = open(index_file, 'rb')
+        if os.fstat(self.index_fp.fileno()).st_size > 0:
+            self.data = mmap.mmap(self.index_fp.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        else:
+            self.data = ''
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.index_fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __getitem__(self, case):
+        return _IndexCase(self, case)
+
+    def get(self, case, key):
+        """
+        :return the list of uris of the name pattern key in the
+            specified case, or an empty list if there are none
+        """
+        target = str(case) + FIELD_DIV + encode_key(key)
+        start = self._find(target)
+        line = self.data[start:self.data.find('\n', start)]
+        if _line_key(line) == target:
+            return line.split(FIELD_DIV)[2:]
+        return []
+
+    def keys_with_prefix(self, case, prefix):
+        """
+        :return the list of the name pattern keys of the specified case
+            that start with prefix, in order
+        """
+        target = str(case) + FIELD_DIV + encode_key(prefix)
+        keys = []
+        start = self._find(target)
+        while start < len(self.data):
+            end = self.data.find('\n', start)
+            line_key = _line_key(self.data[start:end])
+            if not line_key.startswith(target):
+                break
+            keys.append(line_key[len(str(case)) + 1:])
+            start = end + 1
+        return keys
+
+    def _find(self, target):
+        """
+        :return the offset of the first line with a case and key not less
+            than target, by bisection
+        """
+        data = self.data
+        lo = 0
+        hi = len(data)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = data.rfind('\n', 0, mid) + 1
+            end = data.find('\n', start)
+            if _line_key(data[start:end]) < target:
+                lo = end + 1
+            else:
+                hi = start
+        return lo
+
+    def get_uris(self):
+        """
+        :return the set of uris of all the people in the index
+        """
+        uris = set()
+        prefix = str(CASE_0) + FIELD_DIV
+        start = 0
+        while start < len(self.data):
+            end = self.data.find('\n', start)
+            if self.data[start:start + len(prefix)] == prefix:
+                uris.update(parse_index_line(self.data[start:end])[1])
+            start = end + 1
+        return uris
+
+
+def _line_key(line):
+    """
+    :return the case and key of an index line, as in the line
+    """
+    return line[:line.find(FIELD_DIV, line.find(FIELD_DIV) + 1)]
+
+
+class _IndexCase(object):
+    """
+    The name patterns of one case of a DisambiguationIndex
+    """
+    def __init__(self, index, case):
+        self.index = index
+        self.case = case
+
+    def get(self, key, default=None):
+        uris = self.index.get(self.case, key)
+        if len(uris) == 0:
+            return default
+        return uris
+
+    def keys_with_prefix(self, prefix):
+        return self.index.keys_with_prefix(self.case, prefix)
@@ -6,8 +6,9 @@ utils.py - helper functions
 from __future__ import print_function
 from sys import stderr
 import csv
+import difflib
 
-from disambiguate.vivo_name import VivoName
+from disambiguate.vivo_name import VivoName, DIV
 from disambiguate.vivo_name import CASE_0, CASE_1, CASE_2, CASE_3, CASE_4, CASE_5, CASE_6
 
 __author__ = "Andrei Sura"
@@ -15,6 +16,14 @@ __copyright__ = "Copyright (c) 2016 Andrei Sura"
 __license__ = "New BSD license"
 __version__ = "0.8.5"
 
+# minimum similarity of a name pattern key to a key in vivo for a fuzzy match
+
+DEFAULT_MATCH_CUTOFF = 0.9
+
+# number of leading characters of a key which must agree for a fuzzy match
+
+DEFAULT_PREFIX_LENGTH = 3
+
 
 def print_err(*args, **kwargs):
     """
@@ -31,7 +40,7 @@ def append_to_dict_list(modified_dict, key, val):
 
     try:
         my_list = modified_dict[key]
-    except IndexError:
+    except KeyError:
         # there is no list at the specified key therefore init one
         my_list = []
     my_list.append(val)
@@ -46,6 +55,26 @@ def append_to_dict_list(modified_dict, key, val):
     return my_list
 
 
+def read_vivo_people_csv(file_name):
+    """
+    Loop through the specified csv file which contains one vivo person per row
+    (person_uri, fname, lname, mname) after a header row
+
+    :return a generator of (uri, fname, lname, mname) tuples
+    """
+    with open(file_name, 'rb') as csv_file:
+        reader = csv.reader(csv_file, delimiter=',', quotechar=None)
+        count = 0
+
+        for row in reader:
+            count += 1
+            if count == 1:
+                # skip the first row
+                continue
+            yield row[0].strip(), row[1].strip(), row[2].strip(), \
+                row[3].strip()
+
+
 def get_vivo_disambiguation_data_from_csv(file_name):
     """"
     Loop through the specified csv file which contains one vivo person per row
@@ -70,59 +99,19 @@ def get_vivo_disambiguation_data_from_csv(file_name):
     Note: the logic in this file was borrowed from the original implementation
     in bibtex2rdf.py (git@ctsit-forge.ctsi.ufl.edu:vivo-pub-ingest.git)
     """
-    case0_dict = {}
-    case1_dict = {}
-    case2_dict = {}
-    case3_dict = {}
-    case4_dict = {}
-    case5_dict = {}
-    case6_dict = {}
+    data = {CASE_0: {}, CASE_1: {}, CASE_2: {}, CASE_3: {}, CASE_4: {},
+            CASE_5: {}, CASE_6: {}}
 
-    with open(file_name, 'rb') as csv_file:
-        reader = csv.reader(csv_file, delimiter=',', quotechar=None)
-        count = 0
+    people = list(read_vivo_people_csv(file_name))
+    uris = [person[0] for person in people]
+    vnames = VivoName.from_columns([person[2] for person in people],
+                                   [person[1] for person in people],
+                                   [person[3] for person in people])
+    for uri, vname in zip(uris, vnames):
+        for case, key in vname.get_keys():
+            data[case][key] = append_to_dict_list(data[case], key, uri)
 
-        for row in reader:
-            count += 1
-            if count == 1:
-                # skip the first row
-                continue
-            uri = row[0].strip()
-            fname = row[1].strip()
-            lname = row[2].strip()
-            mname = row[3].strip()
-
-            vname = VivoName(lname, fname, mname)
-
-            # @TODO: move the logic to the vivo_name
-            k0 = vname.get_key_0()
-            case0_dict[k0] = append_to_dict_list(case0_dict, k0, uri)
-
-            if vname.has_first():
-                k1 = vname.get_key_1()
-                k2 = vname.get_key_2()
-                case1_dict[k1] = append_to_dict_list(case1_dict, k1, uri)
-                case2_dict[k2] = append_to_dict_list(case2_dict, k2, uri)
-
-                if vname.has_middle():
-                    k3 = vname.get_key_3()
-                    k4 = vname.get_key_4()
-                    k5 = vname.get_key_5()
-                    k6 = vname.get_key_6()
-                    case3_dict[k3] = append_to_dict_list(case3_dict, k3, uri)
-                    case4_dict[k4] = append_to_dict_list(case4_dict, k4, uri)
-                    case5_dict[k5] = append_to_dict_list(case5_dict, k5, uri)
-                    case6_dict[k6] = append_to_dict_list(case6_dict, k6, uri)
-
-    return {
-        CASE_0: case0_dict,
-        CASE_1: case1_dict,
-        CASE_2: case2_dict,
-        CASE_3: case3_dict,
-        CASE_4: case4_dict,
-        CASE_5: case5_dict,
-        CASE_6: case6_dict,
-    }
+    return data
 
 
 def get_author_disambiguation_data(vivo_auth_disambig_data,
@@ -131,6 +120,7 @@ def get_author_disambiguation_data(vivo_auth_disambig_data,
     @TODO: check if we can pass an object instead
 
     @see get_vivo_disambiguation_data_from_csv()
+    @see disambiguate.index.DisambiguationIndex
     :return an array of uri's that have been found in vivo for
     the specified person
     """
@@ -139,3 +129,113 @@ def get_author_disambiguation_data(vivo_auth_disambig_data,
     disambiguation_list = vivo_auth_disambig_data[case].get(
         vname.get_key(), [])
     return disambiguation_list
+
+
+def match_authors(vivo_auth_disambig_data, rows, fuzzy=True,
+                  cutoff=DEFAULT_MATCH_CUTOFF,
+                  prefix_length=DEFAULT_PREFIX_LENGTH, fuzzy_rows=None):
+    """
+    Find the uris of many authors at once.  Authors are grouped by case and
+    each distinct name pattern is looked up once.  Name patterns not found
+    in vivo are compared with the patterns of the same case in vivo that
+    start with the same `prefix_length` characters of the last name and
+    have the same first initial, and the most similar pattern with a
+    similarity of at least `cutoff` is used.
+
+    @see get_author_disambiguation_data()
+    :param vivo_auth_disambig_data: dictionaries of name patterns by case,
+        or a DisambiguationIndex
+    :param rows: dictionary of rows with `last`, `first` and `middle`
+        columns, keyed by row index
+    :param fuzzy: False to find exact name patterns only
+    :param fuzzy_rows: optional dictionary.  The name pattern and the
+        pattern it matched are added for each row matched by similarity,
+        keyed by row index
+    :return a dictionary of the list of uris found in vivo for each row,
+        keyed by row index.  The list is empty if none were found
+    """
+    case_keys = {}
+    for row_index, row in rows.items():
+        vname = VivoName(row['last'], row['first'], row['middle'])
+        case_keys.setdefault(vname.get_case(), {}).setdefault(
+            vname.get_key(), []).append(row_index)
+
+    author_uris = {}
+    for case, keys in case_keys.items():
+        case_data = vivo_auth_disambig_data[case]
+        if isinstance(case_data, dict):
+            found = keys.viewkeys() & case_data.viewkeys()
+        else:
+            found = set(key for key in keys if case_data.get(key))
+        key_uris = dict((key, case_data.get(key)) for key in found)
+
+        if fuzzy:
+            missed = [key for key in keys if key not in found and
+                      len(key.split(DIV)[0]) > 0]
+            close_keys = get_close_keys(case_data, missed, cutoff,
+                                        prefix_length)
+            for key, close_key in close_keys.items():
+                key_uris[key] = case_data.get(close_key)
+        else:
+            close_keys = {}
+
+        for key, row_indexes in keys.items():
+            for row_index in row_indexes:
+                author_uris[row_index] = list(key_uris.get(key, []))
+                if fuzzy_rows is not None and key in close_keys:
+                    fuzzy_rows[row_index] = (key, close_keys[key])
+    return author_uris
+
+
+def get_close_keys(case_data, keys, cutoff=DEFAULT_MATCH_CUTOFF,
+                   prefix_length=DEFAULT_PREFIX_LENGTH):
+    """
+    :param case_data: the name patterns of one case, a dictionary or a case
+        of a DisambiguationIndex
+    :return a dictionary of the most similar name pattern in case_data to
+        each of the keys, for the keys with a pattern of at least `cutoff`
+        similarity in the same block
+    """
+    if isinstance(case_data, dict):
+        blocks = {}
+        if len(keys) > 0:
+            for key in case_data:
+                blocks.setdefault(get_key_block(key, prefix_length),
+                                  []).append(key)
+        block_keys = lambda key, block: blocks.get(block, [])
+    else:
+        block_keys = lambda key, block: [
+            candidate for candidate in
+            case_data.keys_with_prefix(key.split(DIV)[0][:prefix_length])
+            if get_key_block(candidate, prefix_length) == block]
+
+    close_keys = {}
+    matcher = difflib.SequenceMatcher()
+    for key in keys:
+
+        # the similarity of strings is at most 2 * shorter / (sum of lengths)
+
+        shortest = len(key) * cutoff / (2 - cutoff)
+        longest = len(key) * (2 - cutoff) / cutoff
+        matcher.set_seq2(key)
+        best = cutoff
+        for candidate in block_keys(key, get_key_block(key, prefix_length)):
+            if shortest <= len(candidate) <= longest:
+                matcher.set_seq1(candidate)
+                if matcher.real_quick_ratio() >= best and \
+                        matcher.quick_ratio() >= best:
+                    ratio = matcher.ratio()
+                    if ratio >= best:
+                        best = ratio
+                        close_keys[key] = candidate
+    return close_keys
+
+
+def get_key_block(key, prefix_length=DEFAULT_PREFIX_LENGTH):
+    """
+    :return the block of a name pattern, the first `prefix_length`
+        characters of the last name and the first initial, if any.  Only
+        patterns in the same block are compared for similarity
+    """
+    parts = key.split(DIV, 1)
+    return parts[0][:prefix_length], parts[1][:1] if len(parts) > 1 else ''
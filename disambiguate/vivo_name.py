@@ -9,6 +9,8 @@ __copyright__ = "Copyright (c) 2016 Andrei Sura"
 __license__ = "New BSD license"
 __version__ = "0.8.5"
 
+from itertools import izip
+
 # divider for the fragments in the key
 
 DIV = '|'
@@ -28,16 +30,31 @@ class VivoName(object):
     """
     Class constructor.
 
+    The keys of the name are computed the first time one of them is
+    requested and kept with the name.
+
     @see setup()
     @see usage in
     """
+    __slots__ = ('last', 'first', 'middle', 'case', '_keys')
+
     def __init__(self, last, first, middle):
         self.last = last.strip()
         self.first = first.strip()
         self.middle = middle.strip()
         self.case = 0
+        self._keys = None
         self.setup()
 
+    @classmethod
+    def from_columns(cls, lasts, firsts, middles):
+        """
+        :return a list of names, one for each position in the lists of
+            last, first and middle names
+        """
+        return [cls(last, first, middle)
+                for last, first, middle in izip(lasts, firsts, middles)]
+
     def get_case(self):
         return self.case
 
@@ -45,14 +62,9 @@ class VivoName(object):
     def format_as_key(cls, key):
         if key is None:
             return 'none'
-
-        try:
-            return key.encode('utf-8', errors='ignore').strip().lower()
-        except UnicodeEncodeError:
-            # print >>sys.stderr, "KEY: " + key
-            # sys.exit()
-            pass
-        return key.decode("utf8")
+        if isinstance(key, unicode):
+            key = key.encode('utf-8', 'ignore')
+        return key.strip().lower()
 
     def has_all_parts(self):
         return self.has_last() and self.has_first() and self.has_middle()
@@ -71,60 +83,73 @@ class VivoName(object):
         Helper method for computing the `case` logic used for disambiguation.
         Called by the constructor.
         """
-        if self.has_all_parts():
-            if len(self.first) == 1 and len(self.middle) == 1:
-                self.case = 3
-            if len(self.first) == 1 and len(self.middle) > 1:
-                self.case = 4
-            if len(self.first) > 1 and len(self.middle) == 1:
-                self.case = 5
-            if len(self.first) > 1 and len(self.middle) > 1:
-                self.case = 6
-        elif self.has_last() and self.has_first():
-            if len(self.first) == 1:
-                self.case = 1
-            else:
-                self.case = 2
+        len_first = len(self.first)
+        len_middle = len(self.middle)
+        if len(self.last) == 0 or len_first == 0:
+            self.case = CASE_0
+        elif len_middle == 0:
+            self.case = CASE_1 if len_first == 1 else CASE_2
+        elif len_first == 1:
+            self.case = CASE_3 if len_middle == 1 else CASE_4
         else:
-            self.case = 0
+            self.case = CASE_5 if len_middle == 1 else CASE_6
+
+    def get_all_keys(self):
+        """
+        Compute the key of each case from the name parts, formatting each
+        part once
+
+        :return a tuple of the keys of cases 0 to 6
+        """
+        if self._keys is None:
+            last = self.format_as_key(self.last)
+            first = DIV + self.format_as_key(self.first)
+            first_initial = DIV + self.format_as_key(self.first[:1])
+            middle = DIV + self.format_as_key(self.middle)
+            middle_initial = DIV + self.format_as_key(self.middle[:1])
+            self._keys = (last,
+                          last + first_initial,
+                          last + first,
+                          last + first_initial + middle_initial,
+                          last + first_initial + middle,
+                          last + first + middle_initial,
+                          last + first + middle)
+        return self._keys
+
+    def get_keys(self):
+        """
+        :return a list of (case, key) pairs for all the name patterns of
+            the name that can be used to find the person.  Cases 1 and 2
+            need a first name, cases 3 to 6 a first and a middle name
+        """
+        keys = self.get_all_keys()
+        if not self.has_first():
+            return [(CASE_0, keys[CASE_0])]
+        if not self.has_middle():
+            return [(CASE_0, keys[CASE_0]), (CASE_1, keys[CASE_1]),
+                    (CASE_2, keys[CASE_2])]
+        return list(enumerate(keys))
 
     def get_key_0(self):
-        return self.format_as_key(self.last)
+        return self.get_all_keys()[CASE_0]
 
     def get_key_1(self):
-        return self.format_as_key(self.last + DIV + self.first[0])
+        return self.get_all_keys()[CASE_1]
 
     def get_key_2(self):
-        return self.format_as_key(self.last + DIV + self.first)
+        return self.get_all_keys()[CASE_2]
 
     def get_key_3(self):
-        return self.format_as_key(self.last + DIV + self.first[0] +
-                                  DIV + self.middle[0])
+        return self.get_all_keys()[CASE_3]
 
     def get_key_4(self):
-        return self.format_as_key(self.last + DIV +
-                                  self.first[0] + DIV + self.middle)
+        return self.get_all_keys()[CASE_4]
 
     def get_key_5(self):
-        return self.format_as_key(self.last + DIV +
-                                  self.first + DIV + self.middle[0])
+        return self.get_all_keys()[CASE_5]
 
     def get_key_6(self):
-        return self.format_as_key(self.last + DIV +
-                                  self.first + DIV + self.middle)
+        return self.get_all_keys()[CASE_6]
 
     def get_key(self):
-        if CASE_0 == self.case:
-            return self.get_key_0()
-        if CASE_1 == self.case:
-            return self.get_key_1()
-        if CASE_2 == self.case:
-            return self.get_key_2()
-        if CASE_3 == self.case:
-            return self.get_key_3()
-        if CASE_4 == self.case:
-            return self.get_key_4()
-        if CASE_5 == self.case:
-            return self.get_key_5()
-        if CASE_6 == self.case:
-            return self.get_key_6()
+        return self.get_all_keys()[self.case]
@@ -10,6 +10,36 @@ __copyright__ = "Copyright (c) 2016 Michael Conlon"
 __license__ = "New BSD license"
 __version__ = "0.1"
 
+import heapq
+import re
+from collections import OrderedDict
+from datetime import date
+
+# Number of distinct values remembered for each improve function by improve
+
+DEFAULT_IMPROVE_CACHE_SIZE = 10000
+
+# Tables with fewer abbreviations than this expand by replacing each abbreviation in turn, which is faster for them
+# than finding the abbreviations in the text first
+
+SMALL_ABBREVIATION_TABLE = 16
+
+# Patterns and words of the improve functions, compiled once
+
+EMAIL_PATTERN = re.compile(r'\w+\.*\w+@\w+\.(\w+\.*)*\w+')
+DOLLAR_AMOUNT_PATTERN = re.compile('[0-9]*[0-9]\.[0-9][0-9]')
+DATE_NUMBERS_PATTERN = re.compile('([0-9]+)[-/, ]([0-9]+)[-/, ]([0-9]+)')
+DATE_MONTH_WORD_PATTERN = re.compile('([0-9]+)[-/, ]([a-zA-Z]+)[-,/ ]([0-9]+)')
+
+MONTH_WORDS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6, 'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11,
+    'dec': 12, 'january': 1, 'february': 2, 'march': 3, 'april': 4, 'june': 6, 'july': 7, 'august': 8,
+    'september': 9, 'october': 10, 'november': 11, 'december': 12
+}
+
+DEPTID_PATTERN = re.compile('([0-9]{1,8})')
+NIH_AWARD_PATTERN = re.compile('.*([A-Za-z][0-9][0-9]).*([A-Za-z][A-Za-z][0-9]{6})')
+
 
 class FilterNotFoundException(Exception):
     """
@@ -48,13 +78,124 @@ def comma_space(s):
     return s
 
 
+class AbbreviationTable(object):
+    """
+    A table of abbreviations and their expansions, compiled once.  expand gives the same text as replacing each
+    abbreviation in the order of the table.  One pass of a trie shaped regular expression over the text finds the
+    abbreviations it contains, and only those are replaced, in table order.  Replacing an abbreviation can create
+    a later one, so each replacement made adds the later abbreviations its expansion can create.  Small tables
+    replace each abbreviation in turn
+    """
+
+    def __init__(self, abbreviations):
+        """
+        :param abbreviations: dictionary of expansions by abbreviation.  Abbreviations are replaced in the order of
+        the dictionary
+        """
+        self.abbreviations = abbreviations
+        self.keys = list(abbreviations)
+        self.order = dict((abbrev, i) for i, abbrev in enumerate(self.keys))
+        self.pattern = re.compile('(?=(' + _trie_pattern(self.keys) + '))')
+
+        #   The pattern finds the longest abbreviation at each position of the text.  The abbreviations at the
+        #   position are those that are prefixes of it
+
+        self.prefixes = dict((abbrev, [self.order[x] for x in self.keys if abbrev.startswith(x)])
+                             for abbrev in self.keys)
+
+        #   The later abbreviations that replacing each abbreviation can create in the text
+
+        self.creates = dict((abbrev, [self.order[x] for x in self.keys[self.order[abbrev] + 1:]
+                                      if _can_create(x, abbrev, expansion)])
+                            for abbrev, expansion in abbreviations.items())
+
+    def expand(self, t):
+        """
+        :param t: text with abbreviations
+        :return: text with abbreviations replaced by their expansions
+        """
+        if len(self.keys) < SMALL_ABBREVIATION_TABLE:
+            for abbrev in self.keys:
+                t = t.replace(abbrev, self.abbreviations[abbrev])
+            return t
+        found = self.pattern.findall(t)
+        if len(found) == 0:
+            return t
+        pending = set()
+        for abbrev in found:
+            pending.update(self.prefixes[abbrev])
+        pending = list(pending)
+        heapq.heapify(pending)
+        queued = set(pending)
+        while len(pending) > 0:
+            abbrev = self.keys[heapq.heappop(pending)]
+            expanded = t.replace(abbrev, self.abbreviations[abbrev])
+            if expanded != t:
+                for i in self.creates[abbrev]:
+                    if i not in queued:
+                        queued.add(i)
+                        heapq.heappush(pending, i)
+                t = expanded
+        return t
+
+
+def _trie_pattern(words):
+    """
+    :return: a regular expression matching any of the words, with the alternatives nested by common prefix so that
+    matching tries each character of the text once
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for c in word:
+            node = node.setdefault(c, {})
+        node[''] = {}
+
+    def pattern(node):
+        branches = [re.escape(c) + pattern(child) for c, child in sorted(node.items()) if c != '']
+        if len(branches) == 0:
+            return ''
+        group = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            return '(?:' + group + ')?'
+        return group
+
+    return pattern(trie)
+
+
+def _can_create(x, abbrev, expansion):
+    """
+    Can replacing abbrev with expansion make text contain x where it did not before?  Only text overlapping the
+    expansion is new, less any prefix or suffix the expansion shares with abbrev
+    :return: True if the replacement can create x
+    """
+    prefix = 0
+    while prefix < min(len(abbrev), len(expansion)) and abbrev[prefix] == expansion[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < min(len(abbrev), len(expansion)) and abbrev[-1 - suffix] == expansion[-1 - suffix]:
+        suffix += 1
+    if expansion == '':
+        return abbrev != ''  # the text on either side is joined
+    if abbrev != expansion and expansion in x:
+        return True
+    for i in range(len(expansion) - len(x) + 1):
+        if expansion.startswith(x, i) and i + len(x) > prefix and i < len(expansion) - suffix:
+            return True
+    for i in range(suffix + 1, min(len(x), len(expansion) + 1)):
+        if x.startswith(expansion[-i:]):
+            return True
+    for i in range(prefix + 1, min(len(x), len(expansion) + 1)):
+        if x.endswith(expansion[:i]):
+            return True
+    return False
+
+
 def improve_email(email):
     """
     Given an email string, fix it
     """
-    import re
-    exp = re.compile(r'\w+\.*\w+@\w+\.(\w+\.*)*\w+')
-    s = exp.search(email.lower())
+    s = EMAIL_PATTERN.search(email.lower())
     if s is None:
         return ""
     elif s.group() is not None:
@@ -138,6 +279,20 @@ def improve_phone_number(phone):
     return updated_phone
 
 
+COURSE_TITLE_ABBREVIATIONS = AbbreviationTable({
+    "Intro ": "Introduction ",
+    "To ": "to ",
+    "Of ": "of ",
+    "In ": "in ",
+    "Stat ": "Statistics ",
+    "Spec ": "Special ",
+    "Top ": "Topics ",
+    "Hist ": "History ",
+    "Hlthcare ": "Healthcare ",
+    "Prac ": "Practice "
+})
+
+
 def improve_course_title(s):
     """
     The Office of the University Registrar at UF uses a series of abbreviations to fit course titles into limited text
@@ -145,18 +300,6 @@ def improve_course_title(s):
     Here we attempt to reverse the process -- a short title is turned into a
     longer one for use in labels
     """
-    abbrev_table = {
-        "Intro ": "Introduction ",
-        "To ": "to ",
-        "Of ": "of ",
-        "In ": "in ",
-        "Stat ": "Statistics ",
-        "Spec ": "Special ",
-        "Top ": "Topics ",
-        "Hist ": "History ",
-        "Hlthcare ": "Healthcare ",
-        "Prac ": "Practice "
-    }
     s = s.lower()  # convert to lower
     s = s.title()  # uppercase each word
     s += ' '       # add a trailing space so we can find these abbreviated words throughout the string
@@ -166,8 +309,7 @@ def improve_course_title(s):
     t = t.replace("/", " @")  # might be two slashes in the input
     t = t.replace(",", " !")
     t = t.replace("-", " #")
-    for abbrev in abbrev_table:
-        t = t.replace(abbrev, abbrev_table[abbrev])
+    t = COURSE_TITLE_ABBREVIATIONS.expand(t)
     t = t.replace(" @", "/")  # restore /
     t = t.replace(" @", "/")  # restore /
     t = t.replace(" !", ",")  # restore ,
@@ -177,6 +319,127 @@ def improve_course_title(s):
     return t[0].upper() + t[1:]
 
 
+JOBCODE_ABBREVIATIONS = AbbreviationTable({
+    "Aca ": "Academic ",
+    "Act ": "Acting ",
+    "Adj ": "Adjunct ",
+    "Adm ": "Administrator ",
+    "Admin ": "Administrative ",
+    "Adv ": "Advisory ",
+    "Advanc ": "Advanced ",
+    "Aff ": "Affiliate ",
+    "Affl ": "Affiliate ",
+    "Agric ": "Agricultural ",
+    "Alumn Aff ": "Alumni Affairs ",
+    "Anal  ": "Analyst ",
+    "Anlst ": "Analyst ",
+    "Aso ": "Associate ",
+    "Asoc ": "Associate ",
+    "Assoc ": "Associate ",
+    "Asst ": "Assistant ",
+    "Asst. ": "Assistant ",
+    "Ast ": "Assistant ",
+    "Ast #G ": "Grading Assistant ",
+    "Ast #R ": "Research Assistant ",
+    "Ast #T ": "Teaching Assistant ",
+    "Bio ": "Biological ",
+    "Cfo ": "Chief Financial Officer ",
+    "Chem ": "Chemist ",
+    "Chr ": "Chair ",
+    "Cio ": "Chief Information Officer ",
+    "Clin ": "Clinical ",
+    "Clrk ": "Clerk ",
+    "Co ": "Courtesy ",
+    "Comm ": "Communications ",
+    "Communic ": "Communications ",
+    "Coo ": "Chief Operating Officer ",
+    "Coord ": "Coordinator ",
+    "Couns ": "Counselor ",
+    "Crd ": "Coordinator ",
+    "Ctr ": "Center ",
+    "Ctsy ": "Courtesy ",
+    "Cty ": "County ",
+    "Dev ": "Development ",
+    "Devel ": "Development ",
+    "Dir ": "Director ",
+    "Dis ": "Distinguished ",
+    "Dist ": "Distinguished ",
+    "Div ": "Division ",
+    "Dn ": "Dean ",
+    "Educ ": "Education ",
+    "Emer ": "Emeritus ",
+    "Emin ": "Eminent ",
+    "Enforce ": "Enforcement ",
+    "Eng ": "Engineer ",
+    "Environ ": "Environmental ",
+    "Ext ": "Extension ",
+    "Facil ": "Facility ",
+    "Fin ": "Financial",
+    "Finan ": "Financial ",
+    "Gen ": "General ",
+    "Grd ": "Graduate ",
+    "Hlt ": "Health ",
+    "Hlth ": "Health ",
+    "Ii ": "II ",
+    "Iii ": "III ",
+    "Info ": "Information ",
+    "Int ": "Interim ",
+    "It ": "Information Technology ",
+    "Iv ": "IV ",
+    "Jnt ": "Joint ",
+    "Jr": "Junior",
+    "Lect ": "Lecturer ",
+    "Mgr ": "Manager ",
+    "Mgt ": "Management ",
+    "Mstr ": "Master ",
+    "Opr ": "Operator ",
+    "Phas ": "Phased ",
+    "Pky ": "PK Yonge ",
+    "Postdoc ": "Postdoctoral ",
+    "Pract ": "Practitioner ",
+    "Pres ": "President ",
+    "Pres5 ": "President 5 ",
+    "Pres6 ": "President 6 ",
+    "Prg ": "Program ",
+    "Prof ": "Professor ",
+    "Prof. ": "Professor ",
+    "Prog ": "Programmer ",
+    "Progs ": "Programs ",
+    "Prov ": "Provisional ",
+    "Radiol ": "Radiology ",
+    "Rcv ": "Receiving ",
+    "Registr ": "Registration ",
+    "Rep ": "Representative ",
+    "Res ": "Research ",
+    "Ret ": "Retirement ",
+    "Rsch ": "Research ",
+    "Rsrh ": "Research ",
+    "Sch ": "School ",
+    "Sci ": "Scientist ",
+    "Sctst ": "Scientist ",
+    "Ser ": "Service ",
+    "Serv ": "Service ",
+    "Spc ": "Specialist ",
+    "Spec ": "Specialist ",
+    "Spv ": "Supervisor ",
+    "Sr ": "Senior ",
+    "Stu ": "Student ",
+    "Stud ": "Student",
+    "Supp ": "Support ",
+    "Supt ": "Superintendent ",
+    "Supv ": "Supervisor ",
+    "Svcs ": "Services ",
+    "Tch ": "Teaching ",
+    "Tech ": "Technician ",
+    "Technol ": "Technologist ",
+    "Tele ": "Telecommunications ",
+    "Tv ": "TV ",
+    "Univ ": "University ",
+    "Vis ": "Visiting ",
+    "Vp ": "Vice President "
+})
+
+
 def improve_jobcode_description(s):
     """
     HR uses a series of abbreviations to fit job titles into limited text
@@ -184,125 +447,6 @@ def improve_jobcode_description(s):
     Here we attempt to reverse the process -- a short title is turned into a
     longer one for use in position labels
     """
-    abbrev_table = {
-        "Aca ": "Academic ",
-        "Act ": "Acting ",
-        "Adj ": "Adjunct ",
-        "Adm ": "Administrator ",
-        "Admin ": "Administrative ",
-        "Adv ": "Advisory ",
-        "Advanc ": "Advanced ",
-        "Aff ": "Affiliate ",
-        "Affl ": "Affiliate ",
-        "Agric ": "Agricultural ",
-        "Alumn Aff ": "Alumni Affairs ",
-        "Anal  ": "Analyst ",
-        "Anlst ": "Analyst ",
-        "Aso ": "Associate ",
-        "Asoc ": "Associate ",
-        "Assoc ": "Associate ",
-        "Asst ": "Assistant ",
-        "Asst. ": "Assistant ",
-        "Ast ": "Assistant ",
-        "Ast #G ": "Grading Assistant ",
-        "Ast #R ": "Research Assistant ",
-        "Ast #T ": "Teaching Assistant ",
-        "Bio ": "Biological ",
-        "Cfo ": "Chief Financial Officer ",
-        "Chem ": "Chemist ",
-        "Chr ": "Chair ",
-        "Cio ": "Chief Information Officer ",
-        "Clin ": "Clinical ",
-        "Clrk ": "Clerk ",
-        "Co ": "Courtesy ",
-        "Comm ": "Communications ",
-        "Communic ": "Communications ",
-        "Coo ": "Chief Operating Officer ",
-        "Coord ": "Coordinator ",
-        "Couns ": "Counselor ",
-        "Crd ": "Coordinator ",
-        "Ctr ": "Center ",
-        "Ctsy ": "Courtesy ",
-        "Cty ": "County ",
-        "Dev ": "Development ",
-        "Devel ": "Development ",
-        "Dir ": "Director ",
-        "Dis ": "Distinguished ",
-        "Dist ": "Distinguished ",
-        "Div ": "Division ",
-        "Dn ": "Dean ",
-        "Educ ": "Education ",
-        "Emer ": "Emeritus ",
-        "Emin ": "Eminent ",
-        "Enforce ": "Enforcement ",
-        "Eng ": "Engineer ",
-        "Environ ": "Environmental ",
-        "Ext ": "Extension ",
-        "Facil ": "Facility ",
-        "Fin ": "Financial",
-        "Finan ": "Financial ",
-        "Gen ": "General ",
-        "Grd ": "Graduate ",
-        "Hlt ": "Health ",
-        "Hlth ": "Health ",
-        "Ii ": "II ",
-        "Iii ": "III ",
-        "Info ": "Information ",
-        "Int ": "Interim ",
-        "It ": "Information Technology ",
-        "Iv ": "IV ",
-        "Jnt ": "Joint ",
-        "Jr": "Junior",
-        "Lect ": "Lecturer ",
-        "Mgr ": "Manager ",
-        "Mgt ": "Management ",
-        "Mstr ": "Master ",
-        "Opr ": "Operator ",
-        "Phas ": "Phased ",
-        "Pky ": "PK Yonge ",
-        "Postdoc ": "Postdoctoral ",
-        "Pract ": "Practitioner ",
-        "Pres ": "President ",
-        "Pres5 ": "President 5 ",
-        "Pres6 ": "President 6 ",
-        "Prg ": "Program ",
-        "Prof ": "Professor ",
-        "Prof. ": "Professor ",
-        "Prog ": "Programmer ",
-        "Progs ": "Programs ",
-        "Prov ": "Provisional ",
-        "Radiol ": "Radiology ",
-        "Rcv ": "Receiving ",
-        "Registr ": "Registration ",
-        "Rep ": "Representative ",
-        "Res ": "Research ",
-        "Ret ": "Retirement ",
-        "Rsch ": "Research ",
-        "Rsrh ": "Research ",
-        "Sch ": "School ",
-        "Sci ": "Scientist ",
-        "Sctst ": "Scientist ",
-        "Ser ": "Service ",
-        "Serv ": "Service ",
-        "Spc ": "Specialist ",
-        "Spec ": "Specialist ",
-        "Spv ": "Supervisor ",
-        "Sr ": "Senior ",
-        "Stu ": "Student ",
-        "Stud ": "Student",
-        "Supp ": "Support ",
-        "Supt ": "Superintendent ",
-        "Supv ": "Supervisor ",
-        "Svcs ": "Services ",
-        "Tch ": "Teaching ",
-        "Tech ": "Technician ",
-        "Technol ": "Technologist ",
-        "Tele ": "Telecommunications ",
-        "Tv ": "TV ",
-        "Univ ": "University ",
-        "Vis ": "Visiting ",
-        "Vp ": "Vice President "
-    }
     s = s.lower()  # convert to lower
     s = s.title()  # uppercase each word
     s += ' '       # add a trailing space so we can find these abbreviated words throughout the string
@@ -313,8 +457,7 @@ def improve_jobcode_description(s):
     t = t.replace("/", " @")  # might be two slashes in the input
     t = t.replace(",", " !")
 
-    for abbrev in abbrev_table:
-        t = t.replace(abbrev, abbrev_table[abbrev])
+    t = JOBCODE_ABBREVIATIONS.expand(t)
     t = t.replace(" @", "/")  # restore /
     t = t.replace(" @", "/")
     t = t.replace(" !", ",")  # restore ,
@@ -322,6 +465,222 @@ def improve_jobcode_description(s):
     return t[:-1]  # Take off the trailing space
 
 
+ORG_NAME_ABBREVIATIONS = AbbreviationTable({
+    " & ": " and ",
+    "'S ": "'s ",
+    " A ": " a ",
+    "Aav ": "AAV ",
+    "Aca ": "Academy ",
+    "Acad ": "Academy ",
+    "Admn ": "Administration ",
+    "Adv ": "Advanced ",
+    "Advanc ": "Advanced ",
+    "Ag ": "Agriculture ",
+    "Agri ": "Agriculture ",
+    "Amer ": "American ",
+    "And ": "and ",
+    "Analysists ": "Analysts ",
+    "Asso ": "Association ",
+    "Assoc ": "Association ",
+    "At ": "at ",
+    "Bldg ": "Building ",
+    "Bpm ": "BPM ",
+    "Brcc ": "BRCC ",
+    "Childrens ": "Children's ",
+    "Clin ": "Clinical ",
+    "Clncl ": "Clinical ",
+    "Cms ": "CMS ",
+    "Cns ": "CNS ",
+    "Cncl ": "Council ",
+    "Cncr ": "Cancer ",
+    "Cnty ": "County ",
+    "Co ": "Company ",
+    "Cog ": "COG ",
+    "Col ": "College ",
+    "Coll ": "College ",
+    "Communic ": "Communications ",
+    "Compar ": "Compare ",
+    "Coo ": "Chief Operating Officer ",
+    "Corp ": "Corporation ",
+    "Cpb ": "CPB ",
+    "Crd ": "Coordinator ",
+    "Cse ": "CSE ",
+    "Ctr ": "Center ",
+    "Cty ": "County ",
+    "Cwp ": "CWP ",
+    "Dbs ": "DBS ",
+    "Dept ": "Department ",
+    "Dev ": "Development ",
+    "Devel ": "Development ",
+    "Dist ": "Distinguished ",
+    "Dna ": "DNA ",
+    "Doh ": "DOH ",
+    "Doh/cms ": "DOH/CMS ",
+    "Double Blinded ": "Double-blind ",
+    "Double-blinded ": "Double-blind ",
+    "Dpt-1 ": "DPT-1 ",
+    "Dtra0001 ": "DTRA0001 ",
+    "Dtra0016 ": "DTRA-0016 ",
+    "Edu ": "Education ",
+    "Educ ": "Education ",
+    "Eff/saf ": "Safety and Efficacy ",
+    "Eh&S ": "EH&S ",
+    "Emer ": "Emeritus ",
+    "Emin ": "Eminent ",
+    "Enforce ": "Enforcement ",
+    "Eng ": "Engineer ",
+    "Environ ": "Environmental ",
+    "Epr ": "EPR ",
+    "Eval ": "Evaluation ",
+    "Ext ": "Extension ",
+    "Fdot ": "FDOT ",
+    "Fdots ": "FDOT ",
+    "Fhtcc ": "FHTCC ",
+    "Finan ": "Financial ",
+    "Fl ": "Florida ",
+    "Fla ": "Florida ",
+    "Fllw ": "Follow ",
+    "Fndt ": "Foundation ",
+    "For ": "for ",
+    "Fou ": "Foundation ",
+    "G-csf ": "G-CSF ",
+    "Gen ": "General ",
+    "Gis ": "GIS ",
+    "Gm-csf ": "GM-CSF ",
+    "Grad ": "Graduate ",
+    "Hcv ": "HCV ",
+    "Hiv ": "HIV ",
+    "Hiv-infected ": "HIV-infected ",
+    "Hiv/aids ": "HIV/AIDS ",
+    "Hlb ": "HLB ",
+    "Hlth ": "Health ",
+    "Hosp ": "Hospital ",
+    "Hou ": "Housing ",
+    "Hsv-1 ": "HSV-1 ",
+    "I/ii ": "I/II ",
+    "I/ucrc ": "I/UCRC ",
+    "Ica ": "ICA ",
+    "Icd ": "ICD ",
+    "Ieee ": "IEEE ",
+    "Ifas ": "IFAS ",
+    "Igf-1 ": "IGF-1 ",
+    "Ii ": "II ",
+    "Ii/iii ": "II/III ",
+    "Iii ": "III ",
+    "In ": "in ",
+    "Info ": "Information ",
+    "Inst ": "Institute ",
+    "Intl ": "International ",
+    "Intervent ": "Intervention ",
+    "Ipa ": "IPA ",
+    "Ipm ": "IPM ",
+    "Ippd ": "IPPD ",
+    "Ips ": "IPS ",
+    "It ": "Information Technology ",
+    "Iv ": "IV ",
+    "Jnt ": "Joint ",
+    "Lng ": "Long ",
+    "Mccarty ": "McCarty ",
+    "Mgmt ": "Management ",
+    "Mgr ": "Manager ",
+    "Mgt ": "Management ",
+    "Mlti ": "Multi ",
+    "Mlti-ctr ": "Multicenter ",
+    "Mltictr ": "Multicenter ",
+    "Mri ": "MRI ",
+    "Mstr ": "Master ",
+    "Multi-center ": "Multicenter ",
+    "Multi-ctr ": "Multicenter ",
+    "Natl ": "National ",
+    "Nih ": "NIH ",
+    "Nmr ": "NMR ",
+    "Nsf ": "NSF ",
+    "Ne ": "NE ",
+    "Nw ": "NW ",
+    "Of ": "of ",
+    "On ": "on ",
+    "Or ": "or ",
+    "Open-labeled ": "Open-label ",
+    "Opn-lbl ": "Open-label ",
+    "Opr ": "Operator ",
+    "Org ": "Organization ",
+    "Pgm ": "Program ",
+    "Phas ": "Phased ",
+    "Php ": "PHP ",
+    "Phs ": "PHS ",
+    "Pk/pd ": "PK/PD ",
+    "Pky ": "P. K. Yonge ",
+    "Plcb-ctrl ": "Placebo-controlled ",
+    "Plcbo ": "Placebo ",
+    "Plcbo-ctrl ": "Placebo-controlled ",
+    "Postdoc ": "Postdoctoral ",
+    "Pract ": "Practitioner ",
+    "Pres5 ": "President 5 ",
+    "Pres6 ": "President 6 ",
+    "Prg ": "Programs ",
+    "Prof ": "Professor ",
+    "Prog ": "Programmer ",
+    "Progs ": "Programs ",
+    "Prov ": "Provisional ",
+    "Psr ": "PSR ",
+    "Radiol ": "Radiology ",
+    "Rcv ": "Receiving ",
+    "Rdmzd ": "Randomized ",
+    "Heat Refrig Air Con": "Heating, Refrigerating and Air-Conditioning Engineers",
+    "Rep ": "Representative ",
+    "Res ": "Research ",
+    "Ret ": "Retirement ",
+    "Reu ": "REU ",
+    "Rna ": "RNA ",
+    "Rndmzd ": "Randomized ",
+    "Rsch ": "Research ",
+    "Saf ": "SAF ",
+    "Saf/eff ": "Safety and Efficacy ",
+    "Sbjcts ": "Subjects ",
+    "Sch ": "School ",
+    "Se ": "SE ",
+    "Ser ": "Service ",
+    "Sfwmd ": "SFWMD ",
+    "Sle ": "SLE ",
+    "Sntc ": "SNTC ",
+    "Soc ": "Society ",
+    "Spec ": "Specialist ",
+    "Spnsrd ": "Sponsored ",
+    "Spv ": "Supervisor ",
+    "Sr ": "Senior ",
+    "Stdy ": "Study ",
+    "Stratagies ": "Strategies ",
+    "Subj ": "Subject ",
+    "Supp ": "Support ",
+    "Supt ": "Superintendant ",
+    "Supv ": "Supervisor ",
+    "Svc ": "Services ",
+    "Svcs ": "Services ",
+    "Sw ": "SW ",
+    "Tch ": "Teaching ",
+    "Tech ": "Technician ",
+    "Technol ": "Technologist ",
+    "Teh ": "the ",
+    "The ": "the ",
+    "To ": "to ",
+    "Trls ": "Trials ",
+    "Trm ": "Term ",
+    "Tv ": "TV ",
+    "Uaa ": "UAA ",
+    "Uf ": "UF ",
+    "Ufrf ": "UFRF ",
+    "Uhf ": "UHF ",
+    "Univ ": "University ",
+    "Usa ": "USA ",
+    "Us ": "US ",
+    "Va ": "VA ",
+    "Vhf ": "VHF ",
+    "Vis ": "Visiting ",
+    "Vp ": "Vice President ",
+    "Wuft-Fm ": "WUFT-FM "
+})
+
+
 def improve_org_name(s):
     """
     Organization names are often abbreviated and sometime misspelled. Build a translation table here of
@@ -330,220 +689,6 @@ def improve_org_name(s):
     :return:
     :rtype: string
     """
-    abbrev_table = {
-        " & ": " and ",
-        "'S ": "'s ",
-        " A ": " a ",
-        "Aav ": "AAV ",
-        "Aca ": "Academy ",
-        "Acad ": "Academy ",
-        "Admn ": "Administration ",
-        "Adv ": "Advanced ",
-        "Advanc ": "Advanced ",
-        "Ag ": "Agriculture ",
-        "Agri ": "Agriculture ",
-        "Amer ": "American ",
-        "And ": "and ",
-        "Analysists ": "Analysts ",
-        "Asso ": "Association ",
-        "Assoc ": "Association ",
-        "At ": "at ",
-        "Bldg ": "Building ",
-        "Bpm ": "BPM ",
-        "Brcc ": "BRCC ",
-        "Childrens ": "Children's ",
-        "Clin ": "Clinical ",
-        "Clncl ": "Clinical ",
-        "Cms ": "CMS ",
-        "Cns ": "CNS ",
-        "Cncl ": "Council ",
-        "Cncr ": "Cancer ",
-        "Cnty ": "County ",
-        "Co ": "Company ",
-        "Cog ": "COG ",
-        "Col ": "College ",
-        "Coll ": "College ",
-        "Communic ": "Communications ",
-        "Compar ": "Compare ",
-        "Coo ": "Chief Operating Officer ",
-        "Corp ": "Corporation ",
-        "Cpb ": "CPB ",
-        "Crd ": "Coordinator ",
-        "Cse ": "CSE ",
-        "Ctr ": "Center ",
-        "Cty ": "County ",
-        "Cwp ": "CWP ",
-        "Dbs ": "DBS ",
-        "Dept ": "Department ",
-        "Dev ": "Development ",
-        "Devel ": "Development ",
-        "Dist ": "Distinguished ",
-        "Dna ": "DNA ",
-        "Doh ": "DOH ",
-        "Doh/cms ": "DOH/CMS ",
-        "Double Blinded ": "Double-blind ",
-        "Double-blinded ": "Double-blind ",
-        "Dpt-1 ": "DPT-1 ",
-        "Dtra0001 ": "DTRA0001 ",
-        "Dtra0016 ": "DTRA-0016 ",
-        "Edu ": "Education ",
-        "Educ ": "Education ",
-        "Eff/saf ": "Safety and Efficacy ",
-        "Eh&S ": "EH&S ",
-        "Emer ": "Emeritus ",
-        "Emin ": "Eminent ",
-        "Enforce ": "Enforcement ",
-        "Eng ": "Engineer ",
-        "Environ ": "Environmental ",
-        "Epr ": "EPR ",
-        "Eval ": "Evaluation ",
-        "Ext ": "Extension ",
-        "Fdot ": "FDOT ",
-        "Fdots ": "FDOT ",
-        "Fhtcc ": "FHTCC ",
-        "Finan ": "Financial ",
-        "Fl ": "Florida ",
-        "Fla ": "Florida ",
-        "Fllw ": "Follow ",
-        "Fndt ": "Foundation ",
-        "For ": "for ",
-        "Fou ": "Foundation ",
-        "G-csf ": "G-CSF ",
-        "Gen ": "General ",
-        "Gis ": "GIS ",
-        "Gm-csf ": "GM-CSF ",
-        "Grad ": "Graduate ",
-        "Hcv ": "HCV ",
-        "Hiv ": "HIV ",
-        "Hiv-infected ": "HIV-infected ",
-        "Hiv/aids ": "HIV/AIDS ",
-        "Hlb ": "HLB ",
-        "Hlth ": "Health ",
-        "Hosp ": "Hospital ",
-        "Hou ": "Housing ",
-        "Hsv-1 ": "HSV-1 ",
-        "I/ii ": "I/II ",
-        "I/ucrc ": "I/UCRC ",
-        "Ica ": "ICA ",
-        "Icd ": "ICD ",
-        "Ieee ": "IEEE ",
-        "Ifas ": "IFAS ",
-        "Igf-1 ": "IGF-1 ",
-        "Ii ": "II ",
-        "Ii/iii ": "II/III ",
-        "Iii ": "III ",
-        "In ": "in ",
-        "Info ": "Information ",
-        "Inst ": "Institute ",
-        "Intl ": "International ",
-        "Intervent ": "Intervention ",
-        "Ipa ": "IPA ",
-        "Ipm ": "IPM ",
-        "Ippd ": "IPPD ",
-        "Ips ": "IPS ",
-        "It ": "Information Technology ",
-        "Iv ": "IV ",
-        "Jnt ": "Joint ",
-        "Lng ": "Long ",
-        "Mccarty ": "McCarty ",
-        "Mgmt ": "Management ",
-        "Mgr ": "Manager ",
-        "Mgt ": "Management ",
-        "Mlti ": "Multi ",
-        "Mlti-ctr ": "Multicenter ",
-        "Mltictr ": "Multicenter ",
-        "Mri ": "MRI ",
-        "Mstr ": "Master ",
-        "Multi-center ": "Multicenter ",
-        "Multi-ctr ": "Multicenter ",
-        "Natl ": "National ",
-        "Nih ": "NIH ",
-        "Nmr ": "NMR ",
-        "Nsf ": "NSF ",
-        "Ne ": "NE ",
-        "Nw ": "NW ",
-        "Of ": "of ",
-        "On ": "on ",
-        "Or ": "or ",
-        "Open-labeled ": "Open-label ",
-        "Opn-lbl ": "Open-label ",
-        "Opr ": "Operator ",
-        "Org ": "Organization ",
-        "Pgm ": "Program ",
-        "Phas ": "Phased ",
-        "Php ": "PHP ",
-        "Phs ": "PHS ",
-        "Pk/pd ": "PK/PD ",
-        "Pky ": "P. K. Yonge ",
-        "Plcb-ctrl ": "Placebo-controlled ",
-        "Plcbo ": "Placebo ",
-        "Plcbo-ctrl ": "Placebo-controlled ",
-        "Postdoc ": "Postdoctoral ",
-        "Pract ": "Practitioner ",
-        "Pres5 ": "President 5 ",
-        "Pres6 ": "President 6 ",
-        "Prg ": "Programs ",
-        "Prof ": "Professor ",
-        "Prog ": "Programmer ",
-        "Progs ": "Programs ",
-        "Prov ": "Provisional ",
-        "Psr ": "PSR ",
-        "Radiol ": "Radiology ",
-        "Rcv ": "Receiving ",
-        "Rdmzd ": "Randomized ",
-        "Heat Refrig Air Con": "Heating, Refrigerating and Air-Conditioning Engineers",
-        "Rep ": "Representative ",
-        "Res ": "Research ",
-        "Ret ": "Retirement ",
-        "Reu ": "REU ",
-        "Rna ": "RNA ",
-        "Rndmzd ": "Randomized ",
-        "Rsch ": "Research ",
-        "Saf ": "SAF ",
-        "Saf/eff ": "Safety and Efficacy ",
-        "Sbjcts ": "Subjects ",
-        "Sch ": "School ",
-        "Se ": "SE ",
-        "Ser ": "Service ",
-        "Sfwmd ": "SFWMD ",
-        "Sle ": "SLE ",
-        "Sntc ": "SNTC ",
-        "Soc ": "Society ",
-        "Spec ": "Specialist ",
-        "Spnsrd ": "Sponsored ",
-        "Spv ": "Supervisor ",
-        "Sr ": "Senior ",
-        "Stdy ": "Study ",
-        "Stratagies ": "Strategies ",
-        "Subj ": "Subject ",
-        "Supp ": "Support ",
-        "Supt ": "Superintendant ",
-        "Supv ": "Supervisor ",
-        "Svc ": "Services ",
-        "Svcs ": "Services ",
-        "Sw ": "SW ",
-        "Tch ": "Teaching ",
-        "Tech ": "Technician ",
-        "Technol ": "Technologist ",
-        "Teh ": "the ",
-        "The ": "the ",
-        "To ": "to ",
-        "Trls ": "Trials ",
-        "Trm ": "Term ",
-        "Tv ": "TV ",
-        "Uaa ": "UAA ",
-        "Uf ": "UF ",
-        "Ufrf ": "UFRF ",
-        "Uhf ": "UHF ",
-        "Univ ": "University ",
-        "Usa ": "USA ",
-        "Us ": "US ",
-        "Va ": "VA ",
-        "Vhf ": "VHF ",
-        "Vis ": "Visiting ",
-        "Vp ": "Vice President ",
-        "Wuft-Fm ": "WUFT-FM "
-    }
     if s == "":
         return s
     if s[len(s) - 1] == ',':
@@ -560,8 +705,7 @@ def improve_org_name(s):
     t = t.replace(",", " !")
     t = t.replace(",", " !")  # might be two commas in input
 
-    for abbrev in abbrev_table:
-        t = t.replace(abbrev, abbrev_table[abbrev])
+    t = ORG_NAME_ABBREVIATIONS.expand(t)
 
     t = t.replace(" @", "/")  # restore /
     t = t.replace(" @", "/")
@@ -571,6 +715,222 @@ def improve_org_name(s):
     return t[0].upper() + t[1:]
 
 
+TITLE_ABBREVIATIONS = AbbreviationTable({
+    "'S ": "'s ",
+    "2-blnd ": "Double-blind ",
+    "2blnd ": "Double-blind ",
+    "A ": "a ",
+    "Aav ": "AAV ",
+    "Aca ": "Academic ",
+    "Acad ": "Academic ",
+    "Acp ": "ACP ",
+    "Acs ": "ACS ",
+    "Act ": "Acting ",
+    "Adj ": "Adjunct ",
+    "Adm ": "Administrator ",
+    "Admin ": "Administrative ",
+    "Adv ": "Advisory ",
+    "Advanc ": "Advanced ",
+    "Aff ": "Affiliate ",
+    "Affl ": "Affiliate ",
+    "Ahec ": "AHEC ",
+    "Aldh ": "ALDH ",
+    "Alk1 ": "ALK1 ",
+    "Alumn Aff ": "Alumni Affairs ",
+    "Amd3100 ": "AMD3100 ",
+    "And ": "and ",
+    "Aso ": "Associate ",
+    "Asoc ": "Associate ",
+    "Assoc ": "Associate ",
+    "Ast ": "Assistant ",
+    "Ast #G ": "Grading Assistant ",
+    "Ast #R ": "Research Assistant ",
+    "Ast #T ": "Teaching Assistant ",
+    "At ": "at ",
+    "Bldg ": "Building ",
+    "Bpm ": "BPM ",
+    "Brcc ": "BRCC ",
+    "Cfo ": "Chief Financial Officer ",
+    "Cio ": "Chief Information Officer ",
+    "Clin ": "Clinical ",
+    "Clncl ": "Clinical ",
+    "Cms ": "CMS ",
+    "Cns ": "CNS ",
+    "Cncr ": "Cancer ",
+    "Co ": "Courtesy ",
+    "Cog ": "COG ",
+    "Communic ": "Communications ",
+    "Compar ": "Compare ",
+    "Coo ": "Chief Operating Officer ",
+    "Copd ": "COPD ",
+    "Cpb ": "CPB ",
+    "Crd ": "Coordinator ",
+    "Cse ": "CSE ",
+    "Ctr ": "Center ",
+    "Cty ": "County ",
+    "Cwp ": "CWP ",
+    "Dbl-bl ": "Double-blind ",
+    "Dbl-blnd ": "Double-blind ",
+    "Dbs ": "DBS ",
+    "Dev ": "Development ",
+    "Devel ": "Development ",
+    "Dist ": "Distinguished ",
+    "Dna ": "DNA ",
+    "Doh ": "DOH ",
+    "Doh/cms ": "DOH/CMS ",
+    "Double Blinded ": "Double-blind ",
+    "Double-blinded ": "Double-blind ",
+    "Dpt-1 ": "DPT-1 ",
+    "Dtra0001 ": "DTRA0001 ",
+    "Dtra0016 ": "DTRA-0016 ",
+    "Educ ": "Education ",
+    "Eff/saf ": "Safety and Efficacy ",
+    "Eh&S ": "EH&S ",
+    "Emer ": "Emeritus ",
+    "Emin ": "Eminent ",
+    "Enforce ": "Enforcement ",
+    "Eng ": "Engineer ",
+    "Environ ": "Environmental ",
+    "Epr ": "EPR ",
+    "Eval ": "Evaluation ",
+    "Ext ": "Extension ",
+    "Fdot ": "FDOT ",
+    "Fdots ": "FDOT ",
+    "Fhtcc ": "FHTCC ",
+    "Finan ": "Financial ",
+    "Fla ": "Florida ",
+    "Fllw ": "Follow ",
+    "For ": "for ",
+    "G-csf ": "G-CSF ",
+    "Gen ": "General ",
+    "Gis ": "GIS ",
+    "Gm-csf ": "GM-CSF ",
+    "Grad ": "Graduate ",
+    "Hcv ": "HCV ",
+    "Hiv ": "HIV ",
+    "Hiv-infected ": "HIV-infected ",
+    "Hiv/aids ": "HIV/AIDS ",
+    "Hlb ": "HLB ",
+    "Hlth ": "Health ",
+    "Hou ": "Housing ",
+    "Hsv-1 ": "HSV-1 ",
+    "I/ii ": "I/II ",
+    "I/ucrc ": "I/UCRC ",
+    "Ica ": "ICA ",
+    "Icd ": "ICD ",
+    "Ieee ": "IEEE ",
+    "Ifas ": "IFAS ",
+    "Igf-1 ": "IGF-1 ",
+    "Ii ": "II ",
+    "Ii/iii ": "II/III ",
+    "Iii ": "III ",
+    "In ": "in ",
+    "Info ": "Information ",
+    "Inter-vention ": "Intervention ",
+    "Ipa ": "IPA ",
+    "Ipm ": "IPM ",
+    "Ippd ": "IPPD ",
+    "Ips ": "IPS ",
+    "It ": "Information Technology ",
+    "Iv ": "IV ",
+    "Jnt ": "Joint ",
+    "Lng ": "Long ",
+    "Mccarty ": "McCarty ",
+    "Mgmt ": "Management ",
+    "Mgr ": "Manager ",
+    "Mgt ": "Management ",
+    "Mlti ": "Multi ",
+    "Mlti-ctr ": "Multicenter ",
+    "Mltictr ": "Multicenter ",
+    "Mri ": "MRI ",
+    "Mstr ": "Master ",
+    "Multi-center ": "Multicenter ",
+    "Multi-ctr ": "Multicenter ",
+    "Nih ": "NIH ",
+    "Nmr ": "NMR ",
+    "Nsf ": "NSF ",
+    "Ne ": "NE ",
+    "Nw ": "NW ",
+    "Of ": "of ",
+    "On ": "on ",
+    "Or ": "or ",
+    "Open-labeled ": "Open-label ",
+    "Opn-lbl ": "Open-label ",
+    "Opr ": "Operator ",
+    "Phas ": "Phased ",
+    "Php ": "PHP ",
+    "Phs ": "PHS ",
+    "Pk/pd ": "PK/PD ",
+    "Pky ": "P. K. Yonge ",
+    "Plcb-ctrl ": "Placebo-controlled ",
+    "Plcbo ": "Placebo ",
+    "Plcbo-ctrl ": "Placebo-controlled ",
+    "Postdoc ": "Postdoctoral ",
+    "Pract ": "Practitioner ",
+    "Pres5 ": "President 5 ",
+    "Pres6 ": "President 6 ",
+    "Prg ": "Programs ",
+    "Prof ": "Professor ",
+    "Prog ": "Programmer ",
+    "Progs ": "Programs ",
+    "Prov ": "Provisional ",
+    "Psr ": "PSR ",
+    "Radiol ": "Radiology ",
+    "Rcv ": "Receiving ",
+    "Rdmzd ": "Randomized ",
+    "Rep ": "Representative ",
+    "Res ": "Research ",
+    "Ret ": "Retirement ",
+    "Reu ": "REU ",
+    "Rna ": "RNA ",
+    "Rndmzd ": "Randomized ",
+    "Roc-124 ": "ROC-124 ",
+    "Rsch ": "Research ",
+    "Saf ": "SAF ",
+    "Saf/eff ": "Safety and Efficacy ",
+    "Sbjcts ": "Subjects ",
+    "Sch ": "School ",
+    "Se ": "SE ",
+    "Ser ": "Service ",
+    "Sfwmd ": "SFWMD ",
+    "Sle ": "SLE ",
+    "Sntc ": "SNTC ",
+    "Spec ": "Specialist ",
+    "Spnsrd ": "Sponsored ",
+    "Spv ": "Supervisor ",
+    "Sr ": "Senior ",
+    "Stdy ": "Study ",
+    "Subj ": "Subject ",
+    "Supp ": "Support ",
+    "Supt ": "Superintendant ",
+    "Supv ": "Supervisor ",
+    "Svc ": "Services ",
+    "Svcs ": "Services ",
+    "Sw ": "SW ",
+    "Tch ": "Teaching ",
+    "Tech ": "Technician ",
+    "Technol ": "Technologist ",
+    "Teh ": "the ",
+    "The ": "the ",
+    "To ": "to ",
+    "Trls ": "Trials ",
+    "Trm ": "Term ",
+    "Tv ": "TV ",
+    "Uaa ": "UAA ",
+    "Uf ": "UF ",
+    "Ufrf ": "UFRF ",
+    "Uhf ": "UHF ",
+    "Univ ": "University ",
+    "Us ": "US ",
+    "Usa ": "USA ",
+    "Va ": "VA ",
+    "Vhf ": "VHF ",
+    "Vis ": "Visiting ",
+    "Vp ": "Vice President ",
+    "Wuft-Fm ": "WUFT-FM "
+})
+
+
 def improve_title(s):
     """
     DSP, HR, funding agencies and others use a series of abbreviations to fit grant titles into limited text
@@ -580,220 +940,6 @@ def improve_title(s):
     :return:
     :rtype: basestring
     """
-    abbrev_table = {
-        "'S ": "'s ",
-        "2-blnd ": "Double-blind ",
-        "2blnd ": "Double-blind ",
-        "A ": "a ",
-        "Aav ": "AAV ",
-        "Aca ": "Academic ",
-        "Acad ": "Academic ",
-        "Acp ": "ACP ",
-        "Acs ": "ACS ",
-        "Act ": "Acting ",
-        "Adj ": "Adjunct ",
-        "Adm ": "Administrator ",
-        "Admin ": "Administrative ",
-        "Adv ": "Advisory ",
-        "Advanc ": "Advanced ",
-        "Aff ": "Affiliate ",
-        "Affl ": "Affiliate ",
-        "Ahec ": "AHEC ",
-        "Aldh ": "ALDH ",
-        "Alk1 ": "ALK1 ",
-        "Alumn Aff ": "Alumni Affairs ",
-        "Amd3100 ": "AMD3100 ",
-        "And ": "and ",
-        "Aso ": "Associate ",
-        "Asoc ": "Associate ",
-        "Assoc ": "Associate ",
-        "Ast ": "Assistant ",
-        "Ast #G ": "Grading Assistant ",
-        "Ast #R ": "Research Assistant ",
-        "Ast #T ": "Teaching Assistant ",
-        "At ": "at ",
-        "Bldg ": "Building ",
-        "Bpm ": "BPM ",
-        "Brcc ": "BRCC ",
-        "Cfo ": "Chief Financial Officer ",
-        "Cio ": "Chief Information Officer ",
-        "Clin ": "Clinical ",
-        "Clncl ": "Clinical ",
-        "Cms ": "CMS ",
-        "Cns ": "CNS ",
-        "Cncr ": "Cancer ",
-        "Co ": "Courtesy ",
-        "Cog ": "COG ",
-        "Communic ": "Communications ",
-        "Compar ": "Compare ",
-        "Coo ": "Chief Operating Officer ",
-        "Copd ": "COPD ",
-        "Cpb ": "CPB ",
-        "Crd ": "Coordinator ",
-        "Cse ": "CSE ",
-        "Ctr ": "Center ",
-        "Cty ": "County ",
-        "Cwp ": "CWP ",
-        "Dbl-bl ": "Double-blind ",
-        "Dbl-blnd ": "Double-blind ",
-        "Dbs ": "DBS ",
-        "Dev ": "Development ",
-        "Devel ": "Development ",
-        "Dist ": "Distinguished ",
-        "Dna ": "DNA ",
-        "Doh ": "DOH ",
-        "Doh/cms ": "DOH/CMS ",
-        "Double Blinded ": "Double-blind ",
-        "Double-blinded ": "Double-blind ",
-        "Dpt-1 ": "DPT-1 ",
-        "Dtra0001 ": "DTRA0001 ",
-        "Dtra0016 ": "DTRA-0016 ",
-        "Educ ": "Education ",
-        "Eff/saf ": "Safety and Efficacy ",
-        "Eh&S ": "EH&S ",
-        "Emer ": "Emeritus ",
-        "Emin ": "Eminent ",
-        "Enforce ": "Enforcement ",
-        "Eng ": "Engineer ",
-        "Environ ": "Environmental ",
-        "Epr ": "EPR ",
-        "Eval ": "Evaluation ",
-        "Ext ": "Extension ",
-        "Fdot ": "FDOT ",
-        "Fdots ": "FDOT ",
-        "Fhtcc ": "FHTCC ",
-        "Finan ": "Financial ",
-        "Fla ": "Florida ",
-        "Fllw ": "Follow ",
-        "For ": "for ",
-        "G-csf ": "G-CSF ",
-        "Gen ": "General ",
-        "Gis ": "GIS ",
-        "Gm-csf ": "GM-CSF ",
-        "Grad ": "Graduate ",
-        "Hcv ": "HCV ",
-        "Hiv ": "HIV ",
-        "Hiv-infected ": "HIV-infected ",
-        "Hiv/aids ": "HIV/AIDS ",
-        "Hlb ": "HLB ",
-        "Hlth ": "Health ",
-        "Hou ": "Housing ",
-        "Hsv-1 ": "HSV-1 ",
-        "I/ii ": "I/II ",
-        "I/ucrc ": "I/UCRC ",
-        "Ica ": "ICA ",
-        "Icd ": "ICD ",
-        "Ieee ": "IEEE ",
-        "Ifas ": "IFAS ",
-        "Igf-1 ": "IGF-1 ",
-        "Ii ": "II ",
-        "Ii/iii ": "II/III ",
-        "Iii ": "III ",
-        "In ": "in ",
-        "Info ": "Information ",
-        "Inter-vention ": "Intervention ",
-        "Ipa ": "IPA ",
-        "Ipm ": "IPM ",
-        "Ippd ": "IPPD ",
-        "Ips ": "IPS ",
-        "It ": "Information Technology ",
-        "Iv ": "IV ",
-        "Jnt ": "Joint ",
-        "Lng ": "Long ",
-        "Mccarty ": "McCarty ",
-        "Mgmt ": "Management ",
-        "Mgr ": "Manager ",
-        "Mgt ": "Management ",
-        "Mlti ": "Multi ",
-        "Mlti-ctr ": "Multicenter ",
-        "Mltictr ": "Multicenter ",
-        "Mri ": "MRI ",
-        "Mstr ": "Master ",
-        "Multi-center ": "Multicenter ",
-        "Multi-ctr ": "Multicenter ",
-        "Nih ": "NIH ",
-        "Nmr ": "NMR ",
-        "Nsf ": "NSF ",
-        "Ne ": "NE ",
-        "Nw ": "NW ",
-        "Of ": "of ",
-        "On ": "on ",
-        "Or ": "or ",
-        "Open-labeled ": "Open-label ",
-        "Opn-lbl ": "Open-label ",
-        "Opr ": "Operator ",
-        "Phas ": "Phased ",
-        "Php ": "PHP ",
-        "Phs ": "PHS ",
-        "Pk/pd ": "PK/PD ",
-        "Pky ": "P. K. Yonge ",
-        "Plcb-ctrl ": "Placebo-controlled ",
-        "Plcbo ": "Placebo ",
-        "Plcbo-ctrl ": "Placebo-controlled ",
-        "Postdoc ": "Postdoctoral ",
-        "Pract ": "Practitioner ",
-        "Pres5 ": "President 5 ",
-        "Pres6 ": "President 6 ",
-        "Prg ": "Programs ",
-        "Prof ": "Professor ",
-        "Prog ": "Programmer ",
-        "Progs ": "Programs ",
-        "Prov ": "Provisional ",
-        "Psr ": "PSR ",
-        "Radiol ": "Radiology ",
-        "Rcv ": "Receiving ",
-        "Rdmzd ": "Randomized ",
-        "Rep ": "Representative ",
-        "Res ": "Research ",
-        "Ret ": "Retirement ",
-        "Reu ": "REU ",
-        "Rna ": "RNA ",
-        "Rndmzd ": "Randomized ",
-        "Roc-124 ": "ROC-124 ",
-        "Rsch ": "Research ",
-        "Saf ": "SAF ",
-        "Saf/eff ": "Safety and Efficacy ",
-        "Sbjcts ": "Subjects ",
-        "Sch ": "School ",
-        "Se ": "SE ",
-        "Ser ": "Service ",
-        "Sfwmd ": "SFWMD ",
-        "Sle ": "SLE ",
-        "Sntc ": "SNTC ",
-        "Spec ": "Specialist ",
-        "Spnsrd ": "Sponsored ",
-        "Spv ": "Supervisor ",
-        "Sr ": "Senior ",
-        "Stdy ": "Study ",
-        "Subj ": "Subject ",
-        "Supp ": "Support ",
-        "Supt ": "Superintendant ",
-        "Supv ": "Supervisor ",
-        "Svc ": "Services ",
-        "Svcs ": "Services ",
-        "Sw ": "SW ",
-        "Tch ": "Teaching ",
-        "Tech ": "Technician ",
-        "Technol ": "Technologist ",
-        "Teh ": "the ",
-        "The ": "the ",
-        "To ": "to ",
-        "Trls ": "Trials ",
-        "Trm ": "Term ",
-        "Tv ": "TV ",
-        "Uaa ": "UAA ",
-        "Uf ": "UF ",
-        "Ufrf ": "UFRF ",
-        "Uhf ": "UHF ",
-        "Univ ": "University ",
-        "Us ": "US ",
-        "Usa ": "USA ",
-        "Va ": "VA ",
-        "Vhf ": "VHF ",
-        "Vis ": "Visiting ",
-        "Vp ": "Vice President ",
-        "Wuft-Fm ": "WUFT-FM "
-    }
     if s == "":
         return s
     if s[len(s) - 1] == ',':
@@ -810,8 +956,7 @@ def improve_title(s):
     t = t.replace(",", " !")
     t = t.replace(",", " !")  # might be two commas in input
 
-    for abbrev in abbrev_table:
-        t = t.replace(abbrev, abbrev_table[abbrev])
+    t = TITLE_ABBREVIATIONS.expand(t)
 
     t = t.replace(" @", "/")  # restore /
     t = t.replace(" @", "/")
@@ -827,8 +972,6 @@ def improve_dollar_amount(s):
     :param s: the string to be improved
     :return: the improved string
     """
-    import re
-    pattern = re.compile('[0-9]*[0-9]\.[0-9][0-9]')
     s = s.replace(' ', '')
     s = s.replace('$', '')
     s = s.replace(',', '')
@@ -836,7 +979,7 @@ def improve_dollar_amount(s):
         s += '.00'
     if s[0] == '.':
         s = '0' + s
-    m = pattern.match(s)
+    m = DOLLAR_AMOUNT_PATTERN.match(s)
     if not m:
         raise InvalidDataException(s + ' not a valid dollar amount')
     return s
@@ -850,26 +993,16 @@ def improve_date(s):
     :return: improved date string
     :rtype: string
     """
-    import re
-    from datetime import date
-
-    month_words = {
-        'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6, 'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11,
-        'dec': 12, 'january': 1, 'february': 2, 'march': 3, 'april': 4, 'june': 6, 'july': 7, 'august': 8,
-        'september': 9, 'october': 10, 'november': 11, 'december': 12
-    }
-    all_numbers = re.compile('([0-9]+)[-/, ]([0-9]+)[-/, ]([0-9]+)')
-    middle_word = re.compile('([0-9]+)[-/, ]([a-zA-Z]+)[-,/ ]([0-9]+)')
-    match_object = all_numbers.match(s)
+    match_object = DATE_NUMBERS_PATTERN.match(s)
     if match_object:
         y = int(match_object.group(1))
         m = int(match_object.group(2))
         d = int(match_object.group(3))
     else:
-        match_object = middle_word.match(s)
+        match_object = DATE_MONTH_WORD_PATTERN.match(s)
         if match_object:
             y = int(match_object.group(1))
-            m = month_words.get(match_object.group(2).lower(), None)
+            m = MONTH_WORDS.get(match_object.group(2).lower(), None)
             if m is None:
                 raise InvalidDataException(s + ' is not a valid date')
             d = int(match_object.group(3))
@@ -889,9 +1022,7 @@ def improve_deptid(s):
     :return: string improved deptid
     :rtype: string
     """
-    import re
-    deptid_pattern = re.compile('([0-9]{1,8})')
-    match_object = deptid_pattern.match(s)
+    match_object = DEPTID_PATTERN.match(s)
     if match_object:
         return match_object.group(1).rjust(8, '0')
     else:
@@ -918,47 +1049,123 @@ def improve_sponsor_award_id(s):
     :return: string improved sponsor award id
     :rtype: string
     """
-    import re
     s = s.strip()
-    nih_pattern = re.compile('.*([A-Za-z][0-9][0-9]).*([A-Za-z][A-Za-z][0-9]{6})')
-    match_object = nih_pattern.match(s)
+    match_object = NIH_AWARD_PATTERN.match(s)
     if match_object:
         return match_object.group(1).upper() + match_object.group(2).upper()
     else:
         return s
 
 
+class LruCache(object):
+    """
+    A dictionary of at most size entries.  When full, the least recently used entry is removed to make room
+    """
+
+    def __init__(self, size=DEFAULT_IMPROVE_CACHE_SIZE):
+        """
+        :param size: maximum number of entries
+        """
+        self.size = size
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        """
+        :return: the value of the key, or default if the key is not in the cache.  The key becomes most recently used
+        """
+        if key not in self.entries:
+            return default
+        value = self.entries.pop(key)
+        self.entries[key] = value
+        return value
+
+    def put(self, key, value):
+        """
+        Add or replace the value of a key, removing the least recently used entry if the cache is full
+        :return: None
+        """
+        if key in self.entries:
+            del self.entries[key]
+        elif len(self.entries) >= self.size:
+            self.entries.popitem(last=False)
+        self.entries[key] = value
+
+    def clear(self):
+        """
+        Remove all entries
+        :return: None
+        """
+        self.entries.clear()
+
+
+# Improve functions by name, for improve
+
+IMPROVE_FUNCTIONS = {
+    'improve_email': improve_email,
+    'improve_phone_number': improve_phone_number,
+    'improve_course_title': improve_course_title,
+    'improve_jobcode_description': improve_jobcode_description,
+    'improve_org_name': improve_org_name,
+    'improve_title': improve_title,
+    'improve_dollar_amount': improve_dollar_amount,
+    'improve_date': improve_date,
+    'improve_deptid': improve_deptid,
+    'improve_display_name': improve_display_name,
+    'improve_sponsor_award_id': improve_sponsor_award_id
+}
+
+_improve_caches = {}  # LruCache of improved text by improve function name
+
+
+def register_improve(improve_name, improve_function):
+    """
+    Add an improve function to the functions available by name to improve, or replace one
+    :param improve_name: name of the improve function, as used in update_def filters
+    :param improve_function: function of one string returning the improved string
+    :return: None
+    """
+    IMPROVE_FUNCTIONS[improve_name] = improve_function
+    _improve_caches.pop(improve_name, None)
+
+
 def improve(improve_name, improve_text):
     """
     Given the name of an improve function and the text to be improved, call the function on the text and
-    return the result.
+    return the result.  Improved text is remembered for each function, so text seen before is not improved again.
 
     This function is provided in lieu of using an eval
     :param improve_name: name of improve function
     :param improve_text: text to be improved
     :return:  improved text
     """
-    if improve_name == 'improve_email':
-        return improve_email(improve_text)
-    elif improve_name == 'improve_phone_number':
-        return improve_phone_number(improve_text)
-    elif improve_name == 'improve_course_title':
-        return improve_course_title(improve_text)
-    elif improve_name == 'improve_jobcode_description':
-        return improve_jobcode_description(improve_text)
-    elif improve_name == 'improve_org_name':
-        return improve_org_name(improve_text)
-    elif improve_name == 'improve_title':
-        return improve_title(improve_text)
-    elif improve_name == 'improve_dollar_amount':
-        return improve_dollar_amount(improve_text)
-    elif improve_name == 'improve_date':
-        return improve_date(improve_text)
-    elif improve_name == 'improve_deptid':
-        return improve_deptid(improve_text)
-    elif improve_name == 'improve_display_name':
-        return improve_display_name(improve_text)
-    elif improve_name == 'improve_sponsor_award_id':
-        return improve_sponsor_award_id(improve_text)
-    else:
-        raise FilterNotFoundException(improve_name)
+    cache = _improve_caches.get(improve_name)
+    if cache is None:
+        if improve_name not in IMPROVE_FUNCTIONS:
+            raise FilterNotFoundException(improve_name)
+        cache = _improve_caches[improve_name] = LruCache()
+    improved_text = cache.get(improve_text)
+    if improved_text is None:
+        improved_text = IMPROVE_FUNCTIONS[improve_name](improve_text)
+        cache.put(improve_text, improved_text)
+    return improved_text
+
+
+def improve_many(improve_name, values):
+    """
+    Given the name of an improve function and a sequence of text values, return the improved values in the same
+    order.  Each distinct value is improved once
+    :param improve_name: name of improve function
+    :param values: sequence of text to be improved
+    :return: list of improved text
+    """
+    improved = {}
+    for value in values:
+        if value not in improved:
+            improved[value] = improve(improve_name, value)
+    return [improved[value] for value in values]
@@ -7,6 +7,9 @@
 
 import logging
 import httplib
+import shelve
+import threading
+import time
 
 __author__ = "Michael Conlon"
 __copyright__ = "Copyright (c) 2016 Michael Conlon"
@@ -22,6 +25,180 @@ logger = logging.getLogger(__name__)
 HOST = "profiles.catalyst.harvard.edu"
 API_URL = "/services/GETPMIDs/default.asp"
 
+#   Entrez E-utilities access.  NCBI allows three requests a second, ten with an API key
+
+EUTILS_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
+ENTREZ_EMAIL = "mconlon@ufl.edu"
+ENTREZ_TOOL = "vivo-pump"
+ENTREZ_RATE = 3.0
+
+# Number of PubMed IDs in each efetch and esearch request
+
+ENTREZ_BATCH_SIZE = 200
+
+# Retries of a failed Entrez request, and the longest wait between retries in seconds
+
+ENTREZ_RETRIES = 5
+ENTREZ_MAX_SLEEP = 60.0
+
+
+class TokenBucket(object):
+    """
+    Limit the rate of requests.  The bucket holds up to capacity tokens and gains rate tokens a second.  Each
+    request takes a token, waiting for one when the bucket is empty.  The bucket may be shared by threads.
+    """
+    def __init__(self, rate=ENTREZ_RATE, capacity=1):
+        self.rate = float(rate)
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """
+        Take a token, waiting until one is available
+        :return: the seconds waited
+        """
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class EntrezFetcher(object):
+    """
+    Fetch PubMed records from Entrez in batches of batch_size PubMed IDs.  Each record is cached with the date it
+    was fetched.  A cached record is fetched again only when an Entrez search by modification date finds the
+    paper changed since that date, so a second run fetches only new and changed papers.  The cache is a shelve
+    file, or a dictionary if no file is given.  A record is checked at most once by a fetcher.  Each record is kept
+    as a PubmedArticleSet document of the one article, with the XML declaration and DOCTYPE of the efetch result
+    it came from, so it is parsed with the DTD PubMed used for it.
+    """
+    def __init__(self, cache_file=None, eutils_url=EUTILS_URL, batch_size=ENTREZ_BATCH_SIZE, rate=ENTREZ_RATE,
+                 api_key=None, email=ENTREZ_EMAIL):
+        self.cache_file = cache_file
+        self.cache = {} if cache_file is None else shelve.open(cache_file)
+        self.eutils_url = eutils_url
+        self.batch_size = batch_size
+        self.bucket = TokenBucket(rate)
+        self.api_key = api_key
+        self.email = email
+        self.checked = set()
+
+    def close(self):
+        if isinstance(self.cache, shelve.Shelf):
+            self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def fetch(self, pmids):
+        """
+        Fetch the records of the pmids that are not cached or have changed since they were cached
+        :param pmids: list of PubMed IDs
+        :return: dictionary of the XML document of the PubmedArticle of each pmid found in PubMed, keyed by pmid
+        """
+        from datetime import date
+        pmids = [str(pmid) for pmid in pmids]
+        unchecked = sorted(set(pmids) - self.checked)
+        cached = [pmid for pmid in unchecked if pmid in self.cache]
+        wanted = [pmid for pmid in unchecked if pmid not in self.cache] + self.get_modified(cached)
+        today = date.today().strftime('%Y/%m/%d')
+        for batch in self._batches(wanted):
+            for pmid, article in self.efetch(batch).items():
+                self.cache[pmid] = (today, article)
+        self.checked.update(unchecked)
+        return dict((pmid, self.cache[pmid][1]) for pmid in pmids if pmid in self.cache)
+
+    def get_modified(self, pmids):
+        """
+        Search Entrez for the cached pmids modified since they were fetched.  The pmids are searched in batches
+        in order of the date they were fetched, each batch from the earliest date in the batch
+        :return: list of the modified pmids
+        """
+        from xml.etree import cElementTree as ElementTree
+        pmids = sorted(pmids, key=lambda pmid: self.cache[pmid][0])
+        modified = []
+        for batch in self._batches(pmids):
+            data = self._post('esearch.fcgi', [('term', ' OR '.join(pmid + '[uid]' for pmid in batch)),
+                                               ('datetype', 'mdat'), ('mindate', self.cache[batch[0]][0]),
+                                               ('maxdate', '3000/12/31'), ('retmax', str(len(batch)))])
+            found = set(node.text for node in ElementTree.fromstring(data).findall('IdList/Id'))
+            modified += [pmid for pmid in batch if pmid in found]
+        return modified
+
+    def efetch(self, pmids):
+        """
+        Fetch the records of pmids in one efetch request
+        :return: dictionary of the XML document of each PubmedArticle, keyed by pmid.  Each document has the XML
+            declaration and DOCTYPE of the efetch result
+        """
+        from xml.etree import cElementTree as ElementTree
+        data = self._post('efetch.fcgi', [('id', ','.join(pmids)), ('retmode', 'xml')])
+        prolog = data[:max(data.find('<PubmedArticleSet'), 0)]
+        articles = {}
+        for article in ElementTree.fromstring(data).findall('PubmedArticle'):
+            article.tail = None
+            articles[article.findtext('MedlineCitation/PMID')] = prolog + '<PubmedArticleSet>' + \
+                ElementTree.tostring(article) + '</PubmedArticleSet>\n'
+        return articles
+
+    def _batches(self, pmids):
+        return [pmids[i:i + self.batch_size] for i in range(0, len(pmids), self.batch_size)]
+
+    def _post(self, utility, fields):
+        """
+        POST a request to an Entrez utility, waiting for the token bucket.  Connection errors, server errors and
+        rate limit responses are retried with exponential backoff
+        :return: the response body
+        """
+        from pump.vivopump import get_query_pool
+        fields = [('db', 'pubmed'), ('tool', ENTREZ_TOOL), ('email', self.email)] + fields
+        if self.api_key is not None:
+            fields.append(('api_key', self.api_key))
+        count = 0
+        while True:
+            self.bucket.take()
+            try:
+                [status, reason, data] = get_query_pool().post(self.eutils_url + utility, fields, accept='text/xml')
+            except IOError as error:
+                status, reason = None, error
+            if status == 200:
+                return data
+            count += 1
+            if (status is not None and status != 429 and status < 500) or count > ENTREZ_RETRIES:
+                raise IOError("Entrez {} failed: {} {}".format(utility, status, reason))
+            sleep_seconds = min(2.0 ** count, ENTREZ_MAX_SLEEP)
+            logger.warning(u"Entrez {} failed: {} {}.  Retry {} in {} seconds".format(utility, status, reason,
+                                                                                      count, sleep_seconds))
+            time.sleep(sleep_seconds)
+
+
+_entrez_fetcher = EntrezFetcher()
+
+
+def get_entrez_fetcher(cache_file=None):
+    """
+    Return the fetcher shared by the PubMed functions in this process.  Its records are cached in memory unless a
+    cache_file is given.  With a cache_file, the shared fetcher caches its records in that shelve file, so a later
+    run fetches only new and changed papers.  The file is closed when the process exits
+    """
+    import atexit
+    global _entrez_fetcher
+    if cache_file is not None and cache_file != _entrez_fetcher.cache_file:
+        _entrez_fetcher.close()
+        _entrez_fetcher = EntrezFetcher(cache_file)
+        atexit.register(_entrez_fetcher.close)
+    return _entrez_fetcher
+
 
 def get_person_catalyst_pmids(uri, query_parms):
     """
@@ -139,40 +316,53 @@ def get_catalyst_pmids_xml(first, middle, last, email, affiliation=None):
     return result
 
 
-def get_pubmed_entrez(pmid):
+def parse_pubmed_records(articles):
     """
-    Given a PubMed ID, return the current the paper metadata from PubMed as an Entrez result set
+    Given the XML documents of PubmedArticles, return the Entrez records of the articles
+    :param articles: list of PubmedArticle XML documents, as returned by EntrezFetcher.fetch
+    :return: generator of Entrez records
     """
     from Bio import Entrez
-    import time
-    Entrez.email = 'mconlon@ufl.edu'
+    from StringIO import StringIO
+    for article in articles:
+        for record in Entrez.parse(StringIO(article)):
+            yield record
 
-    # Get record(s) from Entrez.  Retry if Entrez does not respond
 
-    start = 2.0
-    retries = 10
-    count = 0
-    while True:
-        try:
-            handle = Entrez.efetch(db="pubmed", id=pmid, retmode="xml")
-            records = Entrez.parse(handle)
-            break
-        except:
-            count += 1
-            if count > retries:
-                return {}
-            sleep_seconds = start**count
-            print "<!-- Failed Entrez query. Count = " + str(count)+ \
-                " Will sleep now for " + str(sleep_seconds)+ \
-                " seconds and retry -->"
-            time.sleep(sleep_seconds)  # increase the wait time with each retry
-    return records
+def get_pubmed_entrez(pmid, fetcher=None):
+    """
+    Given a PubMed ID, return the current the paper metadata from PubMed as an Entrez result set
+    :param fetcher: optional EntrezFetcher.  The shared fetcher is used if none is given
+    """
+    from Bio import Entrez  # the records are parsed by Entrez.  Fail before fetching if it is not installed
+    if fetcher is None:
+        fetcher = get_entrez_fetcher()
+    try:
+        articles = fetcher.fetch([pmid])
+    except IOError as error:
+        logger.error(u"Failed Entrez fetch of {}: {}".format(pmid, error))
+        return {}
+    return parse_pubmed_records(articles.values())
+
+
+def get_pubmed_papers(pmids, fetcher=None, cache_file=None):
+    """
+    Given a list of PubMed IDs, fetch the papers in batches and return the simplified structure of each
+    :param cache_file: optional shelve file of the shared fetcher, when no fetcher is given
+    :return: dictionary of papers keyed by pmid
+    @see get_pubmed_paper
+    """
+    if fetcher is None:
+        fetcher = get_entrez_fetcher(cache_file)
+    fetcher.fetch(pmids)
+    return dict((pmid, get_pubmed_paper(pmid, fetcher)) for pmid in pmids)
 
 
-def get_pubmed_paper(pmid):
+def get_pubmed_paper(pmid, fetcher=None):
     """
     Given an Entrez structure, return a simplified struture with attributes useful for VIVO
     :param pmid:
+    :param fetcher: optional EntrezFetcher
     :return: paper
     """
 
@@ -188,7 +378,7 @@ def get_pubmed_paper(pmid):
 
     # Find the desired attributes in the record structures returned by Entrez
 
-    for record in get_pubmed_entrez(pmid):
+    for record in get_pubmed_entrez(pmid, fetcher):
         print "Entrez record:", dumps(record, indent=4)
         article_id_list = record['PubmedData']['ArticleIdList']
         for article_id in article_id_list:
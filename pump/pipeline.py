@@ -0,0 +1,290 @@
+#!/usr/bin/env/python
+
+"""
+    pipeline.py: Run a chain of filters in one process
+
+    Filters prepare source data for the pump.  Each filter is a python script that reads a spreadsheet on stdin
+    and writes a spreadsheet on stdout, so filters can be chained in a shell pipeline.  Each filter in a shell
+    pipeline parses and writes the whole spreadsheet again.
+
+    The pipeline loads the filters and passes the data from one filter to the next in memory.  Each filter script
+    defines one of:
+
+        filter_row(row, parms) -- return the row, a dictionary of values keyed by column name, after filtering,
+            or None to remove the row.  Each row is filtered independently of the others
+        filter_data(data, parms) -- return the data, a dictionary of rows keyed by row number, after filtering
+
+    and may define:
+
+        counts -- an OrderedDict of counts by label, such as the number of rows removed, that the filter adds to.
+            The counts are written to stderr when the filter finishes
+        close() -- release the resources of the filter, such as open shelves, when the filter finishes
+
+    parms are the parms of get_parms, read once for the pipeline.  Consecutive row filters are run together, a row
+    at a time.  Row filters can be run in worker processes.  Each worker loads the filter scripts for itself, so
+    filters do not share open files across processes.
+
+    Usage: cat position_data.csv | python -m pump.pipeline -p 4 salary_plan_filter.py privacy_filter.py ...
+"""
+
+from __future__ import absolute_import
+
+import imp
+import logging
+import os
+import sys
+from multiprocessing import Pool
+from multiprocessing.util import Finalize
+
+from pump.vivopump import get_parms, read_csv_fp, write_csv_fp, iter_csv_fp, CsvRowWriter, PumpTable
+
+__author__ = "Michael Conlon"
+__copyright__ = "Copyright (c) 2016 Michael Conlon"
+__license__ = "New BSD License"
+__version__ = "0.1"
+
+logger = logging.getLogger(__name__)
+
+# Number of rows sent to a worker process at a time
+
+DEFAULT_ROWS_PER_TASK = 1000
+
+_worker_filters = []  # filters loaded by a worker process
+
+
+class Filter(object):
+    """
+    A filter loaded from a filter script
+    """
+
+    def __init__(self, path):
+        """
+        :param path: path of the filter script
+        """
+        self.path = path
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        module = imp.load_source('pump_filter_' + self.name, path)
+        self.rowwise = hasattr(module, 'filter_row')
+        if self.rowwise:
+            self.function = module.filter_row
+        elif hasattr(module, 'filter_data'):
+            self.function = module.filter_data
+        else:
+            raise AttributeError(path + " defines neither filter_row nor filter_data")
+        self.counts = getattr(module, 'counts', None)
+        self.close_function = getattr(module, 'close', None)
+
+    def take_counts(self):
+        """
+        :return: dictionary of the counts of the filter since they were last taken, or None if the filter has no
+        counts.  The counts are reset to zero
+        """
+        if self.counts is None:
+            return None
+        counts = dict(self.counts)
+        for label in self.counts:
+            self.counts[label] = 0
+        return counts
+
+    def add_counts(self, counts):
+        """
+        Add counts taken from the filter in another process
+        :param counts: dictionary of counts by label, or None
+        :return: None
+        """
+        for label, count in (counts or {}).items():
+            self.counts[label] += count
+
+    def finish(self, fp=sys.stderr):
+        """
+        Write the counts of the filter and close it
+        :param fp: file pointer for the counts
+        :return: None
+        """
+        if self.counts is not None:
+            print >>fp, self.name
+            write_counts(self.counts, fp)
+        if self.close_function is not None:
+            self.close_function()
+
+    def __repr__(self):
+        return 'Filter(' + repr(self.path) + ')'
+
+
+def write_counts(counts, fp=sys.stderr):
+    """
+    Write the counts of a filter, one label and count per line
+    :param counts: OrderedDict of counts by label
+    :param fp: file pointer.  Usually stderr
+    :return: None
+    """
+    for label, count in counts.items():
+        print >>fp, label, count
+
+
+def load_filters(paths):
+    """
+    Load filter scripts
+    :param paths: list of paths of filter scripts, in pipeline order
+    :return: list of Filters
+    """
+    return [Filter(path) for path in paths]
+
+
+def filter_rows(functions, rows, parms):
+    """
+    Filter rows through a sequence of row filters
+    :param functions: list of filter_row functions
+    :param rows: list of row number, row pairs
+    :param parms: parms passed to each filter
+    :return: list of the row number, row pairs not removed by a filter
+    """
+    result = []
+    for row_number, row in rows:
+        row = dict(row)
+        for function in functions:
+            row = function(row, parms)
+            if row is None:
+                break
+        else:
+            result.append((row_number, row))
+    return result
+
+
+def _init_worker(paths):
+    """
+    Load the filters in a worker process.  Each filter is closed when the worker exits
+    """
+    global _worker_filters
+    _worker_filters = load_filters(paths)
+    for f in _worker_filters:
+        if f.close_function is not None:
+            Finalize(f, f.close_function, exitpriority=10)
+
+
+def _filter_rows_task(task):
+    """
+    Filter a list of rows in a worker process
+    :param task: list of indexes of the worker filters, rows and parms
+    :return: list of the row number, row pairs not removed by a filter, and list of the counts of each filter for
+    the rows
+    """
+    [indexes, rows, parms] = task
+    rows = filter_rows([_worker_filters[i].function for i in indexes], rows, parms)
+    return rows, [_worker_filters[i].take_counts() for i in indexes]
+
+
+def run_pipeline(filters, data, parms=None, processes=1, rows_per_task=DEFAULT_ROWS_PER_TASK):
+    """
+    Run data through a list of filters
+    :param filters: list of Filters, in pipeline order
+    :param data: dictionary of rows keyed by row number, as returned by read_csv
+    :param parms: parms passed to each filter
+    :param processes: number of worker processes for row filters.  1 to filter all rows in this process
+    :param rows_per_task: number of rows sent to a worker process at a time
+    :return: the filtered data
+    """
+    # Group consecutive row filters into one stage.  Each stage is a list of filter indexes
+
+    stages = []
+    for i, f in enumerate(filters):
+        if f.rowwise and len(stages) > 0 and filters[stages[-1][-1]].rowwise:
+            stages[-1].append(i)
+        else:
+            stages.append([i])
+
+    paths = [f.path for f in filters]
+    pool = Pool(processes, _init_worker, (paths,)) if processes > 1 and any(f.rowwise for f in filters) else None
+    try:
+        for stage in stages:
+            logger.info(u"{} rows in to {}".format(len(data), ' '.join(filters[i].name for i in stage)))
+            if not filters[stage[0]].rowwise:
+                data = filters[stage[0]].function(data, parms)
+                continue
+            rows = data.items()
+            if pool is None:
+                results = [filter_rows([filters[i].function for i in stage], rows, parms)]
+            else:
+                tasks = [[stage, rows[start:start + rows_per_task], parms]
+                         for start in range(0, len(rows), rows_per_task)]
+                results = []
+                for result, counts in pool.map(_filter_rows_task, tasks):
+                    results.append(result)
+                    for i, stage_counts in zip(stage, counts):
+                        filters[i].add_counts(stage_counts)
+            data = PumpTable()
+            for result in results:
+                for row_number, row in result:
+                    data[row_number] = row
+        logger.info(u"{} rows out".format(len(data)))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return data
+
+
+def run_row_filter(function, parms=None, fp_in=sys.stdin, fp_out=sys.stdout, counts=None):
+    """
+    Run a row filter as a script, a row at a time from stdin to stdout
+    :param function: filter_row function
+    :param parms: parms passed to the filter
+    :param counts: optional counts of the filter, written to stderr after the rows
+    :return: None
+    """
+    data_out = CsvRowWriter(fp_out)
+    data_in = 0
+    for row_number, row in iter_csv_fp(fp_in):
+        data_in += 1
+        row = function(row, parms)
+        if row is not None:
+            data_out.write(row)
+    print >>sys.stderr, "Rows in", data_in
+    if counts is not None:
+        write_counts(counts)
+    print >>sys.stderr, "Rows out", data_out.count
+
+
+def run_data_filter(function, parms=None, fp_in=sys.stdin, fp_out=sys.stdout, counts=None):
+    """
+    Run a data filter as a script, from stdin to stdout
+    :param function: filter_data function
+    :param parms: parms passed to the filter
+    :param counts: optional counts of the filter, written to stderr after the data is filtered
+    :return: None
+    """
+    data_out = function(read_csv_fp(fp_in), parms)
+    if counts is not None:
+        write_counts(counts)
+    if len(data_out) > 0:
+        write_csv_fp(fp_out, data_out)
+
+
+def main():
+    """
+    Run the filters named on the command line from stdin to stdout
+    :return: None
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a chain of filters in one process, from stdin to stdout")
+    parser.add_argument("filters", nargs='+', help="filter scripts, in pipeline order")
+    parser.add_argument("-p", "--processes", type=int, default=1, help="number of worker processes for row "
+                        "filters")
+    parser.add_argument("-c", "--config", default="sv.cfg", help="name of file containing config data for the "
+                        "filters")
+    args = parser.parse_args()
+
+    parms = get_parms(['-c', args.config])
+    filters = load_filters(args.filters)
+    try:
+        data = run_pipeline(filters, read_csv_fp(sys.stdin), parms, processes=args.processes)
+    finally:
+        for f in filters:
+            f.finish()
+    if len(data) > 0:
+        write_csv_fp(sys.stdout, data)
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,7 @@
 from datetime import datetime
 from json import dumps
 import logging
+from vivopump import LazyFormat, diff_logger
 
 __author__ = "Michael Conlon"
 __copyright__ = "Copyright (c) 2016 Michael Conlon"
@@ -47,7 +48,11 @@ class Pump(object):
         self.update_data = None
         self.original_graph = None
         self.update_graph = None
+        self.original_index = None  # StepIndex of the original_graph
         self.entity_uri = None  # the entity_uri of the current row being processed in the update_data
+        self.uri_allocator = None  # source of new uri for the update
+        self.qualified_objects = {}  # objects of qualified steps, prefetched from VIVO by step and subject
+        self.plan = None  # the update_def compiled for the update
         self.out_filename = src
         self.json_def_filename = defn
 
@@ -189,21 +194,15 @@ class Pump(object):
         Prepare for the update, getting graph and update_data.  Then do the update, producing triples
         :return: list(graph, graph): The add and sub graphs for performing the update
         """
-        from vivopump import read_csv, get_graph
-        from rdflib import Graph
+        from vivopump import read_csv, get_graph, UriAllocator, OverlayGraph, StepIndex, compile_update_def
         import os.path
         import time
 
         if self.update_data is None:  # Test for injection
             self.update_data = read_csv(self.out_filename, delimiter=self.inter)
 
-        #   Narrow the update_def to include only columns that appear in the update_data
-
-        new_update_columns = {}
-        for name, path in self.update_def['column_defs'].items():
-            if name in self.update_data[self.update_data.keys()[0]].keys():
-                new_update_columns[name] = path
-        self.update_def['column_defs'] = new_update_columns
+        self.__narrow_update_def()
+        self.plan = compile_update_def(self.update_def)
 
         if self.original_graph is None:  # Test for injection
 
@@ -211,9 +210,18 @@ class Pump(object):
 
             self.original_graph = get_graph(self.update_def, self.query_parms)
 
-        self.update_graph = Graph()
-        for s, p, o in self.original_graph:
-            self.update_graph.add((s, p, o))
+        if self.uri_allocator is None:  # Test for injection
+
+            #   Reserve a uri for each new entity in a single query.  Intermediates are reserved as needed
+
+            self.uri_allocator = UriAllocator(self.query_parms)
+            new_entities = len([row for row in self.update_data.values() if row['uri'].strip() == ''])
+            if new_entities > 0:
+                self.uri_allocator.reserve(new_entities)
+
+        self.__prefetch_qualified_steps()
+        self.update_graph = OverlayGraph(self.original_graph)
+        self.original_index = StepIndex(self.original_graph)
 
         logger.info(u'Graphs ready for processing. Original has {} triples.  Update graph has {} triples.'.format(
             len(self.original_graph), len(self.update_graph)))
@@ -229,6 +237,92 @@ class Pump(object):
                         len(self.enum[key]['update'])))
         return self.__do_update()
 
+    def update_chunks(self, chunk_size):
+        """
+        Update the entities in the update_data a chunk at a time.  The original graph of each chunk holds only the
+        triples of the entities in the chunk, so memory is proportional to the chunk size.  Rows for the same uri are
+        in the same chunk.  Rows with merge actions, and all the rows of their uris, are updated together in the last
+        chunk.
+        :param chunk_size: the number of entities in each chunk.  If zero, all the entities are updated at once
+        :return: generator of list(graph, graph): The add and sub graphs for each chunk
+        """
+        from vivopump import read_csv, get_graph
+
+        if self.update_data is None:  # Test for injection
+            self.update_data = read_csv(self.out_filename, delimiter=self.inter)
+
+        def chunks():
+            if chunk_size <= 0:
+                yield self.update()
+                return
+            self.__narrow_update_def()
+            all_data = self.update_data
+            groups = {}
+            merge_keys = set()
+            for row in sorted(all_data.keys()):
+                uri = all_data[row]['uri'].strip()
+                key = uri if uri != '' else row
+                groups.setdefault(key, []).append(row)
+                if all_data[row].get('action', '').lower() not in ['', 'remove']:
+                    merge_keys.add(key)
+            merge_rows = sorted(row for key in merge_keys for row in groups.pop(key))
+            group_rows = sorted(groups.values())
+            row_chunks = [sum(group_rows[i:i + chunk_size], []) for i in range(0, len(group_rows), chunk_size)]
+            if len(merge_rows) > 0:
+                row_chunks.append(merge_rows)
+            try:
+                for rows in row_chunks:
+                    self.update_data = {row: all_data[row] for row in rows}
+                    uris = sorted(set(all_data[row]['uri'].strip() for row in rows) - {''})
+                    logger.info(u"Updating chunk of {} rows and {} uri".format(len(rows), len(uris)))
+                    self.original_graph = get_graph(self.update_def, self.query_parms, uris=uris)
+                    yield self.update()
+            finally:
+                self.update_data = all_data
+                self.original_graph = None
+
+        return chunks()
+
+    def __prefetch_qualified_steps(self):
+        """
+        Steps with qualifiers can not be evaluated against the original graph, since the qualifier is SPARQL.  For
+        each qualified step, query VIVO once for the objects of every subject the step can reach from the entities
+        in the update_data.  _get_step_triples serves qualified steps from these objects.
+        :return: None.  qualified_objects is set
+        """
+        from rdflib import URIRef
+        from vivopump import add_values_clause, vivo_query_pages, make_rdf_term, VALUES_BATCH_SIZE
+
+        self.qualified_objects = {}
+        entity_uris = set(URIRef(row['uri'].strip()) for row in self.update_data.values() if row['uri'].strip() != '')
+        for column in self.plan.columns:
+            subjects = entity_uris
+            for step in column.steps:
+                if step.qualifier is not None and len(subjects) > 0:
+                    objects = {subject: [] for subject in subjects}
+                    subject_list = sorted(subjects)
+                    for i in range(0, len(subject_list), VALUES_BATCH_SIZE):
+                        q = 'select ?uri (?' + step.name + ' as ?o) where { ' + \
+                            add_values_clause('?uri <' + str(step.predicate) + '> ?' + step.name + ' . \n' +
+                                              step.qualifier, subject_list[i:i + VALUES_BATCH_SIZE]) + ' }\n'
+                        for binding in vivo_query_pages(q, self.query_parms, ['uri', step.name]):
+                            objects[URIRef(binding['uri']['value'])].append(make_rdf_term(binding['o']))
+                    self.qualified_objects[id(step)] = objects
+                    logger.debug(LazyFormat(u"Prefetched qualified step for {} subjects of column {}", len(subjects),
+                                            column.name))
+                subjects = set(o for s in subjects for o in self.original_graph.objects(s, step.predicate))
+
+    def __narrow_update_def(self):
+        """
+        Narrow the update_def to include only columns that appear in the update_data
+        :return: None.  The update_def is narrowed
+        """
+        new_update_columns = {}
+        for name, path in self.update_def['column_defs'].items():
+            if name in self.update_data[self.update_data.keys()[0]].keys():
+                new_update_columns[name] = path
+        self.update_def['column_defs'] = new_update_columns
+
     def __do_get(self):
         """
         Data is queried from VIVO and returned as a tab delimited text file suitable for
@@ -236,99 +330,101 @@ class Pump(object):
 
         :return:  Number of rows of data
         """
-        from vivopump import vivo_query, make_get_data, unique_path, make_get_query, read_csv, write_csv
+        from vivopump import vivo_query_pages, make_get_data, make_get_query, external_sort, compile_update_def
         from improve.improve import improve
-        import codecs
-
-        #   Generate the get query, execute the query, shape the query results into the return object
 
-        query = make_get_query(self.update_def)
-        logger.debug(u"do_get query_parms\n{}".format(self.query_parms))
-        logger.debug(u"do_get query\n{}".format(query))
-        result_set = vivo_query(query, self.query_parms)
-        data = make_get_data(self.update_def, result_set)
+        #   Generate the get query, execute the query a page at a time, shape the query results into the return object
 
-        #   Write out the file
+        query = make_get_query(self.update_def, order_by=False)
+        logger.debug(LazyFormat(u"do_get query_parms\n{}", self.query_parms))
+        logger.debug(LazyFormat(u"do_get query\n{}", query))
+        bindings = vivo_query_pages(query, self.query_parms, ['uri'] + self.update_def['column_defs'].keys())
+        data = make_get_data(self.update_def, bindings)
+        plan = compile_update_def(self.update_def)
 
-        outfile = codecs.open(self.out_filename, mode='w', encoding='ascii', errors='xmlcharrefreplace')
+        #   Rows are sorted by the order_by column, or uri if none, then uri
 
         columns = ['uri'] + self.update_def['entity_def']['order']
-        outfile.write(self.inter.join(columns))  # write a header using the inter field separator between column names
-        outfile.write('\n')
-
-        for uri in sorted(data.keys()):
-            for name in columns:
-                if name in data[uri]:
+        sort_column_name = self.update_def['entity_def'].get('order_by', 'uri')
+        if sort_column_name not in columns:
+            logger.error(u"{} in order_by not found.  No such column name. Sorting by uri.".
+                         format(sort_column_name))
+            sort_column_name = 'uri'
+        sort_column = columns.index(sort_column_name)
 
-                    #   Translate VIVO values via enumeration if any
+        #   Translate the distinct values of each column once, by filter and enumeration.  None for no translation
 
-                    if name in self.update_def['column_defs']:
-                        path = self.update_def['column_defs'][name]
+        translations = {}
+        for name in columns:
+            if name not in plan.column_defs:
+                continue
+            column_filter = plan.column_defs[name].leaf.filter if self.filter else None
+            enum_name = plan.column_defs[name].leaf.enum
+            if column_filter is None and enum_name is None:
+                continue
+            translation = {}
+            for x in set(x for values in data.values() if name in values for x in values[name]):
+                new_string = x
+                if column_filter is not None:
+                    new_string = improve(column_filter, x)
+                    if new_string != x:
+                        logger.debug(LazyFormat(u"{} {} FILTER IMPROVED {} to {}", name, column_filter, x, new_string))
+                if enum_name is not None:
+                    val = self.enum[enum_name]['get'].get(new_string, '')
+                    if val == '':
+                        logger.warning(u"WARNING: Unable to find {} in {}. Blank substituted in {}".
+                                       format(new_string, enum_name, self.out_filename))
+                        val = None
+                    new_string = val
+                translation[x] = new_string
+            translations[name] = translation
+
+        def rows():
+            """
+            Shape the data of each uri into a row of column values.  Each uri is removed from data as its row is made
+            :return: generator of sort value, uri and row
+            """
+            for uri in data.keys():
+                values = data.pop(uri)
+                row = []
+                for name in columns:
+                    if name in values:
 
                         #   Warn/correct if path is unique and VIVO is not
 
-                        if unique_path(path) and len(data[uri][name]) > 1:
+                        if name in plan.column_defs and plan.column_defs[name].unique and len(values[name]) > 1:
                             logger.warning(u"VIVO has non-unique values for unique path {} at {} values {}".
-                                           format(name, uri, data[uri][name]))
-                            data[uri][name] = {next(iter(data[uri][name]))}  # Pick one element from multi-valued set
-                            logger.warning(u"Using {}", data[uri][name])
-
-                        #   Handle filters
-
-                        if self.filter and 'filter' in path[len(path) - 1]['object']:
-                            a = set()
-                            for x in data[uri][name]:
-                                was_string = x
-                                new_string = improve(path[len(path) - 1]['object']['filter'], x)
-                                if was_string != new_string:
-                                    logger.debug(u"{} {} {} FILTER IMPROVED {} to {}".
-                                                 format(uri, name, path[len(path) - 1]['object']['filter'],
-                                                        was_string, new_string))
-                                a.add(new_string)
-                            data[uri][name] = a
-
-                        #   Handle enumerations
-
-                        if 'enum' in path[len(path) - 1]['object']:
-                            enum_name = path[len(path) - 1]['object']['enum']
-                            a = set()
-                            for x in data[uri][name]:
-                                val = self.enum[enum_name]['get'].get(x, '')
-                                if val != '':
-                                    a.add(val)
-                                else:
-                                    logger.warning(u"WARNING: Unable to find {} in {}. Blank substituted in {}".
-                                                   format(x, enum_name, self.out_filename))
-                            data[uri][name] = a
-
-                    #   Gather values into a delimited string
-
-                    val = self.intra.join(data[uri][name])
-                    outfile.write(val.replace('\r', ' ').replace('\n', ' ').replace('\t', ' '))
-                if name != columns[len(columns) - 1]:
-                    outfile.write(self.inter)
-            outfile.write('\n')
+                                           format(name, uri, values[name]))
+                            values[name] = {next(iter(values[name]))}  # Pick one element from multi-valued set
+                            logger.warning(u"Using {}".format(values[name]))
 
-        outfile.close()
+                        #   Translate VIVO values via filters and enumerations if any
 
-        #   Rewrite the file based on the order_by or uri if none
+                        if name in translations:
+                            values[name] = set(translations[name][x] for x in values[name]) - {None}
 
-        sort_column_name = self.update_def['entity_def'].get('order_by', 'uri')
-        data = read_csv(self.out_filename, delimiter=self.inter)
-        sdata = {}
-        try:
-            order = sorted(data, key=lambda rown: data[rown][sort_column_name])
-        except KeyError:
-            logger.error(u"{} in order_by not found.  No such column name. Sorting by uri.".
-                         format(sort_column_name))
-            order = sorted(data, key=lambda rown: data[rown]['uri'])
-        row = 1
-        for o in order:
-            sdata[row] = data[o]
-            row += 1
-        write_csv(self.out_filename, sdata, delimiter=self.inter)
+                        #   Gather values into a delimited string
 
-        return len(data)
+                        val = self.intra.join(values[name])
+                        row.append(val.replace('\r', ' ').replace('\n', ' ').replace('\t', ' ').strip().
+                                   encode('ascii', 'xmlcharrefreplace'))
+                    else:
+                        row.append('')
+                yield row[sort_column], uri, row
+
+        #   Write out the file in one pass
+
+        n_rows = 0
+        with open(self.out_filename, 'w') as outfile:
+            # write a header using the inter field separator between column names
+            outfile.write(self.inter.join(columns))
+            outfile.write('\n')
+            for sort_value, uri, row in external_sort(rows()):
+                outfile.write(self.inter.join(row))
+                outfile.write('\n')
+                n_rows += 1
+
+        return n_rows
 
     def __do_merges(self, merges):
         """
@@ -364,7 +460,7 @@ class Pump(object):
         self.update_graph.remove((None, None, uri))
         after = len(self.update_graph)
         removed = before - after
-        logger.debug(u"REMOVING {} triples for {} on row {}".format(removed, uri, row))
+        logger.debug(LazyFormat(u"REMOVING {} triples for {} on row {}", removed, uri, row))
         return removed
 
     def __do_update(self):
@@ -373,7 +469,7 @@ class Pump(object):
         rdf as necessary to process requested add, change, delete
         """
         from rdflib import URIRef, RDF
-        from vivopump import new_uri, prepare_column_values, PathLengthException
+        from vivopump import prepare_column_values, InvalidSourceException
 
         merges = {}
 
@@ -386,18 +482,20 @@ class Pump(object):
                 #   If the source uri is empty, create one.  Remaining processing is unchanged.
                 #   Since the new uri does not have triples for the columns in the spreadsheet, each will be added
 
-                uri_string = new_uri(self.query_parms)
-                logger.debug(u"Adding an entity for row {}. Will be added at {}".format(row, uri_string))
+                uri_string = self.uri_allocator.new_uri()
+                logger.debug(LazyFormat(u"Adding an entity for row {}. Will be added at {}", row, uri_string))
                 uri = URIRef(uri_string)
-                self.update_graph.add((uri, RDF.type, self.update_def['entity_def']['type']))
+                self.update_graph.add((uri, RDF.type, self.plan.entity_type))
 
             #   Create a URI entity if not found
 
             else:
                 uri = URIRef(data_update['uri'].strip())
+                if any(c in uri for c in '<>" {}|\\^`'):
+                    raise InvalidSourceException(str(row) + " uri " + uri.encode('utf-8') + " is not a valid uri")
                 if (uri, None, None) not in self.update_graph:
-                    logger.debug(u"Adding an entity for row {}. Will be added at {}".format(row, str(uri)))
-                    self.update_graph.add((uri, RDF.type, self.update_def['entity_def']['type']))
+                    logger.debug(LazyFormat(u"Adding an entity for row {}. Will be added at {}", row, str(uri)))
+                    self.update_graph.add((uri, RDF.type, self.plan.entity_type))
 
             self.entity_uri = uri
             action = data_update.get('action', '').lower()
@@ -430,8 +528,8 @@ class Pump(object):
             #   For this row, process all the column_defs and then process closure defs if any.  Closures allow
             #   columns to be "reused" providing additional paths from the row entity to entities in the paths.
 
-            for column_name, column_def in self.update_def['column_defs'].items() + \
-                    self.update_def.get('closure_defs', {}).items():
+            for column in self.plan.columns:
+                column_name = column.name
 
                 #   Skip any columns in the data that are not in the update_def
 
@@ -441,137 +539,87 @@ class Pump(object):
                 #   Skip the column if it is empty
 
                 if data_update[column_name] == '':
-                    logger.debug(u"Skipping blank value. row {} column {}".format(row, column_name))
+                    logger.debug(LazyFormat(u"Skipping blank value. row {} column {}", row, column_name))
                     continue
 
                 #   Process the column values, returning a list of RDF elements
 
-                last_def = column_def[len(column_def) - 1]
-                column_values = prepare_column_values(data_update[column_name], self.intra, last_def, self.enum, row,
-                                                      column_name)
-
-                #   Process the path depending on its length.  Some day we will refactor this to a recursion
-
-                if len(column_def) > 3:
-                    raise PathLengthException(
-                        "ERROR: Path lengths > 3 not supported.  Path length for " + column_name + " is " + str(
-                            len(column_def)))
-                elif len(column_def) == 3:
-                    self.__do_three_step_update(row, column_name, self.entity_uri, column_def, data_update)
-                elif len(column_def) == 2:
-                    self.__do_two_step_update(row, column_name, self.entity_uri, column_def, data_update)
-                elif len(column_def) == 1:
-                    vivo_objs = {unicode(o): o for s, p, o in
-                                 self._get_step_triples(self.entity_uri, last_def)}
-                    logger.debug(u"{} {} {} {} {}".format(row, column_name, column_values, self.entity_uri, vivo_objs))
-                    self.__do_the_update(row, column_name, self.entity_uri, last_def, column_values, vivo_objs)
+                column_values = prepare_column_values(data_update[column_name], self.intra, column.values_step,
+                                                      self.enum, row, column_name)
+
+                #   Process the path from the entity to the leaf, a step at a time
+
+                self.__do_path_update(row, column_name, self.entity_uri, column.steps, column_values)
 
         if any(merges):
             self.__do_merges(merges)
 
         #   Return the add and sub graphs representing the changes that need to be made to the original
 
-        add = self.update_graph - self.original_graph  # Triples in update that are not in original
-        logger.info(u"Triples to add\n{}".format(add.serialize(format='nt')))
-        sub = self.original_graph - self.update_graph  # Triples in original that are not in update
-        logger.info(u"Triples to sub\n{}".format(sub.serialize(format='nt')))
+        add = self.update_graph.add_graph()  # Triples in update that are not in original
+        sub = self.update_graph.sub_graph()  # Triples in original that are not in update
+        logger.info(u"{} triples to add.  {} triples to sub".format(len(add), len(sub)))
+        if diff_logger.isEnabledFor(logging.INFO):
+            diff_logger.info(u"Triples to add\n{}".format(add.serialize(format='nt').decode('utf-8')))
+            diff_logger.info(u"Triples to sub\n{}".format(sub.serialize(format='nt').decode('utf-8')))
         return [add, sub]
 
-    def __do_three_step_update(self, row, column_name, uri, path, data_update):
-        """
-        Given the current state in the update, and a path length three column_def, add, change or delete intermediate
-        and end objects as necessary to perform the requested update
-        :param row: row number of the update.  For logger messages
-        :param column_name: column_name of the update.  For logger messages
-        :param uri: uri of the entity at the head of the path
-        :param path: the column definition
-        :param data_update: the data provided for the update
-        :return: Changes in the update_graph
+    def __do_path_update(self, row, column_name, uri, path, column_values):
         """
-        from rdflib import RDF, RDFS, Literal, URIRef
-        from vivopump import new_uri
-
-        step_def = path[0]
-        step_uris = [o for s, p, o in self._get_step_triples(uri, step_def)]
-
-        if len(step_uris) == 0:
-
-            #   VIVO has no values for first intermediate, so add new intermediate and do a two step update on it
-
-            step_uri = URIRef(new_uri(self.query_parms))
-            self.update_graph.add((uri, step_def['predicate']['ref'], step_uri))
-            self.update_graph.add((step_uri, RDF.type, step_def['object']['type']))
-            if 'label' in step_def['object']:
-                self.update_graph.add((step_uri, RDFS.label, Literal(step_def['object']['label'],
-                                                                     datatype=step_def['object'].get('datatype', None),
-                                                                     lang=step_def['object'].get('lang', None))))
-            self.__do_two_step_update(row, column_name, step_uri, path[1:], data_update)
+        Given the current state in the update and the remaining path of a column_def from an entity, add, change or
+        delete intermediate and end objects as necessary to perform the requested update.  Paths may have any length.
+        Cases for the first step of a path longer than one are:
 
-        elif step_def['predicate']['single'] == True:
+                              Predicate Single                   Predicate Multiple
+        VIVO has 0 values     Add intermediate, path update      Add intermediate for each value, path update
+        VIVO has 1 value      Path update through intermediate   Set compare through intermediates
+        VIVO has >1 value     WARNING, path update through first Set compare through intermediates
 
-            #   VIVO has 1 or more values for first intermediate, so we need to see if the predicate
-            #   is expected to be single
-
-            step_uri = step_uris[0]
-            if len(step_uris) > 1:
-                logger.warning(u"WARNING: Single predicate {} has {} values: {}. Using {}".
-                               format(path[0]['object']['name'], len(step_uris), step_uris, step_uri))
-            self.__do_two_step_update(row, column_name, step_uri, path[1:], data_update)
-        return None
-
-    def __do_two_step_update(self, row, column_name, uri, column_def, data_update):
-        """
-        In a two step update, identify intermediate entity that might need to be created, and end path objects that
-        might not yet exist or might need to be created.  Cases are:
-
-                              Predicate Single   Predicate Multiple
-        VIVO has 0 values     Add, do_the        Add intermediate, do_the
-        VIVO has 1 value         do_the          Set compare through intermediate
-        VIVO has >1 value     WARNING, do_the    Set compare through intermediate
+        When the step before the leaf is single, the leaf values are set compared through the intermediate
 
         :param: row: current row in spreadsheet
         :param: column_name: name of current column in spreadsheet
         :param: uri: uri in VIVO of the current entity
-        :param: column_def: the column def for the current column
-        :param: data_update: the column_value
+        :param: path: the Steps of the column from the current entity to the leaf
+        :param: column_values: the column values prepared as rdflib terms
         :return: alterations in update graph
         """
-        from rdflib import RDF, RDFS, Literal, URIRef
-        from vivopump import new_uri, prepare_column_values
+        step = path[0]
 
-        step_def = column_def[0]
+        if len(path) == 1:
+            vivo_objs = {unicode(o): o for s, p, o in self._get_step_triples(uri, step)}
+            logger.debug(LazyFormat(u"{} {} {} {} {}", row, column_name, column_values, uri, vivo_objs))
+            self.__do_the_update(row, column_name, uri, step, column_values, vivo_objs)
+            return None
+
+        rest = path[1:]
+        step_uris = [o for s, p, o in self._get_step_triples(uri, step)]
+
+        if step.single != False and len(rest) > 1:
+
+            #   Single intermediate on the way to the leaf.  Find or add it, and update the rest of the path from it
+
+            if len(step_uris) == 0:
+                step_uri = self.__add_step_object(uri, step)
+            else:
+                step_uri = step_uris[0]
+                if len(step_uris) > 1:
+                    logger.warning(u"WARNING: Single predicate {} has {} values: {}. Using {}".
+                                   format(step.name, len(step_uris), step_uris, step_uri))
+            self.__do_path_update(row, column_name, step_uri, rest, column_values)
+            return None
 
         #   Determine the add set (which intermediates point to column values that are not yet in VIVO
-        #       For each element in the add set, construct the intermediate and call __do_the_update to
-        #       construct the leaf
+        #       For each element in the add set, construct the intermediate and update the rest of the path from it
         #   Determine the sub set (which intermediates point to column values that are in VIVO and are
         #   not in the column values
-        #       For each element in the sub set, remove the leaf and the intermediate
-        #
-        #   This framework should also handle single valued predicates, and cases where there are no step_uris.
-        #   That is, it should handle everything.  All the code below should be replaced.
+        #       For each element in the sub set, remove the leaf and the intermediates
 
-        step_uris = [o for s, p, o in
-                     self._get_step_triples(uri, column_def[0])]
         vivo_objs = {}
         for step_uri in step_uris:
-            for s, p, o in self._get_step_triples(step_uri, column_def[1]):
+            for o in self.__get_path_objects(step_uri, rest):
                 vivo_objs[unicode(o)] = [o, step_uri]
 
-        #   Nasty hack below.  The predicate property "single" appears to have two meanings.  One has to do
-        #   with the semantic graph and one has to do with the cardinality of the data column.  These are not
-        #   the same.  When the first step is multiple and the second single, the "second single" is not the
-        #   cardinality of the data column.  The cardinality of the data column is multiple if any of the
-        #   predicates in the path are multiple.  Here we set the cardinality of the leaf to be used by
-        #   prepare_column_values and then set it back.  Nasty.  Create a property for leaf cardinality.
-
-        predicate2_cardinality = column_def[1]['predicate']['single']
-        if column_def[0]['predicate']['single'] == False:
-            column_def[1]['predicate']['single'] = False
-        column_values = prepare_column_values(data_update[column_name], self.intra, column_def[1], self.enum, row,
-                                              column_name)
-        column_def[1]['predicate']['single'] = predicate2_cardinality
-
         vivo_values = [vivo_objs[x][0] for x in vivo_objs.keys()]
         if unicode(column_values[0]).lower() == 'none':
             add_values = set()
@@ -579,58 +627,45 @@ class Pump(object):
         else:
             add_values = set(column_values) - set(vivo_values)
             sub_values = set(vivo_values) - set(column_values)
-            logger.debug(u"Two step SET COMPARE\n\tRow {}\n\tColumn {}\n\tSource values {}\n\tVIVO values {}" +
-                         "\n\tAdd values {}\n\tSub values {}\n\tStep_uris {}".
-                         format(row, column_name, column_values, vivo_values, add_values, sub_values, step_uris))
+            logger.debug(LazyFormat(u"Path SET COMPARE\n\tRow {}\n\tColumn {}\n\tSource values {}" +
+                                    "\n\tVIVO values {}\n\tAdd values {}\n\tSub values {}\n\tStep_uris {}", row,
+                                    column_name, column_values, vivo_values, add_values, sub_values, step_uris))
 
         #   Process the adds
 
         if len(add_values) > 0:
-            if column_def[0]['predicate']['single'] == False:
+            if step.single == False:
 
                 #   Multiple intermediaries, single valued-leaves
 
                 for leaf_value in add_values:
-                    step_uri = URIRef(new_uri(self.query_parms))
-                    self.update_graph.add((uri, step_def['predicate']['ref'], step_uri))
-                    if 'type' in step_def['object']:
-                        self.update_graph.add((step_uri, RDF.type, step_def['object']['type']))
-                    if 'label' in step_def['object']:
-                        self.update_graph.add((step_uri, RDFS.label, Literal(step_def['object']['label'],
-                                                                             datatype=step_def['object'].get('datatype',
-                                                                                                             None),
-                                                                             lang=step_def['object'].get('lang',
-                                                                                                         None))))
-                    self.__do_the_update(row, column_name, step_uri, column_def[1], [leaf_value], {})
+                    step_uri = self.__add_step_object(uri, step)
+                    if len(rest) == 1:
+                        self.__do_the_update(row, column_name, step_uri, rest[0], [leaf_value], {})
+                    else:
+                        self.__do_path_update(row, column_name, step_uri, rest, [leaf_value])
             else:
 
                 #   Multiple values on the single leaf
 
                 if len(step_uris) == 0:
-                    step_uri = URIRef(new_uri(self.query_parms))
-                    self.update_graph.add((uri, step_def['predicate']['ref'], step_uri))
-                    if 'type' in step_def['object']:
-                        self.update_graph.add((step_uri, RDF.type, step_def['object']['type']))
-                    if 'label' in step_def['object']:
-                        self.update_graph.add((step_uri, RDFS.label, Literal(step_def['object']['label'],
-                                              datatype=step_def['object'].get('datatype', None),
-                                              lang=step_def['object'].get('lang', None))))
+                    step_uri = self.__add_step_object(uri, step)
                 else:
                     step_uri = step_uris[0]
-                self.__do_the_update(row, column_name, step_uri, column_def[1], column_values, {})
+                self.__do_the_update(row, column_name, step_uri, rest[0], column_values, {})
 
         #   Process the subs
 
         if len(sub_values) > 0:
-            if column_def[0]['predicate']['single'] == False:
+            if step.single == False:
 
                 #   Handle multiple intermediaries, single leaves, by removing each intermediary and all its
                 #   assertions
 
                 for leaf_value in sub_values:
                     step_uri = vivo_objs[unicode(leaf_value)][1]
-                    self.update_graph.remove((uri, step_def['predicate']['ref'], step_uri))
-                    self.update_graph.remove((step_uri, None, None))
+                    self.update_graph.remove((uri, step.predicate, step_uri))
+                    self.__remove_step_object(step_uri, rest)
             else:
 
                 #   Handle single intermediary, possibly multiple leaves, by removing each leaf from the intermediary
@@ -639,14 +674,56 @@ class Pump(object):
                 step_uri = vivo_objs[unicode(next(iter(sub_values)))][1]
                 for leaf_value in sub_values:
                     self.update_graph.remove((step_uri, None, leaf_value))
-                g = self.update_graph.triples((step_uri, column_def[1]['predicate']['ref'], None))
+                g = self.update_graph.triples((step_uri, rest[0].predicate, None))
                 if g == set():
-                    self.update_graph.remove((uri, step_def['predicate']['ref'], step_uri))
+                    self.update_graph.remove((uri, step.predicate, step_uri))
                     self.update_graph.remove((step_uri, None, None))
 
         return None
 
-    def __do_the_update(self, row, column_name, uri, step_def, column_values, vivo_objs):
+    def __add_step_object(self, uri, step):
+        """
+        Add a new intermediate object for a step of a path
+        :param uri: uri of the subject of the step
+        :param step: Step of the intermediate
+        :return: uri of the new object
+        """
+        from rdflib import RDF, RDFS, Literal, URIRef
+
+        step_uri = URIRef(self.uri_allocator.new_uri())
+        self.update_graph.add((uri, step.predicate, step_uri))
+        if step.type is not None:
+            self.update_graph.add((step_uri, RDF.type, step.type))
+        if step.label is not None:
+            self.update_graph.add((step_uri, RDFS.label, Literal(step.label, datatype=step.datatype,
+                                                                 lang=step.lang)))
+        return step_uri
+
+    def __get_path_objects(self, uri, path):
+        """
+        :param uri: uri of the subject of the path
+        :param path: Steps from the subject to the leaf
+        :return: list of the leaf objects reached from the subject
+        """
+        objects = [uri]
+        for step in path:
+            objects = [o for subject in objects for s, p, o in self._get_step_triples(subject, step)]
+        return objects
+
+    def __remove_step_object(self, uri, path):
+        """
+        Remove an intermediate object, its assertions, and the intermediates following it on the path
+        :param uri: uri of the intermediate
+        :param path: Steps following the intermediate to the leaf
+        :return: None
+        """
+        if len(path) > 1:
+            for s, p, o in self._get_step_triples(uri, path[0]):
+                self.__remove_step_object(o, path[1:])
+        self.update_graph.remove((uri, None, None))
+        return None
+
+    def __do_the_update(self, row, column_name, uri, step, column_values, vivo_objs):
         """
         Given the uri of an entity to be updated, the current step definition, column value(s) as rdflib terms,
         vivo object(s), and the update graph, add or remove triples to the update graph as needed to make the
@@ -658,12 +735,11 @@ class Pump(object):
         The code below represents the guts of the update.  Everything else is getting in position.
 
         :param uri: uri of the current entity
-        :param step_def: current step definition (always a leaf in the flow graph)
+        :param step: current Step (always a leaf in the flow graph)
         :param column_values: list of column values prepared as rdflib terms
         :param vivo_objs: dict of object Literals keyed by string value of literal
         :return: None
         """
-        from vivopump import make_rdf_term_from_source
 
         #   Compare VIVO to Input and update as indicated
 
@@ -674,29 +750,27 @@ class Pump(object):
 
             #   boolean processing
 
-            elif step_def['predicate']['single'] == 'boolean':
+            elif step.boolean:
                 if column_string == '1':
-                    logger.debug(u"Add boolean value {} to {}".format(step_def['object']['value'], str(uri)))
-                    self.update_graph.add((uri, step_def['predicate']['ref'],
-                                          make_rdf_term_from_source(step_def['object']['value'], step_def)))
+                    logger.debug(LazyFormat(u"Add boolean value {} to {}", step.value, str(uri)))
+                    self.update_graph.add((uri, step.predicate, step.term(step.value)))
                 else:
-                    logger.debug(u"Sub boolean value {} from {}".format(step_def['object']['value'], str(uri)))
-                    self.update_graph.remove((uri, step_def['predicate']['ref'],
-                                             make_rdf_term_from_source(step_def['object']['value'], step_def)))
+                    logger.debug(LazyFormat(u"Sub boolean value {} from {}", step.value, str(uri)))
+                    self.update_graph.remove((uri, step.predicate, step.term(step.value)))
 
             #   None processing
 
             elif column_string == 'None':
-                logger.debug(u"Remove {} from {}".format(column_name, str(uri)))
+                logger.debug(LazyFormat(u"Remove {} from {}", column_name, str(uri)))
                 for vivo_object in vivo_objs.values():
-                    self.update_graph.remove((uri, step_def['predicate']['ref'], vivo_object))
-                    logger.debug(u"{} {} {}".format(uri, step_def['predicate']['ref'], vivo_object))
+                    self.update_graph.remove((uri, step.predicate, vivo_object))
+                    logger.debug(LazyFormat(u"{} {} {}", uri, step.predicate, vivo_object))
 
             #   Add value processing
 
             elif len(vivo_objs) == 0:
-                logger.debug(u"Adding {} {}".format(column_name, column_string))
-                self.update_graph.add((uri, step_def['predicate']['ref'], column_values[0]))  # Literal or URIRef
+                logger.debug(LazyFormat(u"Adding {} {}", column_name, column_string))
+                self.update_graph.add((uri, step.predicate, column_values[0]))  # Literal or URIRef
 
             #   Update value processing
 
@@ -706,133 +780,107 @@ class Pump(object):
                     if vivo_object == column_values[0]:
                         continue  # No action required if vivo term is same as source
                     else:
-                        self.update_graph.remove((uri, step_def['predicate']['ref'], vivo_object))
-                        logger.debug(u"REMOVE {} {} {}".format(row, column_name, unicode(vivo_object)))
-                        self.update_graph.add((uri, step_def['predicate']['ref'], column_values[0]))
-                        logger.debug(u"ADD {} {} {} \n\t step_def {} \n\tlang is {}".
-                                     format(row, column_name, column_string, step_def, step_def['object'].get('lang',
-                                                                                                              None)))
+                        self.update_graph.remove((uri, step.predicate, vivo_object))
+                        logger.debug(LazyFormat(u"REMOVE {} {} {}", row, column_name, unicode(vivo_object)))
+                        self.update_graph.add((uri, step.predicate, column_values[0]))
+                        logger.debug(LazyFormat(u"ADD {} {} {} \n\t step {} \n\tlang is {}", row, column_name,
+                                                column_string, step, step.lang))
         else:
 
             #   Set comparison processing
 
-            logger.debug(u'SET COMPARE {} {} {} {}'.format(row, column_name, column_values, vivo_objs.values()))
+            logger.debug(LazyFormat(u'SET COMPARE {} {} {} {}', row, column_name, column_values, vivo_objs.values()))
             add_values = set(column_values) - set(vivo_objs.values())
             sub_values = set(vivo_objs.values()) - set(column_values)
             for value in add_values:
-                self.update_graph.add((uri, step_def['predicate']['ref'], value))
+                self.update_graph.add((uri, step.predicate, value))
             for value in sub_values:
-                self.update_graph.remove((uri, step_def['predicate']['ref'], value))
+                self.update_graph.remove((uri, step.predicate, value))
 
         return None
 
-    def _get_step_triples(self, uri, step_def):
+    def _get_step_triples(self, uri, step):
         """
         Return the triples matching the criteria defined in the current step of an update
         :param uri: uri of the entity currently the subject of an update
-        :param step_def: step definition from update_def
-        :return:  Graph containing zero or more triples that match the criteria for the step
+        :param step: Step from the plan
+        :return:  list of zero or more triples that match the criteria for the step
         """
-        from rdflib import Graph, RDF
-        from vivopump import add_qualifiers, vivo_query, make_rdf_term
+        from vivopump import vivo_query, make_rdf_term
 
-        def step_graph(uris, pred, otype=None, graph=self.update_graph):
+        def step_triples(uris, pred, otype=None, index=self.update_graph.index):
             """
-            Given a list of uri, a pred and a type, return a graph of the update_graph triples satisfying
+            Given a list of uri, a pred and a type, return a list of the update_graph triples satisfying
                 uri pred any   <- these are the returned triples
                 any a type
             :param uris: list of uris.
-            :param pred: the predicate to use in selecting triples for the step_graph
+            :param pred: the predicate to use in selecting triples for the step
             :param otype: the object type to use.  default in None, and no type selection will be done.
-            :param graph: default is update_graph. Closure sieve requires original_graph
-            :return: graph
+            :param index: default is the index of the update_graph. Closure sieve requires original_index
+            :return: list of triples
             """
-            sg = Graph()
-            for suri in uris:
-                for obj in graph.objects(suri, pred):
-                    if otype is None:
-                        sg.add((suri, pred, obj))
-                    elif (obj, RDF.type, otype) in self.update_graph:
-                        sg.add((suri, pred, obj))
-
-            return sg
+            return [(suri, pred, obj) for suri in uris for obj in index.objects(suri, pred)
+                    if otype is None or self.update_graph.index.has_type(obj, otype)]
 
         def sieve_triples(sgc, column_name):
             """
-            Given a step graph of triples from a closure (sgc), and the current column_name,
-            select the triples from the closure graph that have a path from the entity_uri to
-            one or more objects in the closure.  If there is no path, return an empty graph.
-            :param sgc:  the step closure graph to be "sieved"
+            Given a list of triples from a closure (sgc), and the current column_name,
+            select the triples from the closure that have a path from the entity_uri to
+            one or more objects in the closure.  If there is no path, return an empty list.
+            :param sgc:  the step closure triples to be "sieved"
             :param column_name: the name of the column to use
-            :return: the sieved closure graph
+            :return: the sieved closure triples
             """
 
-            print "\nBeginning Closure Graph for", column_name
-            for (s, p, o) in sgc.triples((None, None, None)):
-                print s, p, o
+            logger.debug(LazyFormat(u"Beginning closure triples for {}\n{}", column_name, sgc))
 
             if len(sgc) == 0:
                 return sgc  # Nothing to sieve
             else:
-                pred = self.update_def['column_defs'][column_name][0]['predicate']['ref']
-                otype = self.update_def['column_defs'][column_name][0]['object'].get('type', None)
-                sg = step_graph([self.entity_uri], pred, otype, graph=self.original_graph)
-                if len(sg) == 0 or len(self.update_def['column_defs'][column_name]) == 1:
+                path = self.plan.column_defs[column_name].steps
+                sg = step_triples([self.entity_uri], path[0].predicate, path[0].type, index=self.original_index)
+                if len(sg) == 0 or len(path) == 1:
                     return sg
-                print "step 0 graph"
-                for (s, p, o) in sg.triples((None, None, None)):
-                    print s, p, o
-                for step in self.update_def['column_defs'][column_name][1:]:
-                    sg = step_graph([y for y in sg.objects(None, None)], step['predicate']['ref'],
-                                    step['object'].get('type', None), graph=self.original_graph)
-                    print "next step graph"
-                    for (s, p, o) in sg.triples((None, None, None)):
-                        print s, p, o
+                logger.debug(LazyFormat(u"Step 0 triples\n{}", sg))
+                for column_step in path[1:]:
+                    sg = step_triples(set(y for x, z, y in sg), column_step.predicate, column_step.type,
+                                      index=self.original_index)
+                    logger.debug(LazyFormat(u"Next step triples\n{}", sg))
                 if len(sg) == 0:
                     return sg  # column path is empty, so nothing in the closure can match
 
-                #   Wait for it .... Here's the sieve.  Return triples in the closure graph that have
-                #   objects on the column graph
+                #   Wait for it .... Here's the sieve.  Return triples in the closure that have
+                #   objects on the column path
 
-                sgr = Graph()
-                for (sgcs, sgcp, sgco) in sgc.triples((None, None, None)):
-                    if sgco in sg.objects(None, None):
-                        sgr.add((sgcs, sgcp, sgco))
+                sg_objects = set(y for x, z, y in sg)
+                sgr = list(set(x for x in sgc if x[2] in sg_objects))
 
-                print "reduced step graph"
-                for (s, p, o) in sgr.triples((None, None, None)):
-                    print s, p, o
+                logger.debug(LazyFormat(u"Reduced step triples\n{}", sgr))
 
             return sgr
         
-        if 'qualifier' not in step_def['object']:
-
-            g = step_graph([uri], step_def['predicate']['ref'], step_def['object'].get('type', None))
-
-            # print "\nStep_triples for", step_def['column_name'], [uri],
-            # step_def['predicate']['ref'], step_def['object'].get('type', None)
+        if step.qualifier is None:
 
-            for (s, p, o) in g.triples((None, None, None)):
-                print unicode(s), unicode(p), unicode(o)
+            g = step_triples([uri], step.predicate, step.type)
 
-            #   If the step_def is in a closure, and its the last step in the closure, then the
+            #   If the step is in a closure, and its the last step in the closure, then the
             #   closure triples must be sieved against the objects defined by the column.
 
-            if step_def['closure'] and step_def['last']:
+            if step.closure and step.last:
 
-                g = sieve_triples(g, step_def['column_name'])
+                g = sieve_triples(g, step.column_name)
         else:
         
-            #   Handle non-specific predicates qualified by SPARQL (a rare case for VIVO-ISF)
-            
-            q = 'select (?' + step_def['object']['name'] + ' as ?o) where { <' + str(uri) + '> <' + \
-                str(step_def['predicate']['ref']) + '> ?' + step_def['object']['name'] + ' . \n' + \
-                add_qualifiers([step_def]) + ' }\n'
-            logger.debug(u"Qualified Step Triples Query {}".format(q))
-            result_set = vivo_query(q, self.query_parms)  # SLOW
-            g = Graph()
-            for binding in result_set['results']['bindings']:
-                o = make_rdf_term(binding['o'])
-                g.add((uri, step_def['predicate']['ref'], o))
-        logger.debug(u"Step Triples {}".format(g.serialize(format='nt')))
+            #   Handle non-specific predicates qualified by SPARQL (a rare case for VIVO-ISF).  Objects are prefetched
+            #   for the subjects in VIVO.  Query VIVO for any other subject
+
+            objects = self.qualified_objects.get(id(step), {}).get(uri)
+            if objects is None:
+                q = 'select (?' + step.name + ' as ?o) where { <' + str(uri) + '> <' + str(step.predicate) + '> ?' + \
+                    step.name + ' . \n' + step.qualifier + ' }\n'
+                logger.debug(LazyFormat(u"Qualified Step Triples Query {}", q))
+                result_set = vivo_query(q, self.query_parms)
+                objects = [make_rdf_term(binding['o']) for binding in result_set['results']['bindings']]
+            g = [(uri, step.predicate, o) for o in set(objects)]
+        logger.debug(LazyFormat(u"Step Triples {}", g))
         return g
@@ -6,9 +6,12 @@ vivopump -- module of helper functions for the pump
 
 import sys
 import csv
+import collections
 import string
+import re
 import random
 import logging
+import threading
 
 __author__ = "Michael Conlon"
 __copyright__ = "Copyright (c) 2016 Michael Conlon"
@@ -17,6 +20,86 @@ __version__ = "0.8.7"
 
 logger = logging.getLogger(__name__)
 
+# Value of a PumpTable cell with no value
+
+_MISSING = object()
+
+# Logger for dumps of the triples to add and sub in each update.  Silent unless enabled by log_diffs
+
+diff_logger = logging.getLogger('pump.diff')
+diff_logger.propagate = False
+diff_logger.setLevel(logging.CRITICAL)
+
+# Number of idle keep-alive connections kept for each SPARQL endpoint
+
+DEFAULT_POOL_SIZE = 4
+
+# Number of new URIs reserved by each query of a UriAllocator
+
+DEFAULT_URI_BLOCK_SIZE = 100
+
+# Number of threads fetching column data for an update.  One fetches the columns sequentially
+
+DEFAULT_FETCH_WORKERS = 1
+
+# Number of rows in each page of a paged query.  Zero sends each query in a single request
+
+DEFAULT_PAGE_SIZE = 10000
+
+# Number of entities in each chunk of a partitioned update.  Zero updates all entities at once
+
+DEFAULT_CHUNK_SIZE = 0
+
+# Maximum number of uri in the VALUES clause of a query
+
+VALUES_BATCH_SIZE = 500
+
+# Number of lines sorted in memory when writing sorted N-Triples
+
+DEFAULT_SORT_RUN_SIZE = 100000
+
+# Characters escaped in N-Triples files.  A surrogate pair is one character
+
+NON_ASCII_PATTERN = re.compile(u'[\ud800-\udbff][\udc00-\udfff]|[^\x00-\x7f]')
+
+# Graph, number of triples in each SPARQL update, and number of retries of a failed update when applying updates
+
+DEFAULT_GRAPH_URI = 'http://vitro.mannlib.cornell.edu/default/vitro-kb-2'
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_RETRIES = 3
+
+# Number of seconds a result in the lookup cache is used before the query is sent again.  A week, longer than the
+# time between nightly runs.  apply removes the results of the VIVO it updates
+
+DEFAULT_LOOKUP_TTL = 7 * 86400
+
+
+class LazyFormat(object):
+    """
+    A log message formatted only if it is logged.  Use for messages with arguments that are expensive to format,
+    such as sets of values and step definitions:  logger.debug(LazyFormat(u"Values {}", values))
+    """
+    def __init__(self, fmt, *args, **kwargs):
+        self.fmt = fmt
+        self.args = args
+        self.kwargs = kwargs
+
+    def __unicode__(self):
+        return self.fmt.format(*self.args, **self.kwargs)
+
+    def __str__(self):
+        return unicode(self).encode('utf-8')
+
+
+def log_diffs(filename):
+    """
+    Write the triples to add and sub in each update to a file
+    :param filename: name of the file
+    :return: None
+    """
+    diff_logger.addHandler(logging.FileHandler(filename, mode='w'))
+    diff_logger.setLevel(logging.INFO)
+
 
 class DefNotFoundException(Exception):
     """
@@ -66,6 +149,125 @@ class PathLengthException(Exception):
         return repr(self.value)
 
 
+class RowError(Exception):
+    """
+    Raise this exception when the number of data elements on a row in a CSV is not equal to the number of header
+    elements
+    """
+    pass
+
+
+class QueryPool(object):
+    """
+    A pool of persistent (keep-alive) HTTP connections to SPARQL endpoints.  Idle connections are kept per
+    endpoint (scheme, host and port) and reused by the next request to the same endpoint, so a pump run pays
+    connection setup once per pooled connection rather than once per query.  At most size idle connections are
+    kept for each endpoint.  Callers beyond size open additional connections, which are closed after use.  The
+    pool may be shared by threads.
+    """
+
+    def __init__(self, size=DEFAULT_POOL_SIZE):
+        self.size = size
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def _get_connection(self, key):
+        """
+        Return an idle connection for the endpoint, or a new one if none are idle
+        :return: list of connection and True if the connection was reused from the pool
+        """
+        import httplib
+        with self.lock:
+            connections = self.idle.get(key, [])
+            if len(connections) > 0:
+                return [connections.pop(), True]
+        scheme, host, port = key
+        if scheme == 'https':
+            return [httplib.HTTPSConnection(host, port), False]
+        return [httplib.HTTPConnection(host, port), False]
+
+    def _put_connection(self, key, connection):
+        """
+        Return a connection to the pool for reuse.  Close it if the pool for the endpoint is full
+        """
+        with self.lock:
+            connections = self.idle.setdefault(key, [])
+            if len(connections) < self.size:
+                connections.append(connection)
+                return
+        connection.close()
+
+    def post(self, url, fields, accept='application/sparql-results+json'):
+        """
+        POST form fields to url using a pooled connection
+        :param url: the endpoint URL
+        :param fields: list of name, value pairs to be form encoded
+        :param accept: the media type requested in the response
+        :return: list of status, reason and response body
+        """
+        import httplib
+        import socket
+        import urllib
+        import urllib2
+        import urlparse
+
+        parts = urlparse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        body = urllib.urlencode([(name, value.encode('utf-8') if isinstance(value, unicode) else value)
+                                 for name, value in fields])
+        headers = {'Content-Type': 'application/x-www-form-urlencoded', 'Accept': accept}
+        while True:
+            [connection, reused] = self._get_connection(key)
+            try:
+                connection.request('POST', path, body, headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (httplib.HTTPException, socket.error) as error:
+                connection.close()
+                if reused:
+                    continue  # The endpoint closed an idle keep-alive connection.  Retry on another one
+                raise urllib2.URLError(error)
+            if response.will_close:
+                connection.close()
+            else:
+                self._put_connection(key, connection)
+            return [response.status, response.reason, data]
+
+    def close(self):
+        """
+        Close all idle connections
+        """
+        with self.lock:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+            self.idle = {}
+
+
+_query_pool = QueryPool()
+
+
+def get_query_pool():
+    """
+    Return the query pool shared by all VIVO queries in this process
+    :return: the shared QueryPool
+    """
+    return _query_pool
+
+
+def set_query_pool_size(size):
+    """
+    Set the number of idle connections kept for each endpoint by the shared query pool.  The size is configured
+    once for the process, from the poolsize of its args
+    :param size: number of connections
+    :return: None
+    """
+    _query_pool.size = int(size)
+
+
 class UnicodeCsvReader(object):
     """
     From http://stackoverflow.com/questions/1846135/python-csv-
@@ -105,6 +307,126 @@ class UnicodeDictReader(csv.DictReader):
         self.reader = UnicodeCsvReader(f, encoding=encoding, **kwds)
 
 
+class PumpRow(collections.MutableMapping):
+    """
+    A row of a PumpTable.  Behaves as a dictionary of values keyed by column name.  Setting a value for a new column
+    adds the column to the table
+    """
+
+    __slots__ = ['table', 'position']
+
+    def __init__(self, table, position):
+        self.table = table
+        self.position = position
+
+    def __getitem__(self, name):
+        value = self.table.cells[name][self.position]
+        if value is _MISSING:
+            raise KeyError(name)
+        return value
+
+    def __setitem__(self, name, value):
+        if name not in self.table.cells:
+            self.table.add_column(name)
+        self.table.cells[name][self.position] = value
+
+    def __delitem__(self, name):
+        self[name]  # KeyError if no value
+        self.table.cells[name][self.position] = _MISSING
+
+    def __iter__(self):
+        return (name for name in self.table.columns if self.table.cells[name][self.position] is not _MISSING)
+
+    def __len__(self):
+        return sum(1 for name in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def copy(self):
+        """
+        :return: dictionary of the values of the row
+        """
+        return dict(self)
+
+
+class PumpTable(collections.MutableMapping):
+    """
+    A table of rows, stored by column, as read by read_csv.  Each column is a list of values, one per row, so the
+    column names are stored once rather than in every row.  Behaves as the dictionary of rows keyed by row number
+    that read_csv has always returned.  Each row is a PumpRow, a view of the table that behaves as a dictionary of
+    values keyed by column name.
+    """
+
+    def __init__(self, columns=None):
+        """
+        :param columns: optional list of column names
+        """
+        self.columns = []  # column names, in order
+        self.cells = {}  # column name -> list of values, by position
+        self.positions = {}  # row number -> position
+        self.size = 0  # number of positions, including those of rows deleted
+        for name in columns or []:
+            self.add_column(name)
+
+    def add_column(self, name):
+        """
+        Add a column.  Rows have no value for the column until one is set
+        :param name: column name
+        :return: None
+        """
+        if name not in self.cells:
+            self.columns.append(name)
+            self.cells[name] = [_MISSING] * self.size
+
+    def append(self, row_number, values):
+        """
+        Add a row from a list of values, one for each column in order
+        :param row_number: row number of the new row
+        :param values: list of values
+        :return: None
+        """
+        for name, value in zip(self.columns, values):
+            self.cells[name].append(value)
+        self.positions[row_number] = self.size
+        self.size += 1
+
+    def __getitem__(self, row_number):
+        return PumpRow(self, self.positions[row_number])
+
+    def __setitem__(self, row_number, row):
+        row = dict(row)
+        for name in row:
+            self.add_column(name)
+        if row_number not in self.positions:
+            self.append(row_number, [row.get(name, _MISSING) for name in self.columns])
+            return
+        position = self.positions[row_number]  # replace the values of the row in place
+        for name in self.columns:
+            self.cells[name][position] = row.get(name, _MISSING)
+
+    def __delitem__(self, row_number):
+        del self.positions[row_number]
+
+    def __contains__(self, row_number):
+        return row_number in self.positions
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.positions)
+
+    def keys(self):
+        """
+        :return: list of the row numbers, in order
+        """
+        return sorted(self.positions)
+
+    def __repr__(self):
+        return repr(dict((row_number, dict(row)) for row_number, row in self.items()))
+
+
 def read_csv(filename, skip=True, delimiter='|'):
     """
     Read a CSV file, return dictionary object
@@ -119,35 +441,16 @@ def read_csv(filename, skip=True, delimiter='|'):
     return data
 
 
-def read_csv_fp(fp, skip=True, delimiter="|"):
+def _read_csv_rows(fp, skip=True, delimiter="|"):
     """
-    Given a filename, read the CSV file with that name.  We use "|" as a
-    separator in CSV files to allow commas to appear in values.
-
-    CSV files read by this function follow these conventions:
-    --  use delimiter as a separator. Defaults to vertical bar.
-    --  have a first row that contains column headings.
-    --  all elements must have values.  To specify a missing value, use
-        the string "None" or "NULL" between separators, that is |None| or |NULL|
-    --  leading and trailing whitespace in values is ignored.  | The  | will be
-        read as "The"
-    -- if skip=True, rows with too many or too few data elements are skipped.
-       if skip=False, a RowError is thrown
-
-    CSV files processed by read_csv will be returned as a dictionary of
-    dictionaries, one dictionary per row keyed by an integer row number.  This supports
-    maintaining the order of the data input, which is important for some applications
+    Generate the rows of a CSV file pointer, following the conventions of read_csv_fp
+    :param fp: file pointer
+    :param skip: if True, skip rows with the wrong number of data elements.  If False, raise RowError
+    :param delimiter: field delimiter
+    :return: generator of heading, row number and list of values, one for each row of data
     """
-
-    class RowError(Exception):
-        """
-        Thrown when the number of data elements on a row in a CSV is not equal to the number of header elements
-        """
-        pass
-
     heading = []
     row_number = 0
-    data = {}
     for row in UnicodeCsvReader(fp, delimiter=delimiter):
         i = 0
         for r in row:
@@ -159,11 +462,7 @@ def read_csv_fp(fp, skip=True, delimiter="|"):
             continue
         row_number += 1
         if len(row) == len(heading):
-            data[row_number] = {}
-            i = 0
-            for r in row:
-                data[row_number][heading[i]] = r
-                i += 1
+            yield heading, row_number, row
         elif not skip:
             raise RowError("On row " + str(row_number) + ", expecting " +
                            str(len(heading)) + " data values. Found " +
@@ -171,6 +470,50 @@ def read_csv_fp(fp, skip=True, delimiter="|"):
                            str(row))
         else:
             pass  # row has wrong number of columns and skip is True
+
+
+def iter_csv_fp(fp, skip=True, delimiter="|"):
+    """
+    Read a CSV file pointer a row at a time.  The file follows the conventions of read_csv_fp.  Each row is
+    returned as it is read, so a filter can process its input in constant memory and write its output as it goes
+    :param fp: file pointer.  Could be stdin
+    :param skip: if True, skip rows with the wrong number of data elements.  If False, raise RowError
+    :param delimiter: field delimiter
+    :return: generator of row number and dictionary of values keyed by column name
+    """
+    for heading, row_number, row in _read_csv_rows(fp, skip=skip, delimiter=delimiter):
+        yield row_number, dict(zip(heading, row))
+
+
+def read_csv_fp(fp, skip=True, delimiter="|"):
+    """
+    Given a filename, read the CSV file with that name.  We use "|" as a
+    separator in CSV files to allow commas to appear in values.
+
+    CSV files read by this function follow these conventions:
+    --  use delimiter as a separator. Defaults to vertical bar.
+    --  have a first row that contains column headings.
+    --  all elements must have values.  To specify a missing value, use
+        the string "None" or "NULL" between separators, that is |None| or |NULL|
+    --  leading and trailing whitespace in values is ignored.  | The  | will be
+        read as "The"
+    -- if skip=True, rows with too many or too few data elements are skipped.
+       if skip=False, a RowError is thrown
+
+    CSV files processed by read_csv will be returned as a dictionary of
+    dictionaries, one dictionary per row keyed by an integer row number.  This supports
+    maintaining the order of the data input, which is important for some applications.  The dictionary is a
+    PumpTable, which stores the data by column
+    """
+
+    data = PumpTable()
+    for heading, row_number, row in _read_csv_rows(fp, skip=skip, delimiter=delimiter):
+        if len(data.columns) == 0:
+            data = PumpTable(heading)
+        if len(data.columns) == len(heading):
+            data.append(row_number, row)
+        else:
+            data[row_number] = zip(heading, row)  # heading repeats a column name.  The last value is used
     logger.debug("loader returns {} rows".format(len(data)))
     return data
 
@@ -189,10 +532,55 @@ def write_csv_fp(fp, data, delimiter='|'):
     var_names = data[data.keys()[0]].keys()
     fp.write(delimiter.join(var_names) + '\n')
 
+    if isinstance(data, PumpTable):
+        columns = [data.cells[x] for x in var_names]
+        for key in data.keys():
+            position = data.positions[key]
+            values = [column[position] for column in columns]
+            try:
+                fp.write(delimiter.join(values) + '\n')
+            except TypeError:
+                for name, value in zip(var_names, values):
+                    if value is _MISSING:
+                        raise KeyError("Row " + str(key) + " has no value for " + name)
+                raise
+        return
+
     for key in sorted(data.keys()):
         fp.write(delimiter.join([data[key][x] for x in var_names]) + '\n')
 
 
+class CsvRowWriter(object):
+    """
+    Write a CSV to a file pointer a row at a time.  The heading is written before the first row, from the columns
+    given, or from the names in the first row.  The file can be read by read_csv_fp
+    """
+
+    def __init__(self, fp, delimiter='|', columns=None):
+        """
+        :param fp: file pointer.  Could be stdout
+        :param delimiter: field delimiter for output
+        :param columns: optional list of column names, in order
+        """
+        self.fp = fp
+        self.delimiter = delimiter
+        self.columns = columns
+        self.count = 0  # rows written
+
+    def write(self, row):
+        """
+        Write a row
+        :param row: dictionary of values keyed by column name
+        :return: None
+        """
+        if self.count == 0:
+            if self.columns is None:
+                self.columns = row.keys()
+            self.fp.write(self.delimiter.join(self.columns) + '\n')
+        self.fp.write(self.delimiter.join([row[x] for x in self.columns]) + '\n')
+        self.count += 1
+
+
 def write_csv(filename, data, delimiter='|'):
     """
     Given a filename, a data structure as produced by read_csv and an optional
@@ -207,6 +595,10 @@ def write_csv(filename, data, delimiter='|'):
     :param delimiter: field delimiter.  Popular choices are '|', '\t' and ','
     :return:
     """
+    if isinstance(data, PumpTable):
+        with open(filename, 'w') as f:
+            write_csv_fp(f, data, delimiter=delimiter)
+        return
     with open(filename, 'w') as f:
         f.write(delimiter.join(data[data.keys()[0]].keys()) + '\n')
         for key in sorted(data.keys()):
@@ -261,7 +653,7 @@ def get_vivo_types(selector, parms, separator=';'):
     """
     q = query.replace("{{separator}}", separator)
     q = q.replace("{{selector}}", selector)
-    a = vivo_query(q, parms)
+    a = vivo_lookup(q, parms)
     types = [x['types']['value'] for x in a['results']['bindings']]
     uri = [x['uri']['value'] for x in a['results']['bindings']]
     return dict(zip(uri, types))
@@ -274,7 +666,7 @@ def get_vivo_ufid(parms):
     :return: dictionary of uri keyed by ufid
     """
     query = "select ?uri ?ufid where {?uri uf:ufid ?ufid .}"
-    a = vivo_query(query, parms)
+    a = vivo_lookup(query, parms)
     ufid = [x['ufid']['value'] for x in a['results']['bindings']]
     uri = [x['uri']['value'] for x in a['results']['bindings']]
     return dict(zip(ufid, uri))
@@ -287,7 +679,7 @@ def get_vivo_publishers(parms):
     :return: dictionary of uri keyed by simplified publisher name
     """
     query = "select ?uri ?label where {?uri a vivo:Publisher . ?uri rdfs:label ?label .}"
-    a = vivo_query(query, parms)
+    a = vivo_lookup(query, parms)
     label = [key_string(x['label']['value']) for x in a['results']['bindings']]
     uri = [x['uri']['value'] for x in a['results']['bindings']]
     return dict(zip(label, uri))
@@ -302,7 +694,7 @@ def get_vivo_journals(parms):
     :return: dictionary of uri keyed by ISSN
     """
     query = "select ?uri ?issn where {?uri bibo:issn ?issn .}"
-    a = vivo_query(query, parms)
+    a = vivo_lookup(query, parms)
     issn = [x['issn']['value'] for x in a['results']['bindings']]
     uri = [x['uri']['value'] for x in a['results']['bindings']]
     return dict(zip(issn, uri))
@@ -317,7 +709,7 @@ def get_vivo_ccn(parms):
     :return: dictionary of uri keyed by ccn
     """
     query = "select ?uri ?ccn where {?uri uf:ccn ?ccn .}"
-    a = vivo_query(query, parms)
+    a = vivo_lookup(query, parms)
     ccn = [x['ccn']['value'] for x in a['results']['bindings']]
     uri = [x['uri']['value'] for x in a['results']['bindings']]
     return dict(zip(ccn, uri))
@@ -331,7 +723,7 @@ def get_vivo_sponsorid(parms):
     """
 
     query = "select ?uri ?sponsorid where {?uri a vivo:FundingOrganization . ?uri ufVivo:sponsorID ?sponsorid .}"
-    a = vivo_query(query, parms)
+    a = vivo_lookup(query, parms)
     sponsorid = [x['sponsorid']['value'] for x in a['results']['bindings']]
     uri = [x['uri']['value'] for x in a['results']['bindings']]
     return dict(zip(sponsorid, uri))
@@ -357,7 +749,7 @@ def get_vivo_authors(parms):
         ?uri rdfs:label ?display_name .
     }
     """
-    a = vivo_query(query, parms)
+    a = vivo_lookup(query, parms)
     display_name = [x['display_name']['value'] for x in a['results']['bindings']]
     uri = [x['uri']['value'] for x in a['results']['bindings']]
     return dict(zip(display_name, uri))
@@ -380,7 +772,7 @@ def get_vivo_positions(parms):
       ?uri vivo:dateTimeInterval ?dti . ?dti vivo:start ?start . ?start vivo:dateTimeValue ?start_date .
     }
     """
-    a = vivo_query(query, parms)
+    a = vivo_lookup(query, parms)
     ufids = [x['ufid']['value'] for x in a['results']['bindings']]
     deptids = [x['deptid']['value'] for x in a['results']['bindings']]
     hr_titles = [x['hr_title']['value'] for x in a['results']['bindings']]
@@ -575,6 +967,117 @@ def read_update_def(filename, prefix):
     return update_def
 
 
+class Step(object):
+    """
+    A step of a compiled update_def path.  The values of the step definition used for each row and cell are found
+    once, when the step is compiled, and read as attributes
+    """
+
+    __slots__ = ['definition', 'predicate', 'single', 'boolean', 'include', 'name', 'type', 'label', 'literal',
+                 'datatype', 'lang', 'enum', 'filter', 'value', 'qualifier', 'multiple', 'last', 'closure',
+                 'column_name']
+
+    def __init__(self, step_def):
+        """
+        :param step_def: step definition from update_def
+        """
+        predicate = step_def.get('predicate', {})
+        step_object = step_def['object']
+        self.definition = step_def
+        self.predicate = predicate.get('ref')
+        self.single = predicate.get('single', True)  # True, False or 'boolean'
+        self.boolean = self.single == 'boolean'
+        self.include = predicate.get('include', [])
+        self.name = step_object.get('name')
+        self.type = step_object.get('type')
+        self.label = step_object.get('label')
+        self.literal = step_object.get('literal', False)
+        self.datatype = step_object.get('datatype')
+        if self.datatype is not None and self.datatype[:4] == 'xsd:':
+            self.datatype = self.datatype.replace('xsd:', 'http://www.w3.org/2001/XMLSchema#')
+        self.lang = step_object.get('lang')
+        self.enum = step_object.get('enum')
+        self.filter = step_object.get('filter')
+        self.value = step_object.get('value')
+        self.qualifier = step_object.get('qualifier')
+        self.multiple = step_object.get('multiple', False)
+        self.last = step_def.get('last', False)
+        self.closure = step_def.get('closure', False)
+        self.column_name = step_def.get('column_name')
+
+    def term(self, value):
+        """
+        :param value: string from source
+        :return: the rdflib term of the value -- either Literal or URIRef
+        """
+        from rdflib import Literal, URIRef
+        if self.literal:
+            return Literal(value, datatype=self.datatype, lang=self.lang)
+        return URIRef(value)
+
+    def __repr__(self):
+        return 'Step(' + repr(self.definition) + ')'
+
+
+class Column(object):
+    """
+    A compiled column_def or closure_def path
+    """
+
+    __slots__ = ['name', 'steps', 'path_length', 'leaf', 'values_step', 'unique', 'closure']
+
+    def __init__(self, name, path, closure=False):
+        """
+        :param name: column name
+        :param path: list of step definitions from update_def
+        :param closure: True if the path is a closure_def
+        """
+        self.name = name
+        self.steps = [Step(step_def) for step_def in path]
+        self.path_length = len(path)
+        self.leaf = self.steps[-1]
+        self.unique = all(step.single == True for step in self.steps)
+        self.closure = closure
+
+        #   The cardinality of the values in the column.  The predicate property "single" of a leaf has to do with
+        #   the semantic graph.  When the path to the leaf has a multiple predicate, its values are not boolean.
+
+        self.values_step = self.leaf
+        if self.leaf.boolean and any(step.single == False for step in self.steps[:-1]):
+            self.values_step = Step(path[-1])
+            self.values_step.single = False
+            self.values_step.boolean = False
+
+    def __repr__(self):
+        return 'Column(' + repr(self.name) + ', ' + repr([step.definition for step in self.steps]) + ')'
+
+
+class UpdatePlan(object):
+    """
+    An update_def compiled for get and update.  The update_def is unchanged
+    """
+
+    __slots__ = ['columns', 'column_defs', 'entity_type']
+
+    def __init__(self, update_def):
+        """
+        :param update_def: update_def as returned by read_update_def
+        """
+        self.column_defs = dict((name, Column(name, path)) for name, path in update_def['column_defs'].items())
+        self.columns = [self.column_defs[name] for name in update_def['column_defs'].keys()] + \
+            [Column(name, path, closure=True) for name, path in update_def.get('closure_defs', {}).items()]
+        self.entity_type = update_def['entity_def'].get('type')
+
+
+def compile_update_def(update_def):
+    """
+    Compile an update_def into an UpdatePlan of Columns and Steps
+    :param update_def: update_def as returned by read_update_def
+    :return: UpdatePlan.  columns are the column_defs, then the closure_defs.  column_defs are Columns by name
+    """
+    return UpdatePlan(update_def)
+
+
 def add_qualifiers(input_path):
     """
     Given an update_def input_path, generate the SPARQL fragment to express the qualifiers in the path, if any
@@ -596,33 +1099,55 @@ def gather_types(input_step, varname):
         return ''
 
 
+def step_suffix(following):
+    """
+    Given the number of steps following a step on a path, return the suffix of the SPARQL variables of the step in an
+    update query.  The leaf has no suffix, the step before it 1, and so on back to the entity
+    :param following: number of steps following the step
+    :return: suffix as string
+    """
+    return str(following) if following > 0 else ''
+
+
+def make_path_sparql(subject, path, step_sparql=None):
+    """
+    Given the name of the SPARQL variable of a subject and a path from the subject, return the SPARQL triple patterns
+    of the path.  Each object is the variable named by its step.  Paths may have any length.
+    :param subject: name of the variable of the subject, without the ?
+    :param path: list of steps from update_def
+    :param step_sparql: optional function of a step and the number of steps following it, returning SPARQL to
+    follow the triple pattern of the step, such as a type restriction
+    :return: SPARQL fragment as string
+    """
+    if len(path) == 0:
+        return ''
+    step = path[0]
+    name = step['object']['name']
+    sparql = '?' + subject + ' <' + str(step['predicate']['ref']) + '> ?' + name + ' . '
+    if step_sparql is not None:
+        sparql += step_sparql(step, len(path) - 1)
+    return sparql + make_path_sparql(name, path[1:], step_sparql)
+
+
 def make_update_query(entity_sparql, path):
     """
     Given a path from an update_def data structure, generate the query needed to pull the triples from VIVO that might
-    be updated.  Here's what the queries look like (psuedo code) by path length
+    be updated.  Each step of the path is a predicate, object and object type, numbered from the leaf back to the
+    entity.  Paths may have any length.  Here's what the queries look like (psuedo code) by path length
 
     Path length 1 example:
 
-            select ?uri (vivo:subOrganizationWithin as ?p) (?column_name as ?o)
+            select ?uri (vivo:subOrganizationWithin as ?p) (?column_name as ?o) ?t
             where {
                 ... entity sparql goes here ...
                 ?uri vivo:subOrganizationWithin ?column_name .  # ?uri ?p ?o
             }
 
-    Path Length 2 example:
-
-            select ?uri (vivo:webpage as ?p1) (?column_name_1 as ?o1) (vivo:linkURI as ?p) (?column_name as ?o)
-            where {
-                ... entity sparql goes here ...
-                ?uri vivo:webpage ?column_name_1 .           # ?uri ?p1 ?o1
-                ?column_name_1 vivo:linkURI ?column_name .   # ?o1 ?p ?o
-            }
-
     Path length 3 example:
 
-            select ?uri (vivo:dateTimeInterval as ?p2) (?column_name_2 as ?o2) (vivo:end as ?p1)
-                                                            (?column_name_1 as ?o1) (vivo:dateTime as ?p)
-                                                            (?column_name as ?o)
+            select ?uri (vivo:dateTimeInterval as ?p2) (?column_name_2 as ?o2) ?t2 (vivo:end as ?p1)
+                                                            (?column_name_1 as ?o1) ?t1 (vivo:dateTime as ?p)
+                                                            (?column_name as ?o) ?t
             where {
                 ... entity sparql goes here ...
                 ?uri vivo:dateTimeInterval ?column_name_2 .  # ?uri ?p2 ?o2
@@ -632,35 +1157,16 @@ def make_update_query(entity_sparql, path):
 
     :return: a sparql query string
     """
-    query = ""
-    if len(path) == 1:
-        query = 'select ?uri (<' + str(path[0]['predicate']['ref']) + '> as ?p) (?' + path[0]['object']['name'] + \
-                ' as ?o) ?t\n' + \
-                '    where { ' + entity_sparql + '\n    ?uri <' + str(path[0]['predicate']['ref']) + '> ?' + \
-                path[0]['object']['name'] + \
-                ' . ' + gather_types(path[0], 't') + add_qualifiers(path) + ' \n}'
-    elif len(path) == 2:
-        query = 'select ?uri (<' + str(path[0]['predicate']['ref']) + '> as ?p1) ' + \
-                '(?' + path[0]['object']['name'] + ' as ?o1) ?t1 (<' + \
-                str(path[1]['predicate']['ref']) + '> as ?p) (?' + path[1]['object']['name'] + ' as ?o) ?t\n' + \
-                '    where { ' + entity_sparql + '\n    ?uri <' + str(path[0]['predicate']['ref']) + '> ?' + \
-                path[0]['object']['name'] + ' . ' + gather_types(path[0], 't1') + '?' + \
-                path[0]['object']['name'] + ' <' + str(path[1]['predicate']['ref']) + '> ?' + \
-                path[1]['object']['name'] + ' . ' + gather_types(path[1], 't') + add_qualifiers(path) + ' \n}'
-    elif len(path) == 3:
-        query = 'select ?uri (<' + str(path[0]['predicate']['ref']) + '> as ?p2) ' + \
-                '(?' + path[0]['object']['name'] + ' as ?o2) ?t2 (<' + str(path[1]['predicate']['ref']) + \
-                '> as ?p1) (?' + path[1]['object']['name'] + ' as ?o1) ?t1 (<' + str(path[2]['predicate']['ref']) + \
-                '> as ?p) (?' + path[2]['object']['name'] + ' as ?o)  ?t\n' + \
-                'where { ' + entity_sparql + '\n    ?uri <' + \
-                str(path[0]['predicate']['ref']) + '> ?' + path[0]['object']['name'] + ' . ' + \
-                gather_types(path[0], 't2') + ' ?' + \
-                path[0]['object']['name'] + ' <' + str(path[1]['predicate']['ref']) + '> ?' + \
-                path[1]['object']['name'] + ' . ' + gather_types(path[1], 't1') + ' ?' + \
-                path[1]['object']['name'] + ' <' + \
-                str(path[2]['predicate']['ref']) + '> ?' + path[2]['object']['name'] + ' . ' + \
-                gather_types(path[2], 't') + add_qualifiers(path) + ' \n}'
-    return query
+    if len(path) == 0:
+        return ""
+    select = ''
+    for i, step in enumerate(path):
+        suffix = step_suffix(len(path) - i - 1)
+        select += ' (<' + str(step['predicate']['ref']) + '> as ?p' + suffix + ') (?' + step['object']['name'] + \
+            ' as ?o' + suffix + ') ?t' + suffix
+    return 'select ?uri' + select + '\n    where { ' + entity_sparql + '\n    ' + \
+        make_path_sparql('uri', path, lambda step, following: gather_types(step, 't' + step_suffix(following))) + \
+        add_qualifiers(path) + ' \n}'
 
 
 def make_rdf_term(row_term):
@@ -680,115 +1186,799 @@ def make_rdf_term(row_term):
     return rdf_term
 
 
-def get_graph(update_def, query_parms):
+def get_column_triples(entity_sparql, path, query_parms):
+    """
+    Given the entity_sparql and the path of a column, query VIVO and return the triples on the path
+    :param entity_sparql: SPARQL selecting the entities of the update
+    :param path: a column_def or closure_def path
+    :param query_parms: dictionary with queryuri, username, password and prefix
+    :return: list of triples
     """
-    Given the update def, get a graph from VIVO of the triples eligible for updating
+    from rdflib import URIRef, RDF
+
+    triples = []
+    update_query = make_update_query(entity_sparql, path)
+    if len(update_query) == 0:
+        return triples
+    order = ['uri']
+    suffixes = [step_suffix(len(path) - i - 1) for i in range(len(path))]
+    for step, suffix in zip(path, suffixes):
+        order += [step['object']['name'], 't' + suffix]
+    for row in vivo_query_pages(update_query, query_parms, order):
+
+        #   Each row is a path from the entity to the leaf.  The object of each step is the subject of the next.
+        #   Steps not in the row are skipped
+
+        s = URIRef(row['uri']['value'])
+        for suffix in suffixes:
+            if 'p' + suffix not in row or 'o' + suffix not in row:
+                continue
+            o = make_rdf_term(row['o' + suffix])
+            triples.append((s, URIRef(row['p' + suffix]['value']), o))
+            if 't' + suffix in row:
+                triples.append((o, RDF.type, make_rdf_term(row['t' + suffix])))
+            s = o
+    return triples
+
+
+def add_values_clause(entity_sparql, uris):
+    """
+    Given entity_sparql, return entity_sparql restricted to the entities with the given uris
+    :param entity_sparql: SPARQL selecting the entities of the update
+    :param uris: list of uri
+    :return: SPARQL fragment as string
+    """
+    return 'VALUES ?uri { ' + ' '.join('<' + str(uri) + '>' for uri in uris) + ' }\n    ' + entity_sparql
+
+
+def get_graph(update_def, query_parms, uris=None):
+    """
+    Given the update def, get a graph from VIVO of the triples eligible for updating.  If query_parms has
+    fetchworkers greater than one, the column queries are run and parsed concurrently by that many threads.  The
+    graph is only written by the calling thread.
+    :param uris: optional list of uri.  If given, only the triples of these entities are returned
     :return: graph of triples
     """
 
-    from rdflib import Graph, URIRef, RDF
+    from rdflib import Graph, URIRef
+    from multiprocessing.pool import ThreadPool
+    import time
 
     a = Graph()
+    entity_sparql = update_def['entity_def']['entity_sparql']
+    if uris is not None:
+        if len(uris) == 0:
+            return a
+        entity_sparql = add_values_clause(entity_sparql, uris)
     entity_query = 'select ?uri (<http://www.w3.org/1999/02/22-rdf-syntax-ns#type> as ?p) (<' + \
         str(update_def['entity_def']['type']) + '> as ?o)\nwhere {\n    ' + \
-        update_def['entity_def']['entity_sparql'] + '\n}'
-    result = vivo_query(entity_query, query_parms)
-    for row in result['results']['bindings']:
+        entity_sparql + '\n}'
+    for row in vivo_query_pages(entity_query, query_parms, ['uri']):
         s = URIRef(row['uri']['value'])
         p = URIRef(row['p']['value'])
         o = make_rdf_term(row['o'])
         a.add((s, p, o))
-    for column_name, path in update_def['column_defs'].items() + \
-            update_def.get('closure_defs', {}).items():
-        update_query = make_update_query(update_def['entity_def']['entity_sparql'], path)
-        if len(update_query) == 0:
-            continue
-        result = vivo_query(update_query, query_parms)
-        for row in result['results']['bindings']:
-            if 'p2' in row and 'o2' in row:
-                uri = URIRef(row['uri']['value'])
-                p2 = URIRef(row['p2']['value'])
-                o2 = make_rdf_term(row['o2'])
-                a.add((uri, p2, o2))
-                if 't2' in row:
-                    a.add((o2, RDF.type, make_rdf_term(row['t2'])))
-                p1 = URIRef(row['p1']['value'])
-                o1 = make_rdf_term(row['o1'])
-                a.add((o2, p1, o1))
-                if 't1' in row:
-                    a.add((o1, RDF.type, make_rdf_term(row['t1'])))
-                p = URIRef(row['p']['value'])
-                o = make_rdf_term(row['o'])
-                a.add((o1, p, o))
-                if 't' in row:
-                    a.add((o, RDF.type, make_rdf_term(row['t'])))
-            elif 'p1' in row and 'o1' in row:
-                uri = URIRef(row['uri']['value'])
-                p1 = URIRef(row['p1']['value'])
-                o1 = make_rdf_term(row['o1'])
-                a.add((uri, p1, o1))
-                if 't1' in row:
-                    a.add((o1, RDF.type, make_rdf_term(row['t1'])))
-                p = URIRef(row['p']['value'])
-                o = make_rdf_term(row['o'])
-                a.add((o1, p, o))
-                if 't' in row:
-                    a.add((o, RDF.type, make_rdf_term(row['t'])))
-            elif 'p' in row and 'o' in row:
-                uri = URIRef(row['uri']['value'])
-                p = URIRef(row['p']['value'])
-                o = make_rdf_term(row['o'])
-                a.add((uri, p, o))
-                if 't' in row:
-                    a.add((o, RDF.type, make_rdf_term(row['t'])))
-
-        logger.debug(u"Triples in original graph {}".format(len(a)))
+
+    def fetch_column(column):
+        column_name, path = column
+        start = time.time()
+        triples = get_column_triples(entity_sparql, path, query_parms)
+        return column_name, triples, time.time() - start
+
+    columns = update_def['column_defs'].items() + update_def.get('closure_defs', {}).items()
+    workers = min(int(query_parms.get('fetchworkers') or DEFAULT_FETCH_WORKERS), max(len(columns), 1))
+    if workers > 1:
+        pool = ThreadPool(workers)
+        fetched = pool.imap_unordered(fetch_column, columns)
+    else:
+        pool = None
+        fetched = (fetch_column(column) for column in columns)
+    try:
+        for column_name, triples, elapsed in fetched:
+            for triple in triples:
+                a.add(triple)
+            logger.info(u"Column {} fetched {} triples in {:.2f} seconds".format(column_name, len(triples),
+                                                                                  elapsed))
+            logger.debug(u"Triples in original graph {}".format(len(a)))
+    finally:
+        if pool is not None:
+            pool.terminate()
     return a
 
 
+class StepIndex(object):
+    """
+    An index of the objects of each subject and predicate of a graph, for stepping along update paths with
+    dictionary lookups.  Subjects are indexed from the graph when first used.  The owner of the graph keeps the index
+    current with add and discard.
+    """
+
+    def __init__(self, graph):
+        """
+        :param graph: the graph to index.  rdflib Graph or OverlayGraph
+        """
+        self.graph = graph
+        self.subjects = {}  # subject -> predicate -> set of objects
+
+    def predicates(self, subject):
+        """
+        :return: dictionary of the objects of the subject by predicate.  Not to be modified
+        """
+        predicates = self.subjects.get(subject)
+        if predicates is None:
+            predicates = {}
+            for s, p, o in self.graph.triples((subject, None, None)):
+                predicates.setdefault(p, set()).add(o)
+            self.subjects[subject] = predicates
+        return predicates
+
+    def objects(self, subject, predicate):
+        """
+        :return: set of the objects of the subject and predicate.  Not to be modified
+        """
+        return self.predicates(subject).get(predicate, frozenset())
+
+    def has_type(self, obj, otype):
+        """
+        :return: True if obj has rdf:type otype
+        """
+        from rdflib import RDF
+        return otype in self.objects(obj, RDF.type)
+
+    def add(self, triple):
+        """
+        Record a triple added to the graph
+        """
+        s, p, o = triple
+        if s in self.subjects:
+            self.subjects[s].setdefault(p, set()).add(o)
+
+    def discard(self, triple):
+        """
+        Record a triple removed from the graph
+        """
+        s, p, o = triple
+        if s in self.subjects:
+            self.subjects[s].get(p, set()).discard(o)
+
+
+class OverlayGraph(object):
+    """
+    A graph of changes to a base graph.  Reads see the base graph with the changes applied.  Adds and removes are
+    recorded as changes and never alter the base graph, so the update needs no copy of the base graph, and its add
+    and sub graphs are the recorded changes themselves, not copies of them.  Supports the subset of rdflib Graph
+    used by the pump, and keeps a StepIndex of itself.
+    """
+
+    def __init__(self, base):
+        """
+        :param base: rdflib Graph.  Not modified by the overlay
+        """
+        from rdflib import Graph
+        self.base = base
+        self.added = Graph()  # triples not in base
+        self.removed = Graph()  # triples of base
+        self.index = StepIndex(self)
+
+    def add(self, triple):
+        """
+        Add a triple to the graph
+        :param triple: (s, p, o)
+        :return: None
+        """
+        if triple in self.removed:
+            self.removed.remove(triple)
+        elif triple not in self.base:
+            self.added.add(triple)
+        self.index.add(triple)
+
+    def remove(self, pattern):
+        """
+        Remove the triples matching a pattern from the graph.  None matches any term
+        :param pattern: (s, p, o)
+        :return: None
+        """
+        for triple in self.triples(pattern):
+            if triple in self.added:
+                self.added.remove(triple)
+            else:
+                self.removed.add(triple)
+            self.index.discard(triple)
+
+    def triples(self, pattern):
+        """
+        Return the triples matching a pattern.  The triples are gathered before they are returned, so the graph may be
+        changed while iterating over them
+        :param pattern: (s, p, o)
+        :return: iterator of triples
+        """
+        found = [x for x in self.base.triples(pattern) if x not in self.removed]
+        found.extend(self.added.triples(pattern))
+        return iter(found)
+
+    def objects(self, subject=None, predicate=None):
+        """
+        Return the objects of the triples with the subject and predicate
+        """
+        return (o for s, p, o in self.triples((subject, predicate, None)))
+
+    def __contains__(self, pattern):
+        if pattern in self.added:
+            return True
+        if None not in pattern:
+            return pattern not in self.removed and pattern in self.base
+        for triple in self.base.triples(pattern):
+            if triple not in self.removed:
+                return True
+        return False
+
+    def __len__(self):
+        return len(self.base) - len(self.removed) + len(self.added)
+
+    def __iter__(self):
+        return self.triples((None, None, None))
+
+    def add_graph(self):
+        """
+        :return: graph of the triples in this graph that are not in the base graph.  The graph of recorded adds
+        """
+        return self.added
+
+    def sub_graph(self):
+        """
+        :return: graph of the triples in the base graph that are not in this graph.  The graph of recorded removes
+        """
+        return self.removed
+
+
+def external_sort(items, run_size=DEFAULT_SORT_RUN_SIZE):
+    """
+    Sort items, holding at most run_size items in memory.  Larger inputs are sorted in runs of run_size items,
+    written to temporary files, and merged.  Items must be picklable
+    :param items: iterable of items
+    :param run_size: number of items sorted in memory
+    :return: generator of the items in sorted order
+    """
+    import heapq
+    import tempfile
+    import cPickle
+
+    def read_run(run):
+        run.seek(0)
+        while True:
+            try:
+                yield cPickle.load(run)
+            except EOFError:
+                return
+
+    runs = []
+    run_items = []
+    try:
+        for item in items:
+            run_items.append(item)
+            if len(run_items) >= run_size:
+                run = tempfile.TemporaryFile()
+                for run_item in sorted(run_items):
+                    cPickle.dump(run_item, run, cPickle.HIGHEST_PROTOCOL)
+                runs.append(run)
+                run_items = []
+        run_items.sort()
+        for item in heapq.merge(run_items, *[read_run(run) for run in runs]):
+            yield item
+    finally:
+        for run in runs:
+            run.close()
+
+
+def nt_line(triple):
+    """
+    Format a triple as a line of an N-Triples file.  Literals are quoted and characters that are not ASCII are
+    escaped as N-Triples requires
+    :param triple: (s, p, o)
+    :return: ASCII string of the line, ending with a newline
+    """
+    from rdflib import Literal
+    terms = []
+    for term in triple:
+        if isinstance(term, Literal):
+            text = u'"' + term.replace(u'\\', u'\\\\').replace(u'\n', u'\\n').replace(u'"', u'\\"')\
+                .replace(u'\r', u'\\r') + u'"'
+            if term.language:
+                text += u'@' + term.language
+            elif term.datatype:
+                text += u'^^<' + term.datatype + u'>'
+            terms.append(text)
+        else:
+            terms.append(term.n3())
+    line = u' '.join(terms) + u' .\n'
+    try:
+        return line.encode('ascii')
+    except UnicodeEncodeError:
+        return NON_ASCII_PATTERN.sub(_nt_escape, line).encode('ascii')
+
+
+def _nt_escape(match):
+    """
+    :return: the N-Triples escape of a character that is not ASCII.  A surrogate pair of a narrow build of python
+    is one character
+    """
+    c = match.group()
+    code = ord(c) if len(c) == 1 else 0x10000 + ((ord(c[0]) - 0xD800) << 10) + ord(c[1]) - 0xDC00
+    return (u'\\u%04X' if code <= 0xFFFF else u'\\U%08X') % code
+
+
+class NTriplesWriter(object):
+    """
+    Write triples to an N-Triples file as they are produced, rather than serializing a whole graph in memory.
+    Optionally gzip the file.  Optionally sort the file and remove duplicate triples.  Sorting holds at most
+    run_size lines in memory, writing sorted runs to temporary files and merging them when the writer is closed.
+    """
+
+    def __init__(self, filename, compress=False, sort=False, run_size=DEFAULT_SORT_RUN_SIZE):
+        """
+        :param filename: name of the file to write
+        :param compress: if True, the file is gzipped
+        :param sort: if True, the triples are sorted and duplicates removed
+        :param run_size: the number of lines sorted in memory
+        """
+        import gzip
+        self.file = gzip.open(filename, 'wb') if compress else open(filename, 'wb')
+        self.sort = sort
+        self.run_size = run_size
+        self.lines = []
+        self.runs = []
+        self.count = 0
+
+    def write(self, triple):
+        """
+        Write a triple
+        :param triple: (s, p, o)
+        :return: None
+        """
+        line = nt_line(triple)
+        if not self.sort:
+            self.file.write(line)
+            self.count += 1
+            return
+        self.lines.append(line)
+        if len(self.lines) >= self.run_size:
+            self.__write_run()
+
+    def write_graph(self, graph):
+        """
+        Write the triples of a graph
+        :param graph: rdflib Graph, or any iterable of triples
+        :return: None
+        """
+        for triple in graph:
+            self.write(triple)
+
+    def __write_run(self):
+        import tempfile
+        run = tempfile.TemporaryFile()
+        run.writelines(sorted(set(self.lines)))
+        run.seek(0)
+        self.runs.append(run)
+        self.lines = []
+
+    def close(self):
+        """
+        Finish writing the file.  Sorted runs are merged into the file, removing duplicate triples
+        :return: None
+        """
+        import heapq
+        if self.sort:
+            last = None
+            for line in heapq.merge(sorted(set(self.lines)), *self.runs):
+                if line != last:
+                    self.file.write(line)
+                    self.count += 1
+                    last = line
+            for run in self.runs:
+                run.close()
+            self.lines = []
+            self.runs = []
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class UriAllocator(object):
+    """
+    Allocate unused VIVO URIs in blocks.  Each block of random candidate URIs is checked against VIVO with a single
+    query.  Every candidate the allocator has checked is remembered, so a URI is never handed out twice in a run,
+    even before the triples using it reach VIVO.
+    """
+
+    def __init__(self, parms, block_size=DEFAULT_URI_BLOCK_SIZE):
+        """
+        :param parms: dictionary with queryuri, username, password and uriprefix
+        :param block_size: number of URIs reserved by each query to VIVO
+        """
+        self.parms = parms
+        self.block_size = block_size
+        self.seen = set()
+        self.available = collections.deque()
+
+    def new_uri(self):
+        """
+        Return a URI not in VIVO and not previously returned by this allocator
+        :rtype: basestring
+        """
+        if len(self.available) == 0:
+            self.reserve(self.block_size)
+        return self.available.popleft()
+
+    def reserve(self, n):
+        """
+        Add at least n unused URIs to the URIs available from the allocator.  At least a block of candidates is
+        checked at a time, VALUES_BATCH_SIZE candidates to a query
+        :param n: number of URIs to reserve
+        :return: None
+        """
+        n += len(self.available)
+        while len(self.available) < n:
+            candidates = []
+            while len(candidates) < max(n - len(self.available), self.block_size):
+                candidate = self.parms['uriprefix'] + str(random.randint(1, 9999999999))
+                if candidate not in self.seen:
+                    self.seen.add(candidate)
+                    candidates.append(candidate)
+            for i in range(0, len(candidates), VALUES_BATCH_SIZE):
+                batch = candidates[i:i + VALUES_BATCH_SIZE]
+                query = "SELECT DISTINCT ?uri WHERE {\n    VALUES ?uri { <" + '> <'.join(batch) + "> }\n" + \
+                    "    ?uri ?p ?o .\n}"
+                result = vivo_query(query, self.parms)
+                used = set([x['uri']['value'] for x in result['results']['bindings']])
+                self.available.extend(x for x in batch if x not in used)
+        logger.debug(u"{} new uri available".format(len(self.available)))
+
+
 def new_uri(parms):
     """
-    Find an unused VIVO URI in the VIVO defined by the parms
+    Find an unused VIVO URI in the VIVO defined by the parms.  To create many URIs, use a UriAllocator
     :param parms: dictionary with queryuri, username, password and uriprefix
     :return: a URI not in VIVO
     """
-    test_uri = ""
-    while True:
-        test_uri = parms['uriprefix'] + str(random.randint(1, 9999999999))
-        query = """
-            SELECT (COUNT(?z) AS ?count) WHERE {
-            <""" + test_uri + """> ?y ?z
-            }"""
-        response = vivo_query(query, parms)
-        if int(response["results"]["bindings"][0]['count']['value']) == 0:
-            break
-    return test_uri
+    return UriAllocator(parms, block_size=1).new_uri()
+
+
+def check_response(url, status, reason, data):
+    """
+    Given the status of a response from a SPARQL endpoint, raise the exception SPARQLWrapper would raise for
+    the same failure.
+    :return: None
+    """
+    from SPARQLWrapper import SPARQLExceptions
+    import urllib2
+
+    if 200 <= status < 300:
+        return None
+    elif status == 400:
+        raise SPARQLExceptions.QueryBadFormed(data)
+    elif status == 404:
+        raise SPARQLExceptions.EndPointNotFound(data)
+    elif status == 500:
+        raise SPARQLExceptions.EndPointInternalError(data)
+    else:
+        raise urllib2.HTTPError(url, status, reason, None, None)
 
 
 def vivo_query(query, parms):
     """
-    A new VIVO query function using SPARQLWrapper.  Tested with Stardog, UF VIVO and Dbpedia
+    A new VIVO query function.  Queries are sent over the persistent connections of the shared query pool.
+    Tested with Stardog, UF VIVO and Dbpedia
     :param query: SPARQL query.  VIVO PREFIX will be added
     :param parms: dictionary with query parms:  queryuri, username and password
     :return: result object, typically JSON
     :rtype: dict
     """
-    from SPARQLWrapper import SPARQLWrapper, JSON
+    import json
 
-    logger.debug(u"in vivo_query\n{}".format(parms))
-    sparql = SPARQLWrapper(parms['queryuri'])
+    logger.debug(LazyFormat(u"in vivo_query\n{}", parms))
     new_query = parms['prefix'] + '\n' + query
-    sparql.setQuery(new_query)
     logger.debug(new_query)
-    sparql.setReturnFormat(JSON)
-    sparql.addParameter("email", parms['username'])
-    sparql.addParameter("password", parms['password'])
-    # sparql.setCredentials(parms['username'], parms['password'])
-    results = sparql.query()
-    results = results.convert()
+    [status, reason, data] = get_query_pool().post(parms['queryuri'], [('query', new_query),
+                                                                      ('email', parms['username']),
+                                                                      ('password', parms['password'])])
+    check_response(parms['queryuri'], status, reason, data)
+    results = json.loads(data)
+    return results
+
+
+def _lookup_key(query, parms):
+    """
+    :return: the lookup cache key of a query.  The key depends on the endpoint and the full query text
+    """
+    import hashlib
+
+    text = parms['queryuri'] + '\n' + parms['prefix'] + '\n' + query
+    return hashlib.sha1(text.encode('utf-8') if isinstance(text, unicode) else text).hexdigest()
+
+
+class _LockedShelf(object):
+    """
+    A shelve opened while holding an exclusive lock on a lock file beside it.  Filters of a shell pipeline share the
+    lookup cache, and the dbm modules do not support concurrent writers, so the cache is opened by one process at a
+    time:  with _LockedShelf(file_name) as cache: ...
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.lock_fp = None
+        self.cache = None
+
+    def __enter__(self):
+        import fcntl
+        import shelve
+
+        self.lock_fp = open(self.file_name + '.lock', 'a')
+        try:
+            fcntl.flock(self.lock_fp.fileno(), fcntl.LOCK_EX)
+            self.cache = shelve.open(self.file_name)
+        except:
+            self.lock_fp.close()
+            raise
+        return self.cache
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self.cache.close()
+        finally:
+            self.lock_fp.close()  # closing the lock file releases the lock
+
+
+class _KeyLock(object):
+    """
+    An exclusive lock on one key of the lookup cache, held by one process at a time while it looks up the key and
+    queries VIVO.  Each key locks one byte of a lock file beside the cache, so lookups of other keys are not
+    blocked:  with _KeyLock(file_name, key): ...
+    """
+
+    def __init__(self, file_name, key):
+        self.file_name = file_name
+        self.offset = int(key[:8], 16)
+        self.lock_fp = None
+
+    def __enter__(self):
+        import fcntl
+
+        self.lock_fp = open(self.file_name + '.keys.lock', 'a')
+        try:
+            fcntl.lockf(self.lock_fp.fileno(), fcntl.LOCK_EX, 1, self.offset)
+        except:
+            self.lock_fp.close()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.lock_fp.close()  # closing the lock file releases the lock
+
+
+def vivo_lookup(query, parms):
+    """
+    A vivo_query whose results are kept in the lookup cache, a shelve named by parms['lookupcache'].  A result is
+    used until it is lookupttl seconds old, so filters query VIVO once for each lookup.  With no lookupcache, the
+    query is sent to VIVO.  The cache is locked while it is read and written.  The key of the query is locked while
+    it is looked up, so filters running at the same time wait for the first to query VIVO and use its result
+    :param query: SPARQL query.  VIVO PREFIX will be added
+    :param parms: dictionary with query parms:  queryuri, username and password.  Optional lookupcache and lookupttl
+    :return: result object, typically JSON
+    :rtype: dict
+    """
+    import time
+
+    if not parms.get('lookupcache'):
+        return vivo_query(query, parms)
+    key = _lookup_key(query, parms)
+    ttl = int(parms.get('lookupttl', DEFAULT_LOOKUP_TTL))
+    with _KeyLock(parms['lookupcache'], key):
+        with _LockedShelf(parms['lookupcache']) as cache:
+            entry = cache.get(key)
+        if entry is not None and time.time() - entry['time'] < ttl:
+            logger.debug(u"Lookup cache hit {}".format(key))
+            return entry['results']
+        results = vivo_query(query, parms)
+        with _LockedShelf(parms['lookupcache']) as cache:
+            cache[key] = {'time': time.time(), 'endpoint': parms['queryuri'], 'results': results}
     return results
 
 
+def invalidate_lookup_cache(parms):
+    """
+    Remove the results of the endpoint parms['queryuri'] from the lookup cache.  Use when VIVO has been updated
+    :param parms: dictionary with query parms:  queryuri and optional lookupcache
+    :return: number of results removed
+    """
+    if not parms.get('lookupcache'):
+        return 0
+    with _LockedShelf(parms['lookupcache']) as cache:
+        keys = [key for key in cache.keys() if cache[key]['endpoint'] == parms['queryuri']]
+        for key in keys:
+            del cache[key]
+    logger.info(u"{} results removed from lookup cache {}".format(len(keys), parms['lookupcache']))
+    return len(keys)
+
+
+def vivo_query_pages(query, parms, order):
+    """
+    Generate the bindings of a VIVO query, a page at a time.  The query is sent repeatedly with LIMIT and OFFSET,
+    ordered by all the variables in order so that the pages do not overlap.  With a pagesize of 0, the query is
+    sent once.
+    :param query: SPARQL query with no ORDER BY, LIMIT or OFFSET.  VIVO PREFIX will be added
+    :param parms: dictionary with query parms:  queryuri, username and password.  Optional pagesize, by default
+        DEFAULT_PAGE_SIZE
+    :param order: list of the names of the variables of the query, giving a total order to its results
+    :return: generator of bindings
+    """
+    page_size = parms.get('pagesize')
+    page_size = DEFAULT_PAGE_SIZE if page_size is None or page_size == '' else int(page_size)
+    if page_size <= 0:
+        for binding in vivo_query(query, parms)['results']['bindings']:
+            yield binding
+        return
+    page_query = query + '\nORDER BY ?' + ' ?'.join(order) + '\nLIMIT ' + str(page_size) + '\nOFFSET '
+    offset = 0
+    while True:
+        bindings = vivo_query(page_query + str(offset), parms)['results']['bindings']
+        logger.debug(u"Page at offset {} has {} rows".format(offset, len(bindings)))
+        for binding in bindings:
+            yield binding
+        if len(bindings) < page_size:
+            break
+        offset += page_size
+
+
+def vivo_update(update, parms):
+    """
+    Send a SPARQL update to VIVO over the persistent connections of the shared query pool
+    :param update: SPARQL update
+    :param parms: dictionary with query parms:  updateuri, username and password
+    :return: None
+    """
+    [status, reason, data] = get_query_pool().post(parms['updateuri'], [('update', update),
+                                                                       ('email', parms['username']),
+                                                                       ('password', parms['password'])],
+                                                   accept='*/*')
+    check_response(parms['updateuri'], status, reason, data)
+
+
+def read_nt_batches(filename, batch_size):
+    """
+    Read an N-Triples file, gzipped if the filename ends with .gz, in batches of lines
+    :param filename: name of the file
+    :param batch_size: number of triples in each batch
+    :return: generator of lists of lines
+    """
+    import gzip
+    nt_file = gzip.open(filename, 'rb') if filename.endswith('.gz') else open(filename, 'rb')
+    try:
+        batch = []
+        for line in nt_file:
+            if line.strip() == '':
+                continue
+            batch.append(line)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if len(batch) > 0:
+            yield batch
+    finally:
+        nt_file.close()
+
+
+def make_checkpoint_header(add_filename, sub_filename, batch_size):
+    """
+    :return: the first line of the checkpoint file of an apply.  It records the batch size and the size and
+        modification time of the add and sub files, which the batch ids of the checkpoint refer to
+    """
+    import os
+
+    parts = ['#', 'batch_size', str(batch_size)]
+    for name, filename in [('sub', sub_filename), ('add', add_filename)]:
+        stat = os.stat(filename)
+        parts += [name, str(stat.st_size), repr(stat.st_mtime)]
+    return ' '.join(parts)
+
+
+def read_checkpoint(checkpoint_filename, add_filename, sub_filename, batch_size):
+    """
+    :return: set of the ids of the batches recorded in the checkpoint file of an apply, or None if there is no
+        checkpoint file, or it was written for other add or sub files or another batch size
+    """
+    import os
+
+    if not os.path.exists(checkpoint_filename):
+        return None
+    lines = [line.strip() for line in open(checkpoint_filename)]
+    if len(lines) == 0 or lines[0] != make_checkpoint_header(add_filename, sub_filename, batch_size):
+        return None
+    return set(lines[1:])
+
+
+def apply_update_files(add_filename, sub_filename, parms, graph_uri=DEFAULT_GRAPH_URI,
+                       batch_size=DEFAULT_BATCH_SIZE, workers=1, checkpoint_filename=None,
+                       retries=DEFAULT_RETRIES, retry_delay=1.0):
+    """
+    Apply the add and sub files of an update to VIVO with SPARQL DELETE DATA and INSERT DATA updates of batch_size
+    triples each.  Add and sub triples are disjoint, so workers threads may apply the batches in any order.  A
+    batch that fails to connect, or that VIVO fails with a server error, is retried, waiting retry_delay seconds,
+    doubled for each retry.  A batch VIVO rejects, such as for bad credentials, fails at once.  Each batch applied is recorded
+    in the checkpoint file.  Batches recorded in an existing checkpoint file are not applied again, so an apply can
+    be resumed.  A checkpoint file written for other add or sub files, or another batch size, is not resumed.  The
+    apply starts from the first batch
+    :param parms: dictionary with query parms:  updateuri, username and password
+    :return: list of the number of triples removed and added
+    """
+    import os
+    import time
+    import urllib2
+    from multiprocessing.pool import ThreadPool
+    from SPARQLWrapper import SPARQLExceptions
+
+    done = set()
+    header = make_checkpoint_header(add_filename, sub_filename, batch_size)
+    if checkpoint_filename is not None and os.path.exists(checkpoint_filename):
+        checkpoint = read_checkpoint(checkpoint_filename, add_filename, sub_filename, batch_size)
+        if checkpoint is not None:
+            done = checkpoint
+            logger.info(u"Resuming apply.  {} batches applied".format(len(done)))
+        else:
+            logger.warning(u"Checkpoint {} is not for these update files and batch size.  Applying all batches"
+                           .format(checkpoint_filename))
+
+    def batches():
+        for name, filename, operation in [('sub', sub_filename, 'DELETE DATA'), ('add', add_filename, 'INSERT DATA')]:
+            for i, lines in enumerate(read_nt_batches(filename, batch_size)):
+                batch_id = name + ' ' + str(i)
+                if batch_id not in done:
+                    yield batch_id, operation + ' {\n  GRAPH <' + graph_uri + '> {\n' + ''.join(lines) + '  }\n}', \
+                        len(lines)
+
+    def apply_batch(batch):
+        batch_id, update, n = batch
+        attempt = 0
+        while True:
+            try:
+                vivo_update(update, parms)
+                return batch_id, n
+            except (urllib2.URLError, SPARQLExceptions.EndPointInternalError) as error:
+                if isinstance(error, urllib2.HTTPError) and error.code < 500:
+                    raise  # VIVO rejected the update.  Retrying will not help
+                if attempt == retries:
+                    raise
+                logger.warning(u"Batch {} failed: {}.  Retrying".format(batch_id, error))
+                time.sleep(retry_delay * 2 ** attempt)
+                attempt += 1
+
+    counts = {'sub': 0, 'add': 0}
+    checkpoint_file = None
+    if checkpoint_filename is not None:
+        checkpoint_file = open(checkpoint_filename, 'a' if len(done) > 0 else 'w')
+        if len(done) == 0:
+            checkpoint_file.write(header + '\n')
+    pool = ThreadPool(workers) if workers > 1 else None
+    try:
+        applied = pool.imap_unordered(apply_batch, batches()) if pool is not None else \
+            (apply_batch(batch) for batch in batches())
+        for batch_id, n in applied:
+            counts[batch_id.split()[0]] += n
+            if checkpoint_file is not None:
+                checkpoint_file.write(batch_id + '\n')
+                checkpoint_file.flush()
+            logger.debug(u"Applied batch {} of {} triples".format(batch_id, n))
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if checkpoint_file is not None:
+            checkpoint_file.close()
+    return [counts['sub'], counts['add']]
+
+
 def write_update_def(update_def, filename):
     """
     Write update_def to a json_file
@@ -846,7 +2036,7 @@ def parse_date_parts(month, year):
     return date_value.isoformat()
 
 
-def get_args():
+def get_args(argv=None):
     """
     Get the args specified by the user.  Arg values are determined:
     1. from hard coded values (see below)
@@ -855,6 +2045,7 @@ def get_args():
 
     Set the logging level based on args
 
+    :param argv: optional list of command line args.  Defaults to sys.argv
     :return: args structure as defined by argparser
     """
     import argparse
@@ -883,19 +2074,32 @@ def get_args():
         'PREFIX vivo: <http://vivoweb.org/ontology/core#>\n',
         'rdfprefix': 'pump',
         'queryuri': 'http://localhost:8080/vivo/api/sparqlQuery',
+        'updateuri': 'http://localhost:8080/vivo/api/sparqlUpdate',
+        'graphuri': DEFAULT_GRAPH_URI,
+        'batchsize': DEFAULT_BATCH_SIZE,
+        'applyworkers': 1,
         'uriprefix': 'http://vivo.school.edu/individual/n',
         'src': 'pump_data.txt',
         'config': 'sv.cfg',
         'verbose': logging.WARNING,
         'debug': logging.WARNING,
-        'nofilters': False
+        'nofilters': False,
+        'difffile': None,
+        'lookupcache': None,
+        'lookupttl': DEFAULT_LOOKUP_TTL,
+        'compress': False,
+        'sortoutput': False,
+        'poolsize': DEFAULT_POOL_SIZE,
+        'fetchworkers': DEFAULT_FETCH_WORKERS,
+        'pagesize': DEFAULT_PAGE_SIZE,
+        'chunksize': DEFAULT_CHUNK_SIZE
     }
 
     parser = argparse.ArgumentParser(description="Get or update row and column data from and to VIVO",
                                      epilog="For more info, see http://github.com/mconlon17/vivo-pump")
     parser.add_argument("-a", "--action", help="desired action.  get = get data from VIVO.  update = update VIVO "
-                        "data from a spreadsheet. summarize = show def summary. serialize = serial version of the pump"
-                        ". test = test pump configuration.",
+                        "data from a spreadsheet. apply = update, then send the update to VIVO. summarize = show def "
+                        "summary. serialize = serial version of the pump. test = test pump configuration.",
                         nargs='?')
     parser.add_argument("-d", "--defn", help="name of definition file", nargs="?")
     parser.add_argument("-i", "--inter", help="interfield delimiter", nargs="?")
@@ -913,7 +2117,30 @@ def get_args():
     parser.add_argument("-b", "--debug", action="store_const", dest='loglevel', const=logging.DEBUG,
                         default=logging.WARNING, help="write debugging messages to the log")
     parser.add_argument("-n", "--nofilters", action="store_true", help="turn off filters")
-    args = parser.parse_args()
+    parser.add_argument("--pool-size", dest="poolsize", type=int, help="number of keep-alive connections kept "
+                        "for the VIVO SPARQL API", nargs='?')
+    parser.add_argument("--fetch-workers", dest="fetchworkers", type=int, help="number of threads fetching column "
+                        "data from VIVO for an update", nargs='?')
+    parser.add_argument("--page-size", dest="pagesize", type=int, help="number of rows in each page of query "
+                        "results.  0 for no paging", nargs='?')
+    parser.add_argument("--update-uri", dest="updateuri", help="URI for SPARQL update API", nargs='?')
+    parser.add_argument("--graph-uri", dest="graphuri", help="graph updated by apply", nargs='?')
+    parser.add_argument("--batch-size", dest="batchsize", type=int, help="number of triples in each update sent "
+                        "by apply", nargs='?')
+    parser.add_argument("--apply-workers", dest="applyworkers", type=int, help="number of updates sent at a time "
+                        "by apply", nargs='?')
+    parser.add_argument("--compress", action="store_true", help="gzip the add and sub files")
+    parser.add_argument("--sort-output", dest="sortoutput", action="store_true", help="sort the add and sub files "
+                        "and remove duplicate triples")
+    parser.add_argument("--diff-file", dest="difffile", help="name of file to contain the triples to add and sub "
+                        "in each update", nargs='?')
+    parser.add_argument("--lookup-cache", dest="lookupcache", help="name of file caching the results of VIVO lookup "
+                        "queries", nargs='?')
+    parser.add_argument("--lookup-ttl", dest="lookupttl", type=int, help="number of seconds a cached lookup result "
+                        "is used", nargs='?')
+    parser.add_argument("--chunk-size", dest="chunksize", type=int, help="number of entities updated at a time.  0 "
+                        "to update all entities at once", nargs='?')
+    args = parser.parse_args(argv)
 
     if args.config is None:
         args.config = program_defaults['config']
@@ -959,19 +2186,22 @@ def get_args():
     return args
 
 
-def get_parms():
+def get_parms(argv=None):
     """
     Use get_args to get the args, and return a dictionary of the args ready for
-    use in pump software.
+    use in pump software.  The shared query pool is sized by the poolsize arg.
     @see get_args()
 
+    :param argv: optional list of command line args.  Defaults to sys.argv
     :return: dict: parms
     """
     parms = {}
-    args = get_args()
+    args = get_args(argv)
     for name, val in vars(args).items():
         if val is not None:
             parms[name] = val
+    if 'poolsize' in parms:
+        set_query_pool_size(parms['poolsize'])
     return parms
 
 
@@ -988,36 +2218,23 @@ def add_type_restriction(step):
         return ""
 
 
-def make_get_query(update_def):
+def make_get_query(update_def, order_by=True):
     """
     Given an update_def, return the sparql query needed to produce a spreadsheet of the data to be managed.
     See do_get
+    :param order_by: if False, the query has no ORDER BY, and can be paged by vivo_query_pages
     :return: a sparql query string
     """
 
     front_query = 'SELECT ?uri ?' + ' ?'.join(update_def['column_defs'].keys()) + '\nWHERE {\n    ' + \
                   update_def['entity_def']['entity_sparql'] + '\n'
 
-    # Fake recursion here to depth 3.  Could be replaced by real recursion to arbitrary path length
-
     middle_query = ""
     for name, path in update_def['column_defs'].items():
-        middle_query += '    OPTIONAL {  ?uri <' + str(path[0]['predicate']['ref']) + '> ?'
-        if len(path) == 1:
-            middle_query += name + ' . ' + add_type_restriction(path[0]) + add_qualifiers(path) + ' }\n'
-        else:
-            middle_query += path[0]['object']['name'] + ' . ' + add_type_restriction(path[0]) + '?' + \
-                path[0]['object']['name'] + ' <' + str(path[1]['predicate']['ref']) + '> ?'
-            if len(path) == 2:
-                middle_query += name + ' . ' + add_type_restriction(path[1]) + add_qualifiers(path) + ' }\n'
-            else:
-                middle_query += path[1]['object']['name'] + ' . ' + add_type_restriction(path[1]) + '?' + \
-                    path[1]['object']['name'] + ' <' + str(path[2]['predicate']['ref']) + '> ?'
-                if len(path) == 3:
-                    middle_query += name + ' . ' + add_type_restriction(path[2]) + add_qualifiers(path) + ' }\n'
-                else:
-                    raise PathLengthException('Path length >3 not supported in do_get')
-    if 'order_by' in update_def['entity_def']:
+        middle_query += '    OPTIONAL {  ' + \
+            make_path_sparql('uri', path, lambda step, following: add_type_restriction(step)) + \
+            add_qualifiers(path) + ' }\n'
+    if order_by and 'order_by' in update_def['entity_def']:
         back_query = '}\nORDER BY ?' + update_def['entity_def']['order_by']
     else:
         back_query = '}\n'
@@ -1045,30 +2262,37 @@ def make_get_data(update_def, result_set):
     """
     Given a query result set, produce a dictionary keyed by uri with values of dictionaries keyed by column
     names.  Where columns have multiple values, create sets of values.
-    :param result_set: SPARQL result set
+    :param result_set: SPARQL result set, or an iterable of its bindings, such as from vivo_query_pages
     :return: dictionary
     :rtype: dict
     """
     data = {}
 
-    for binding in result_set['results']['bindings']:
+    #   Boolean columns have the value of the boolean object, others have sets of values
+
+    plan = compile_update_def(update_def)
+    names = ['uri'] + [column.name for column in plan.columns if not column.closure]
+    booleans = dict((column.name, str(column.leaf.value)) for column in plan.columns
+                    if not column.closure and column.leaf.boolean)
+
+    if isinstance(result_set, dict):
+        result_set = result_set['results']['bindings']
+    for binding in result_set:
         uri = str(binding['uri']['value'])
         if uri not in data:
             data[uri] = {}
-        for name in ['uri'] + update_def['column_defs'].keys():
-            if name != 'uri':
-                last_step = update_def['column_defs'][name][len(update_def['column_defs'][name]) - 1]
-            if name != 'uri' and last_step['predicate']['single'] == 'boolean':
-                if name in binding and (str(last_step['object']['value']) == binding[name]['value']):
-                    data[uri][name] = '1'
-                elif name not in data[uri]:
-                    data[uri][name] = '0'
-            else:
-                if name in binding:
-                    if name in data[uri]:
-                        data[uri][name].add(binding[name]['value'])
-                    else:
-                        data[uri][name] = {binding[name]['value']}
+        row = data[uri]
+        for name in names:
+            if name in booleans:
+                if name in binding and booleans[name] == binding[name]['value']:
+                    row[name] = '1'
+                elif name not in row:
+                    row[name] = '0'
+            elif name in binding:
+                if name in row:
+                    row[name].add(binding[name]['value'])
+                else:
+                    row[name] = {binding[name]['value']}
     return data
 
 
@@ -1076,18 +2300,12 @@ def make_rdf_term_from_source(value, step):
     """
     Given a text string value and a step definition, return the rdflib term as defined by the step def
     :param: value: string from source
-    :param: step: step definition from update_def
+    :param: step: Step, or step definition from update_def
     :return: rdf_term: an rdf_term from rdflib -- either Literal or URIRef
     """
-    from rdflib import Literal, URIRef
-    if step["object"]["literal"]:
-        datatype = step["object"].get('datatype', None)
-        if datatype is not None and datatype[:4] == 'xsd:':
-            datatype = datatype.replace('xsd:', 'http://www.w3.org/2001/XMLSchema#')
-        rdf_term = Literal(value, datatype=datatype, lang=step["object"].get('lang', None))
-    else:
-        rdf_term = URIRef(value)
-    return rdf_term
+    if not isinstance(step, Step):
+        step = Step(step)
+    return step.term(value)
 
 
 def prepare_column_values(update_string, intra, step_def, enum, row, column_name):
@@ -1096,13 +2314,16 @@ def prepare_column_values(update_string, intra, step_def, enum, row, column_name
     update_string in the update file, enumerations and filters, prepare the column values and return them
     as a list of rdflib terms
 
+    :param step_def: Step, or step definition from update_def.  Use the values_step of a Column for the
+    cardinality of the column values
     :return: column_values a list of rdflib terms
     :rtype: list[str]
     """
+    step = step_def if isinstance(step_def, Step) else Step(step_def)
 
     #   Three cases: boolean, single valued and multiple valued
 
-    if step_def['predicate']['single'] == 'boolean':
+    if step.boolean:
         update_string = update_string.strip()
         if update_string == '':
             column_values = ['']
@@ -1112,18 +2333,16 @@ def prepare_column_values(update_string, intra, step_def, enum, row, column_name
         else:
             column_values = ['1']
 
-    elif not step_def['object']['multiple']:
+    elif not step.multiple:
         column_values = [update_string.strip()]
     else:
-        column_values = update_string.split(intra)
-        if 'include' in step_def['predicate']:
-            column_values += step_def['predicate']['include']
+        column_values = update_string.split(intra) + step.include
         for i in range(len(column_values)):
             column_values[i] = column_values[i].strip()
 
     # Check column values for consistency with single and multi-value paths
 
-    if step_def['object']['multiple'] != True and len(column_values) > 1:
+    if step.multiple != True and len(column_values) > 1:
         raise InvalidSourceException(str(row) + str(column_name) +
                                      'Path is single-valued, multiple values in source.')
     while '' in column_values:
@@ -1135,17 +2354,17 @@ def prepare_column_values(update_string, intra, step_def, enum, row, column_name
 
     # Handle enumerations
 
-    if 'enum' in step_def['object']:
+    if step.enum is not None:
         for i in range(len(column_values)):
             try:
-                column_values[i] = enum[step_def['object']['enum']]['update'][column_values[i]]
+                column_values[i] = enum[step.enum]['update'][column_values[i]]
             except KeyError:
                 logger.error(u"{} not found in enumeration.  Blank value substituted.".format(column_values[i]))
                 column_values[i] = ''
 
     # Convert to rdflib terms
 
-    column_terms = [make_rdf_term_from_source(column_value, step_def) for column_value in column_values]
+    column_terms = [step.term(column_value) for column_value in column_values]
 
     return column_terms
 
@@ -42,10 +42,12 @@ def main():
     The main function.  Does the work of Simple VIVO
     :return: None
     """
+    import os
     import sys
     import logging
     from datetime import datetime
-    from pump.vivopump import get_args, DefNotFoundException, InvalidDefException
+    from pump.vivopump import get_args, log_diffs, NTriplesWriter, apply_update_files, read_checkpoint, \
+        invalidate_lookup_cache, set_query_pool_size, DefNotFoundException, InvalidDefException
     from pump.pump import Pump
 
     logging.captureWarnings(True)
@@ -71,6 +73,9 @@ def main():
         print "Invalid definition file", args.defn, "\n", invalid
         sys.exit(1)
 
+    if args.difffile is not None:
+        log_diffs(args.difffile)
+
     p.filter = not args.nofilters
     p.inter = args.inter
     p.intra = args.intra
@@ -80,26 +85,53 @@ def main():
     p.username = args.username
     p.password = args.password
     p.prefix = args.prefix
+    set_query_pool_size(args.poolsize)
     p.query_parms = {'queryuri': p.queryuri, 'username': p.username, 'password': p.password,
-                     'uriprefix': p.uriprefix, 'prefix': p.prefix}
+                     'uriprefix': p.uriprefix, 'prefix': p.prefix,
+                     'fetchworkers': int(args.fetchworkers),
+                     'pagesize': int(args.pagesize), 'updateuri': args.updateuri,
+                     'lookupcache': args.lookupcache, 'lookupttl': args.lookupttl}
 
     if args.action == 'get':
         n_rows = p.get()
         print datetime.now(), n_rows, "rows in", args.src
-    elif args.action == 'update':
-        try:
-            [add_graph, sub_graph] = p.update()
-        except IOError:
-            print args.src, "file not found"
-            return_code = 1
+    elif args.action in ['update', 'apply']:
+        suffix = '.nt.gz' if args.compress else '.nt'
+        add_filename = args.rdfprefix + '_add' + suffix
+        sub_filename = args.rdfprefix + '_sub' + suffix
+        checkpoint_filename = args.rdfprefix + '_apply.txt'
+        resume = args.action == 'apply' and os.path.exists(checkpoint_filename) and \
+            os.path.exists(add_filename) and os.path.exists(sub_filename)
+        if resume and read_checkpoint(checkpoint_filename, add_filename, sub_filename, int(args.batchsize)) is None:
+            print datetime.now(), "Checkpoint", checkpoint_filename, "is not for", add_filename, "and", \
+                sub_filename, "with batch size", args.batchsize, "and is discarded"
+            resume = False
+        if resume:
+            print datetime.now(), "Resuming apply of", add_filename, "and", sub_filename
         else:
-            add_file = open(args.rdfprefix + '_add.nt', 'w')
-            print >>add_file, add_graph.serialize(format='nt')
-            add_file.close()
-            sub_file = open(args.rdfprefix + '_sub.nt', 'w')
-            print >>sub_file, sub_graph.serialize(format='nt')
-            sub_file.close()
-            print datetime.now(), len(add_graph), 'triples to add', len(sub_graph), 'triples to sub'
+            if os.path.exists(checkpoint_filename):
+                os.remove(checkpoint_filename)  # the checkpoint is for the update files about to be replaced
+            try:
+                updates = p.update_chunks(int(args.chunksize))
+            except IOError:
+                print args.src, "file not found"
+                return_code = 1
+            else:
+                add_file = NTriplesWriter(add_filename, compress=args.compress, sort=args.sortoutput)
+                sub_file = NTriplesWriter(sub_filename, compress=args.compress, sort=args.sortoutput)
+                for [add_graph, sub_graph] in updates:
+                    add_file.write_graph(add_graph)
+                    sub_file.write_graph(sub_graph)
+                add_file.close()
+                sub_file.close()
+                print datetime.now(), add_file.count, 'triples to add', sub_file.count, 'triples to sub'
+        if args.action == 'apply' and return_code == 0:
+            [n_sub, n_add] = apply_update_files(add_filename, sub_filename, p.query_parms, graph_uri=args.graphuri,
+                                                batch_size=int(args.batchsize), workers=int(args.applyworkers),
+                                                checkpoint_filename=checkpoint_filename)
+            os.remove(checkpoint_filename)
+            invalidate_lookup_cache(p.query_parms)
+            print datetime.now(), n_sub, 'triples removed from VIVO', n_add, 'triples added to VIVO'
     elif args.action == 'summarize':
         print p.summarize()
     elif args.action == 'serialize':
@@ -269,3 +269,83 @@ class ImproveSponsorAwardIdTestCase(unittest.TestCase):
         in_string = "5r01 Dk288283 "
         out_string = improve_sponsor_award_id(in_string)
         self.assertEqual("R01DK288283", out_string)
+
+
+class ImproveDispatchTestCase(unittest.TestCase):
+    def test_improve(self):
+        from improve.improve import improve
+        self.assertEqual("R01DK288283", improve('improve_sponsor_award_id', "5r01 Dk288283 "))
+        self.assertEqual("01234567", improve('improve_deptid', "1234567"))
+
+    def test_filter_not_found(self):
+        from improve.improve import improve, FilterNotFoundException
+        with self.assertRaises(FilterNotFoundException):
+            improve('improve_nothing', "text")
+
+    def test_improve_many(self):
+        from improve.improve import improve_many, improve_display_name
+        values = ["doe,john", "smith,  jane", "doe,john"]
+        self.assertEqual([improve_display_name(x) for x in values], improve_many('improve_display_name', values))
+
+    def test_remembered(self):
+        from improve.improve import improve, improve_many, register_improve
+        calls = []
+
+        def improve_counted(s):
+            calls.append(s)
+            return s.upper()
+        register_improve('improve_counted', improve_counted)
+        self.assertEqual(['A', 'B', 'A'], improve_many('improve_counted', ['a', 'b', 'a']))
+        self.assertEqual('A', improve('improve_counted', 'a'))
+        self.assertEqual(['a', 'b'], calls)
+
+    def test_invalid_data_not_remembered(self):
+        from improve.improve import improve, InvalidDataException
+        for i in range(2):
+            with self.assertRaises(InvalidDataException):
+                improve('improve_deptid', "A6")
+
+
+class LruCacheTestCase(unittest.TestCase):
+    def test_least_recently_used_removed(self):
+        from improve.improve import LruCache
+        cache = LruCache(size=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(1, cache.get('a'))
+        cache.put('c', 3)
+        self.assertEqual(2, len(cache))
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+        self.assertEqual(None, cache.get('b'))
+        self.assertEqual(3, cache.get('c'))
+
+
+class AbbreviationTableTestCase(unittest.TestCase):
+    @staticmethod
+    def replace_each(table, t):
+        for abbrev in table.abbreviations:
+            t = t.replace(abbrev, table.abbreviations[abbrev])
+        return t
+
+    def test_same_as_replace_each(self):
+        import random
+        from improve.improve import COURSE_TITLE_ABBREVIATIONS, JOBCODE_ABBREVIATIONS, ORG_NAME_ABBREVIATIONS, \
+            TITLE_ABBREVIATIONS
+        random.seed(2016)
+        for table in [COURSE_TITLE_ABBREVIATIONS, JOBCODE_ABBREVIATIONS, ORG_NAME_ABBREVIATIONS, TITLE_ABBREVIATIONS]:
+            pieces = table.abbreviations.keys() + table.abbreviations.values() + [' ', 'x', ' @', ' !', "'S "]
+            for i in range(2000):
+                t = ''.join(random.choice(pieces) for j in range(random.randint(1, 8)))
+                self.assertEqual(self.replace_each(table, t), table.expand(t))
+
+    def test_created_abbreviation(self):
+        from collections import OrderedDict
+        from improve.improve import AbbreviationTable, SMALL_ABBREVIATION_TABLE
+        abbreviations = OrderedDict([("Ab ", "Xy Cd "), ("Cd ", "Ef "), ("Of ", "of ")])
+        abbreviations.update(("K{} ".format(i), "Key ") for i in range(SMALL_ABBREVIATION_TABLE))
+        table = AbbreviationTable(abbreviations)
+        self.assertEqual([table.order["Cd "]], table.creates["Ab "])
+        self.assertEqual("Xy Ef ", table.expand("Ab "))
+        for t in ["Ab Of Cd ", "Ab Of Ab ", "Of Ab "]:
+            self.assertEqual(self.replace_each(table, t), table.expand(t))
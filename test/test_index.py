@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test_index.py -- Test the disambiguation index in index.py
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from disambiguate import utils
+from disambiguate import index
+
+__author__ = "Michael Conlon"
+
+FILE_NAME = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'vivo_people.csv')
+
+PEOPLE = 'person_uri, fname, lname, mname\n' \
+         'uri_1,      First, Last, Middle\n' \
+         'uri_2,      First,  Last,   X\n' \
+         'uri_3,      Aww,    B,\n'
+
+
+class DisambiguationIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index_file = os.path.join(self.directory, 'people.idx')
+        self.csv_file = os.path.join(self.directory, 'people.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_same_as_csv(self):
+        """
+        Verify that the index finds the uris of each name pattern in the
+        dictionaries built from the csv file
+        """
+        expected = utils.get_vivo_disambiguation_data_from_csv(FILE_NAME)
+        index.build_disambiguation_index(FILE_NAME, self.index_file)
+        with index.DisambiguationIndex(self.index_file) as people:
+            for case, keys in expected.items():
+                for key, uris in keys.items():
+                    self.assertEquals(uris, people.get(case, key))
+            self.assertEquals([], people.get(0, 'lass'))
+            self.assertEquals([], people.get(6, 'last|first|y'))
+            self.assertEquals(None, people[1].get('zzz'))
+            self.assertEquals(set(['uri_1', 'uri_2', 'uri_3']),
+                              people.get_uris())
+
+    def test_author_disambiguation_data(self):
+        """
+        Verify that the index can be used in place of the dictionaries
+        """
+        index.build_disambiguation_index(FILE_NAME, self.index_file)
+        with index.DisambiguationIndex(self.index_file) as people:
+            self.assertEquals(['uri_1'], utils.get_author_disambiguation_data(
+                people, 'Last', 'First', 'M'))
+            self.assertEquals(['uri_1', 'uri_2'],
+                              utils.get_author_disambiguation_data(
+                                  people, 'last', 'F', ''))
+            self.assertEquals([], utils.get_author_disambiguation_data(
+                people, 'Nobody', 'F', ''))
+
+    def test_add_people(self):
+        """
+        Verify that people added to the index are found with the people
+        already in it
+        """
+        index.build_disambiguation_index(FILE_NAME, self.index_file)
+        added = index.add_to_disambiguation_index(
+            self.index_file, [('uri_4', 'Fred', 'Last', ''),
+                              ('uri_5', 'Ann', 'Able', 'Q')])
+        self.assertEquals(2, added)
+        with index.DisambiguationIndex(self.index_file) as people:
+            self.assertEquals(['uri_1', 'uri_2', 'uri_4'], people.get(0, 'last'))
+            self.assertEquals(['uri_4'], people.get(2, 'last|fred'))
+            self.assertEquals(['uri_5'], people.get(6, 'able|ann|q'))
+            self.assertEquals(['uri_3'], people.get(0, 'b'))
+
+    def test_refresh(self):
+        """
+        Verify that only the people not in the index are added from the
+        csv file
+        """
+        with open(self.csv_file, 'w') as csv_file:
+            csv_file.write(PEOPLE)
+        with index.open_disambiguation_index(self.index_file,
+                                             self.csv_file) as people:
+            self.assertEquals(['uri_3'], people.get(1, 'b|a'))
+        with open(self.csv_file, 'a') as csv_file:
+            csv_file.write('uri_6,      Al,    B,\n')
+        self.assertEquals(1, index.refresh_disambiguation_index(
+            self.index_file, self.csv_file))
+        with index.DisambiguationIndex(self.index_file) as people:
+            self.assertEquals(['uri_3', 'uri_6'], people.get(1, 'b|a'))
+            self.assertEquals(['uri_6'], people.get(2, 'b|al'))
+
+    def test_keys_with_prefix(self):
+        """
+        Verify that the keys of a case starting with a prefix are found in
+        order
+        """
+        index.build_disambiguation_index(FILE_NAME, self.index_file)
+        with index.DisambiguationIndex(self.index_file) as people:
+            self.assertEquals(['last|f|m', 'last|f|x'],
+                              people[3].keys_with_prefix('la'))
+            self.assertEquals(['b'], people.keys_with_prefix(0, 'b'))
+            self.assertEquals([], people.keys_with_prefix(2, 'c'))
+
+    def test_match_authors(self):
+        """
+        Verify that authors are matched exactly and by similarity with the
+        index as with the dictionaries
+        """
+        expected = utils.get_vivo_disambiguation_data_from_csv(FILE_NAME)
+        index.build_disambiguation_index(FILE_NAME, self.index_file)
+        rows = {
+            1: {'last': 'Last', 'first': 'First', 'middle': 'X'},
+            2: {'last': 'Lastt', 'first': 'First', 'middle': 'M'},
+            3: {'last': 'Bb', 'first': 'Aww', 'middle': ''},
+            4: {'last': 'Nobody', 'first': 'F', 'middle': ''}
+        }
+        with index.DisambiguationIndex(self.index_file) as people:
+            actual = utils.match_authors(people, rows)
+        self.assertEquals({1: ['uri_2'], 2: ['uri_1'], 3: [], 4: []}, actual)
+        self.assertEquals(utils.match_authors(expected, rows), actual)
+
+    def test_empty(self):
+        """
+        Verify that an empty index finds nothing
+        """
+        index.write_disambiguation_index({}, self.index_file)
+        with index.DisambiguationIndex(self.index_file) as people:
+            self.assertEquals([], people.get(0, 'last'))
+            self.assertEquals(set(), people.get_uris())
+
+
+if __name__ == '__main__':
+    unittest.main()
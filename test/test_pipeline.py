@@ -0,0 +1,136 @@
+#!/usr/bin/env/python
+# coding=utf-8
+"""
+    test_pipeline.py -- Test cases for the filter pipeline
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import StringIO
+
+from pump.vivopump import read_csv_fp
+from pump.pipeline import load_filters, run_pipeline, run_row_filter
+
+__author__ = "Michael Conlon"
+__copyright__ = "Copyright 2016 (c) Michael Conlon"
+__license__ = "New BSD license"
+__version__ = "0.1"
+
+FILTERS = {
+    'null_value_filter.py': '''
+def filter_row(row, parms):
+    for name, val in row.items():
+        if val == "NULL":
+            row[name] = ""
+    return row
+''',
+    'drop_filter.py': '''
+def filter_row(row, parms):
+    if row['name'] == parms['drop']:
+        return None
+    row['seen'] = 'yes'
+    return row
+''',
+    'unique_filter.py': '''
+def filter_data(data_in, parms):
+    data_out = {}
+    names = set()
+    for row, data in data_in.items():
+        if data['name'] not in names:
+            data_out[row] = dict(data)
+            names.add(data['name'])
+    return data_out
+''',
+    'no_filter.py': '''
+x = 1
+''',
+    'count_filter.py': '''
+from collections import OrderedDict
+
+counts = OrderedDict([('Kept', 0), ('Removed', 0)])
+
+
+def filter_row(row, parms):
+    if row['phone'] == 'NULL':
+        counts['Removed'] += 1
+        return None
+    counts['Kept'] += 1
+    return row
+
+
+def close():
+    with open(__file__ + '.closed', 'a') as f:
+        f.write('x')
+'''
+}
+
+DATA = 'uri|name|phone\n' \
+       'a|Tigert|NULL\n' \
+       'b|Weil|3525551212\n' \
+       'c|Tigert|3525551213\n' \
+       'd|Library|NULL\n' \
+       'e|Weil|NULL\n'
+
+
+class PipelineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for name, text in FILTERS.items():
+            with open(os.path.join(self.directory, name), 'w') as f:
+                f.write(text)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def paths(self, *names):
+        return [os.path.join(self.directory, name) for name in names]
+
+    def test_load_filters(self):
+        filters = load_filters(self.paths('null_value_filter.py', 'unique_filter.py'))
+        self.assertEqual(['null_value_filter', 'unique_filter'], [f.name for f in filters])
+        self.assertEqual([True, False], [f.rowwise for f in filters])
+
+    def test_load_invalid_filter(self):
+        with self.assertRaises(AttributeError):
+            load_filters(self.paths('no_filter.py'))
+
+    def test_run_pipeline(self):
+        filters = load_filters(self.paths('null_value_filter.py', 'drop_filter.py', 'unique_filter.py'))
+        data = run_pipeline(filters, read_csv_fp(StringIO.StringIO(DATA)), {'drop': 'Library'})
+        self.assertEqual({1: {'uri': 'a', 'name': 'Tigert', 'phone': '', 'seen': 'yes'},
+                          2: {'uri': 'b', 'name': 'Weil', 'phone': '3525551212', 'seen': 'yes'}}, data)
+
+    def test_run_pipeline_processes(self):
+        filters = load_filters(self.paths('drop_filter.py', 'null_value_filter.py'))
+        data = run_pipeline(filters, read_csv_fp(StringIO.StringIO(DATA)), {'drop': 'Weil'})
+        data2 = run_pipeline(filters, read_csv_fp(StringIO.StringIO(DATA)), {'drop': 'Weil'}, processes=2,
+                             rows_per_task=1)
+        self.assertEqual([1, 3, 4], data2.keys())
+        self.assertEqual(data, data2)
+
+    def closed(self, name):
+        path = os.path.join(self.directory, name + '.closed')
+        return len(open(path).read()) if os.path.exists(path) else 0
+
+    def test_filter_counts(self):
+        for processes in [1, 2]:
+            [count_filter] = load_filters(self.paths('count_filter.py'))
+            run_pipeline([count_filter], read_csv_fp(StringIO.StringIO(DATA)), processes=processes, rows_per_task=1)
+            self.assertEqual({'Kept': 2, 'Removed': 3}, dict(count_filter.counts))
+            fp = StringIO.StringIO()
+            count_filter.finish(fp)
+            self.assertEqual('count_filter\nKept 2\nRemoved 3\n', fp.getvalue())
+        self.assertEqual(4, self.closed('count_filter.py'))  # each filter, and each of the two workers
+
+    def test_run_row_filter(self):
+        [null_value_filter] = load_filters(self.paths('null_value_filter.py'))
+        fp_out = StringIO.StringIO()
+        run_row_filter(null_value_filter.function, fp_in=StringIO.StringIO(DATA), fp_out=fp_out)
+        fp_out.seek(0)
+        self.assertEqual(read_csv_fp(StringIO.StringIO(DATA.replace('NULL', ''))), read_csv_fp(fp_out))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -51,4 +51,100 @@ class EntrezTestCase(unittest.TestCase):
         self.assertTrue(len(result) > 0)
 
 
+class EntrezFetcherTestCase(unittest.TestCase):
 
+    def setUp(self):
+        import tempfile
+        self.directory = tempfile.mkdtemp()
+        self.modified = set()
+        self.doctype = '<!DOCTYPE PubmedArticleSet PUBLIC "-//NLM//DTD PubMedArticle, 1st January 2025//EN" ' \
+                       '"https://dtd.nlm.nih.gov/ncbi/pubmed/out/pubmed_250101.dtd">'
+
+    def tearDown(self):
+        import shutil
+        from pump.vivopump import get_query_pool
+        get_query_pool().close()
+        shutil.rmtree(self.directory)
+
+    def entrez(self, fields):
+        """
+        Stand in for efetch, returning an article for each id but 404, and for esearch, returning the ids that
+        are in self.modified
+        """
+        if 'term' in fields:
+            ids = [term.replace('[uid]', '') for term in fields['term'].split(' OR ')]
+            return 200, 'text/xml', '<eSearchResult><IdList>' + \
+                ''.join('<Id>' + pmid + '</Id>' for pmid in ids if pmid in self.modified) + \
+                '</IdList></eSearchResult>'
+        return 200, 'text/xml', '<?xml version="1.0" ?>\n' + self.doctype + '\n<PubmedArticleSet>\n' + \
+            ''.join('<PubmedArticle><MedlineCitation><PMID>' + pmid + '</PMID></MedlineCitation>'
+                    '</PubmedArticle>\n' for pmid in fields['id'].split(',') if pmid != '404') + \
+            '</PubmedArticleSet>'
+
+    def test_batches(self):
+        from testserver import TestServer
+        from pubmed.pubmed import EntrezFetcher
+        with TestServer(self.entrez) as server:
+            fetcher = EntrezFetcher(eutils_url=server.base_uri, batch_size=2, rate=1000)
+            articles = fetcher.fetch(['1', '2', '3', '404', 5])
+            self.assertEqual(['1', '2', '3', '5'], sorted(articles))
+            self.assertTrue('<PMID>3</PMID>' in articles['3'])
+            self.assertTrue(articles['3'].startswith('<?xml version="1.0" ?>\n' + self.doctype))
+            self.assertEqual(1, articles['3'].count('<PubmedArticle>'))
+            self.assertEqual(['1,2', '3,404', '5'], [fields['id'] for fields in server.requests])
+            self.assertEqual('pubmed', server.requests[0]['db'])
+            fetcher.fetch(['2', '404'])
+            self.assertEqual(3, len(server.requests))
+
+    def test_cache(self):
+        """
+        Verify that cached records are fetched again only when they are modified
+        """
+        import os
+        from datetime import date
+        from testserver import TestServer
+        from pubmed.pubmed import EntrezFetcher
+        cache_file = os.path.join(self.directory, 'pubmed_cache')
+        with TestServer(self.entrez) as server:
+            with EntrezFetcher(cache_file, eutils_url=server.base_uri, rate=1000) as fetcher:
+                fetcher.fetch(['1', '2', '3'])
+            self.modified.add('2')
+            with EntrezFetcher(cache_file, eutils_url=server.base_uri, rate=1000) as fetcher:
+                articles = fetcher.fetch(['1', '2', '3', '4'])
+            self.assertEqual(['1', '2', '3', '4'], sorted(articles))
+            self.assertEqual(3, len(server.requests))
+            self.assertEqual('1[uid] OR 2[uid] OR 3[uid]', server.requests[1]['term'])
+            self.assertEqual(date.today().strftime('%Y/%m/%d'), server.requests[1]['mindate'])
+            self.assertEqual('4,2', server.requests[2]['id'])
+
+    def test_shared_cache_file(self):
+        import os
+        from pubmed import pubmed
+        cache_file = os.path.join(self.directory, 'pubmed_cache')
+        shared = pubmed.get_entrez_fetcher()
+        try:
+            self.assertEqual(None, shared.cache_file)
+            fetcher = pubmed.get_entrez_fetcher(cache_file)
+            self.assertEqual(cache_file, fetcher.cache_file)
+            self.assertTrue(fetcher is pubmed.get_entrez_fetcher())
+            self.assertTrue(fetcher is pubmed.get_entrez_fetcher(cache_file))
+            fetcher.close()
+        finally:
+            pubmed._entrez_fetcher = shared
+
+    def test_error(self):
+        from testserver import TestServer
+        from pubmed.pubmed import EntrezFetcher
+        with TestServer(lambda fields: (400, 'text/plain', 'Bad request')) as server:
+            fetcher = EntrezFetcher(eutils_url=server.base_uri, rate=1000)
+            self.assertRaises(IOError, fetcher.fetch, ['1'])
+            self.assertEqual(1, len(server.requests))
+
+    def test_token_bucket(self):
+        import time
+        from pubmed.pubmed import TokenBucket
+        bucket = TokenBucket(rate=50, capacity=2)
+        start = time.time()
+        waits = [bucket.take() for i in range(7)]
+        self.assertEqual([0.0, 0.0], waits[:2])
+        self.assertTrue(time.time() - start >= 0.09)
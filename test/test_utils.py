@@ -76,5 +76,73 @@ class UtilsTests(unittest.TestCase):
         self.assertEquals(expected, actual)
 
 
+VIVO_DATA = {
+    0: {'last': ['uri_1', 'uri_2'], 'b': ['uri_3']},
+    1: {'last|f': ['uri_1', 'uri_2'], 'b|a': ['uri_3']},
+    2: {'last|first': ['uri_1', 'uri_2'], 'b|aww': ['uri_3']},
+    3: {'last|f|m': ['uri_1'], 'last|f|x': ['uri_2']},
+    4: {'last|f|middle': ['uri_1'], 'last|f|x': ['uri_2']},
+    5: {'last|first|m': ['uri_1'], 'last|first|x': ['uri_2']},
+    6: {'last|first|middle': ['uri_1'], 'last|first|x': ['uri_2']}
+}
+
+
+class MatchAuthorsTests(unittest.TestCase):
+
+    def test_exact(self):
+        """
+        Verify that matching many authors at once finds the same uris as
+        matching them one at a time
+        """
+        rows = {
+            1: {'last': 'Last', 'first': 'First', 'middle': 'M'},
+            2: {'last': 'Last', 'first': 'F', 'middle': ''},
+            3: {'last': 'B', 'first': 'Aww', 'middle': ''},
+            4: {'last': 'Nobody', 'first': 'F', 'middle': ''},
+            5: {'last': 'last', 'first': 'first', 'middle': 'm'}
+        }
+        actual = utils.match_authors(VIVO_DATA, rows, fuzzy=False)
+        for row_index, row in rows.items():
+            self.assertEquals(utils.get_author_disambiguation_data(
+                VIVO_DATA, row['last'], row['first'], row['middle']),
+                actual[row_index])
+
+    def test_fuzzy(self):
+        """
+        Verify that names not found exactly are matched to similar names in
+        the same block only
+        """
+        rows = {
+            1: {'last': 'Lastt', 'first': 'First', 'middle': 'M'},
+            2: {'last': 'Lsat', 'first': 'First', 'middle': 'M'},
+            3: {'last': 'Lastt', 'first': 'Girst', 'middle': 'M'},
+            4: {'last': 'Bb', 'first': 'Aww', 'middle': ''}
+        }
+        self.assertEquals({1: ['uri_1'], 2: [], 3: [], 4: []},
+                          utils.match_authors(VIVO_DATA, rows))
+        self.assertEquals({1: [], 2: [], 3: [], 4: []},
+                          utils.match_authors(VIVO_DATA, rows, cutoff=0.99))
+
+    def test_fuzzy_rows(self):
+        """
+        Verify that the rows matched by similarity are reported with the
+        name pattern they matched, and rows matched exactly are not
+        """
+        rows = {
+            1: {'last': 'Lastt', 'first': 'First', 'middle': 'M'},
+            2: {'last': 'Last', 'first': 'First', 'middle': 'M'},
+            3: {'last': 'Lastt', 'first': 'First', 'middle': 'M'}
+        }
+        fuzzy_rows = {}
+        utils.match_authors(VIVO_DATA, rows, fuzzy_rows=fuzzy_rows)
+        self.assertEquals({1: ('lastt|first|m', 'last|first|m'),
+                           3: ('lastt|first|m', 'last|first|m')}, fuzzy_rows)
+
+    def test_get_key_block(self):
+        self.assertEquals(('las', 'f'), utils.get_key_block('last|first|m'))
+        self.assertEquals(('b', 'a'), utils.get_key_block('b|a'))
+        self.assertEquals(('last', ''), utils.get_key_block('last', 4))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test_vivo_name.py -- Test the VivoName class in vivo_name.py
+"""
+
+import unittest
+from disambiguate.vivo_name import VivoName
+
+__author__ = "Michael Conlon"
+
+
+class VivoNameTests(unittest.TestCase):
+
+    def test_case(self):
+        """
+        Verify the case of names with each combination of parts
+        """
+        self.assertEquals(0, VivoName('Last', '', '').get_case())
+        self.assertEquals(0, VivoName('', 'First', 'M').get_case())
+        self.assertEquals(1, VivoName('Last', 'F', '').get_case())
+        self.assertEquals(2, VivoName(' Last ', 'First', ' ').get_case())
+        self.assertEquals(3, VivoName('Last', 'F', 'M').get_case())
+        self.assertEquals(4, VivoName('Last', 'F', 'Middle').get_case())
+        self.assertEquals(5, VivoName('Last', 'First', 'M').get_case())
+        self.assertEquals(6, VivoName('Last', 'First', 'Middle').get_case())
+
+    def test_keys(self):
+        """
+        Verify the keys of each case, and the keys of the cases a name has
+        the parts of
+        """
+        vname = VivoName('Last', 'First', 'Middle')
+        self.assertEquals(('last', 'last|f', 'last|first', 'last|f|m',
+                           'last|f|middle', 'last|first|m',
+                           'last|first|middle'), vname.get_all_keys())
+        self.assertEquals('last|first|middle', vname.get_key())
+        self.assertEquals('last|f|m', vname.get_key_3())
+        self.assertEquals(list(enumerate(vname.get_all_keys())),
+                          vname.get_keys())
+        self.assertEquals([(0, 'b'), (1, 'b|a'), (2, 'b|aww')],
+                          VivoName('B', 'Aww', '').get_keys())
+        self.assertEquals([(0, 'b')], VivoName('B', '', 'Q').get_keys())
+
+    def test_non_ascii(self):
+        """
+        Verify that utf-8 and unicode names have the same keys
+        """
+        self.assertEquals('m\xc3\xbcller|j',
+                          VivoName('M\xc3\xbcller', 'J', '').get_key())
+        self.assertEquals('m\xc3\xbcller|j',
+                          VivoName(u'M\xfcller', u'J', u'').get_key())
+
+    def test_from_columns(self):
+        vnames = VivoName.from_columns(['Last', 'B'], ['First', ''],
+                                       ['M', ''])
+        self.assertEquals(['last|first|m', 'b'],
+                          [vname.get_key() for vname in vnames])
+
+
+if __name__ == '__main__':
+    unittest.main()
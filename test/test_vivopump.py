@@ -9,7 +9,7 @@ import unittest
 from pump.vivopump import new_uri, read_csv, write_csv, vivo_query, write_update_def, \
     read_csv_fp, write_csv_fp, get_vivo_ufid, get_vivo_authors, get_vivo_types, get_vivo_sponsorid, \
     make_update_query, read_update_def, make_rdf_term, get_graph, \
-    InvalidDefException, PathLengthException, parse_pages, parse_date_parts
+    InvalidDefException, parse_pages, parse_date_parts
 from pump.pump import Pump
 
 __author__ = "Michael Conlon"
@@ -145,10 +145,12 @@ class ReadUpdateDefTestCase(unittest.TestCase):
             print update_def
 
     def test_pathlength_def(self):
-        with self.assertRaises(PathLengthException):
-            p = Pump('data/grant_invalid_path_length_def.json')
-            n = p.get()
-            print n
+        from pump.vivopump import make_get_query
+        update_def = read_update_def('data/grant_path_length_four_def.json', prefix=QUERY_PARMS['prefix'])
+        query = make_get_query(update_def)
+        print query
+        self.assertTrue('?uri <http://vivoweb.org/ontology/core#dateTimeInterval> ?length_four_3 . ' in query)
+        self.assertTrue('?length_four_1 <http://vivoweb.org/ontology/core#evenMore> ?length_four . ' in query)
 
     def test_update_def_order(self):
         update_def = read_update_def('data/grant_def.json', prefix=QUERY_PARMS['prefix'])
@@ -166,6 +168,17 @@ class MakeUpdateQueryTestCase(unittest.TestCase):
             print update_query
             self.assertTrue(len(update_query) > 0)
 
+    def test_path_length_four(self):
+        update_def = read_update_def('data/grant_path_length_four_def.json', prefix=QUERY_PARMS['prefix'])
+        update_query = make_update_query(update_def['entity_def']['entity_sparql'],
+                                         update_def['column_defs']['length_four'])
+        print update_query
+        self.assertTrue('(<http://vivoweb.org/ontology/core#dateTimeInterval> as ?p3) (?length_four_3 as ?o3) ?t3'
+                        in update_query)
+        self.assertTrue('?length_four_2 <http://vivoweb.org/ontology/core#dateTime> ?length_four_1 . ' in update_query)
+        self.assertTrue('?length_four_1 a ?t1 . ' in update_query)
+        self.assertTrue('(?length_four as ?o) ?t' in update_query)
+
 
 class MakeRdfTermTestCase(unittest.TestCase):
     def test_uriref_case(self):
@@ -189,6 +202,84 @@ class GetGraphTestCase(unittest.TestCase):
         self.assertTrue(len(a) == 29)
 
 
+class GetGraphWorkersTestCase(unittest.TestCase):
+
+    def test_workers_same_graph(self):
+        import hashlib
+        from testserver import TestServer
+        from pump.vivopump import get_query_pool
+
+        def one_row(fields):
+            value = hashlib.md5(fields['query']).hexdigest()
+            return 200, 'application/sparql-results+json', \
+                '{"head": {"vars": ["uri", "p", "o"]}, "results": {"bindings": [{' \
+                '"uri": {"type": "uri", "value": "http://vivo.school.edu/individual/n1"}, ' \
+                '"p": {"type": "uri", "value": "http://www.w3.org/2000/01/rdf-schema#label"}, ' \
+                '"o": {"type": "literal", "value": "' + value + '"}}]}}'
+        update_def = read_update_def('data/grant_def.json', prefix=QUERY_PARMS['prefix'])
+        with TestServer(one_row) as server:
+            a = get_graph(update_def, dict(QUERY_PARMS, queryuri=server.uri, fetchworkers=1))
+            b = get_graph(update_def, dict(QUERY_PARMS, queryuri=server.uri, fetchworkers=4))
+            get_query_pool().close()
+        self.assertEqual(len(server.requests), 2 * len(a))
+        self.assertEqual(set(a), set(b))
+
+
+class VivoQueryPagesTestCase(unittest.TestCase):
+
+    @staticmethod
+    def paged_rows(fields):
+        import re
+        import json
+        rows = [{"uri": {"type": "uri", "value": "http://vivo.school.edu/individual/n" + str(i)}} for i in range(25)]
+        limit = re.search('LIMIT ([0-9]+)', fields['query'])
+        if limit:
+            offset = int(re.search('OFFSET ([0-9]+)', fields['query']).group(1))
+            rows = rows[offset:offset + int(limit.group(1))]
+        return 200, 'application/sparql-results+json', json.dumps({"head": {"vars": ["uri"]},
+                                                                   "results": {"bindings": rows}})
+
+    def test_pages(self):
+        from testserver import TestServer
+        from pump.vivopump import vivo_query_pages, get_query_pool
+        with TestServer(self.paged_rows) as server:
+            parms = dict(QUERY_PARMS, queryuri=server.uri, pagesize=10)
+            bindings = list(vivo_query_pages("SELECT ?uri WHERE { ?uri a foaf:Person }", parms, ['uri']))
+            get_query_pool().close()
+        self.assertEqual(len(bindings), 25)
+        self.assertEqual(len(set(x['uri']['value'] for x in bindings)), 25)
+        self.assertEqual(len(server.requests), 3)
+        self.assertTrue('ORDER BY ?uri\nLIMIT 10\nOFFSET 20' in server.requests[2]['query'])
+
+    def test_no_paging(self):
+        from testserver import TestServer
+        from pump.vivopump import vivo_query_pages, get_query_pool
+        with TestServer(self.paged_rows) as server:
+            parms = dict(QUERY_PARMS, queryuri=server.uri, pagesize=0)
+            bindings = list(vivo_query_pages("SELECT ?uri WHERE { ?uri a foaf:Person }", parms, ['uri']))
+            get_query_pool().close()
+        self.assertEqual(len(bindings), 25)
+        self.assertEqual(len(server.requests), 1)
+        self.assertFalse('LIMIT' in server.requests[0]['query'])
+
+    def test_default_paging(self):
+        from testserver import TestServer
+        from pump.vivopump import vivo_query_pages, get_query_pool, DEFAULT_PAGE_SIZE
+        with TestServer(self.paged_rows) as server:
+            parms = dict(QUERY_PARMS, queryuri=server.uri)
+            bindings = list(vivo_query_pages("SELECT ?uri WHERE { ?uri a foaf:Person }", parms, ['uri']))
+            get_query_pool().close()
+        self.assertEqual(len(bindings), 25)
+        self.assertTrue('LIMIT ' + str(DEFAULT_PAGE_SIZE) + '\nOFFSET 0' in server.requests[0]['query'])
+
+    def test_get_data_from_pages(self):
+        from pump.vivopump import make_get_data
+        update_def = read_update_def('data/grant_def.json', prefix=QUERY_PARMS['prefix'])
+        bindings = [{"uri": {"type": "uri", "value": "http://vivo.school.edu/individual/n1"}}]
+        self.assertEqual(make_get_data(update_def, iter(bindings)),
+                         make_get_data(update_def, {"results": {"bindings": bindings}}))
+
+
 class ReadCSVTestCase(unittest.TestCase):
     def test_read_csv_keys(self):
         data = read_csv("data/extension.txt", delimiter='\t')
@@ -234,6 +325,89 @@ class WriteCSVTestCase(unittest.TestCase):
         self.assertTrue(data == data2)
 
 
+class PumpTableTestCase(unittest.TestCase):
+    def test_read_csv_table(self):
+        from pump.vivopump import PumpTable
+        data = read_csv("data/buildings.txt", delimiter='\t')
+        self.assertTrue(isinstance(data, PumpTable))
+        self.assertEqual([u'uri', u'abbreviation', u'url', u'photo', u'number', u'name'], data.columns)
+        self.assertEqual([1, 2], data.keys())
+        self.assertEqual(u'Tigert Hall', data[2]['name'])
+        self.assertEqual({1: {u'uri': u'http://vivo.school.edu/individual/n3523', u'abbreviation': u'', u'url': u'',
+                              u'photo': u'', u'number': u'', u'name': u'Clinical and Translational Research Building'},
+                          2: {u'uri': u'http://vivo.school.edu/individual/n7909', u'abbreviation': u'', u'url': u'',
+                              u'photo': u'', u'number': u'', u'name': u'Tigert Hall'}}, data)
+
+    def test_change_rows(self):
+        data = read_csv("data/buildings.txt", delimiter='\t')
+        row = data[1]
+        row['name'] = u'CTRB'
+        row['remove'] = u'Yes'
+        self.assertEqual(u'CTRB', data[1]['name'])
+        self.assertEqual(u'Yes', data[1]['remove'])
+        self.assertFalse('remove' in data[2])
+        self.assertEqual(6, len(data[2]))
+        del data[2]
+        data[5] = {u'uri': u'', u'name': u'New Hall'}
+        self.assertEqual([1, 5], data.keys())
+        self.assertEqual({u'uri': u'', u'name': u'New Hall'}, data[5])
+
+    def test_replace_row(self):
+        data = read_csv("data/buildings.txt", delimiter='\t')
+        for i in range(3):
+            data[1] = {u'uri': u'', u'name': u'New Hall'}
+        self.assertEqual({u'uri': u'', u'name': u'New Hall'}, data[1])
+        self.assertEqual(2, data.size)
+        self.assertEqual(u'Tigert Hall', data[2]['name'])
+
+    def test_write_csv_columns(self):
+        import StringIO
+        data = read_csv("data/buildings.txt", delimiter='\t')
+        del data[1]
+        data[2]['number'] = u'0001'
+        fp = StringIO.StringIO()
+        write_csv_fp(fp, data, delimiter='\t')
+        self.assertEqual(u'uri\tabbreviation\turl\tphoto\tnumber\tname\n'
+                         u'http://vivo.school.edu/individual/n7909\t\t\t\t0001\tTigert Hall\n', fp.getvalue())
+
+    def test_write_csv_missing_value(self):
+        import StringIO
+        data = read_csv("data/buildings.txt", delimiter='\t')
+        del data[2]['photo']
+        with self.assertRaises(KeyError):
+            write_csv_fp(StringIO.StringIO(), data, delimiter='\t')
+
+
+class IterCSVTestCase(unittest.TestCase):
+    def test_iter_csv_fp(self):
+        from pump.vivopump import iter_csv_fp
+        fp = open("data/buildings.txt", 'rU')
+        rows = list(iter_csv_fp(fp, delimiter='\t'))
+        fp.close()
+        self.assertEqual(read_csv("data/buildings.txt", delimiter='\t').items(), rows)
+
+    def test_iter_csv_fp_row_error(self):
+        import StringIO
+        from pump.vivopump import iter_csv_fp, RowError
+        fp = StringIO.StringIO('a|b\n1 | 2\n3\n4|5\n')
+        self.assertEqual([(1, {u'a': u'1', u'b': u'2'}), (3, {u'a': u'4', u'b': u'5'})], list(iter_csv_fp(fp)))
+        fp = StringIO.StringIO('a|b\n1 | 2\n3\n4|5\n')
+        rows = iter_csv_fp(fp, skip=False)
+        self.assertEqual((1, {u'a': u'1', u'b': u'2'}), rows.next())
+        with self.assertRaises(RowError):
+            rows.next()
+
+    def test_csv_row_writer(self):
+        import StringIO
+        from pump.vivopump import iter_csv_fp, CsvRowWriter
+        fp = StringIO.StringIO()
+        writer = CsvRowWriter(fp, columns=[u'b', u'a'])
+        for row, data in iter_csv_fp(StringIO.StringIO('a|b\n1|2\n3|4\n')):
+            writer.write(data)
+        self.assertEqual(2, writer.count)
+        self.assertEqual(u'b|a\n2|1\n4|3\n', fp.getvalue())
+
+
 class VIVOQueryTestCase(unittest.TestCase):
 
     def test_vivo_query(self):
@@ -254,6 +428,197 @@ class VIVOQueryTestCase(unittest.TestCase):
             print result
 
 
+class QueryPoolTestCase(unittest.TestCase):
+
+    def test_connection_reuse(self):
+        from testserver import TestServer
+        from pump.vivopump import get_query_pool
+        with TestServer() as server:
+            parms = dict(QUERY_PARMS, queryuri=server.uri)
+            for i in range(5):
+                result = vivo_query("SELECT ?label WHERE { ?x rdfs:label ?label }", parms)
+                self.assertEqual(result['results']['bindings'], [])
+            get_query_pool().close()
+        self.assertEqual(server.connections, 1)
+        self.assertEqual(len(server.requests), 5)
+        self.assertEqual(server.requests[0]['email'], QUERY_PARMS['username'])
+
+    def test_bad_request_status(self):
+        from SPARQLWrapper import SPARQLExceptions
+        from testserver import TestServer
+        from pump.vivopump import get_query_pool
+        with TestServer(lambda fields: (400, 'text/plain', 'Bad query')) as server:
+            parms = dict(QUERY_PARMS, queryuri=server.uri)
+            with self.assertRaises(SPARQLExceptions.QueryBadFormed):
+                vivo_query("SEWECT ?label WHERE { ?x rdfs:label ?label }", parms)
+            get_query_pool().close()
+
+    def test_pool_size(self):
+        from pump.vivopump import get_query_pool, set_query_pool_size, DEFAULT_POOL_SIZE
+        set_query_pool_size('2')
+        self.assertEqual(get_query_pool().size, 2)
+        set_query_pool_size(DEFAULT_POOL_SIZE)
+
+
+class LookupCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.directory)
+
+    def ufid_result(self, fields):
+        return 200, 'application/sparql-results+json', \
+            '{"head": {"vars": ["uri", "ufid"]}, "results": {"bindings": [' \
+            '{"uri": {"type": "uri", "value": "http://vivo.school.edu/individual/n1"}, ' \
+            '"ufid": {"type": "literal", "value": "12345678"}}]}}'
+
+    def test_lookup_cache(self):
+        import os
+        from testserver import TestServer
+        from pump.vivopump import get_query_pool, get_vivo_ufid
+        with TestServer(self.ufid_result) as server:
+            parms = dict(QUERY_PARMS, queryuri=server.uri, lookupcache=os.path.join(self.directory, 'lookup'))
+            for i in range(3):
+                self.assertEqual({u'12345678': u'http://vivo.school.edu/individual/n1'}, get_vivo_ufid(parms))
+            self.assertEqual(1, len(server.requests))
+            get_query_pool().close()
+
+    def test_lookup_ttl(self):
+        import os
+        from testserver import TestServer
+        from pump.vivopump import get_query_pool, get_vivo_ufid
+        with TestServer(self.ufid_result) as server:
+            parms = dict(QUERY_PARMS, queryuri=server.uri, lookupcache=os.path.join(self.directory, 'lookup'),
+                         lookupttl='0')
+            get_vivo_ufid(parms)
+            get_vivo_ufid(parms)
+            self.assertEqual(2, len(server.requests))
+            get_query_pool().close()
+
+    def test_no_lookup_cache(self):
+        from testserver import TestServer
+        from pump.vivopump import get_query_pool, get_vivo_ufid
+        with TestServer(self.ufid_result) as server:
+            parms = dict(QUERY_PARMS, queryuri=server.uri)
+            get_vivo_ufid(parms)
+            get_vivo_ufid(parms)
+            self.assertEqual(2, len(server.requests))
+            get_query_pool().close()
+
+    def test_invalidate_lookup_cache(self):
+        import os
+        from testserver import TestServer
+        from pump.vivopump import get_query_pool, get_vivo_ufid, invalidate_lookup_cache
+        with TestServer(self.ufid_result) as server:
+            parms = dict(QUERY_PARMS, queryuri=server.uri, lookupcache=os.path.join(self.directory, 'lookup'))
+            get_vivo_ufid(parms)
+            get_vivo_ufid(dict(parms, queryuri=server.uri + '?other'))
+            self.assertEqual(1, invalidate_lookup_cache(parms))
+            get_vivo_ufid(parms)
+            get_vivo_ufid(dict(parms, queryuri=server.uri + '?other'))
+            self.assertEqual(3, len(server.requests))
+            get_query_pool().close()
+
+    def test_concurrent_writers(self):
+        """
+        Filters of a pipeline write the lookup cache at the same time.  No entry is lost
+        """
+        import os
+        from multiprocessing import Process
+        file_name = os.path.join(self.directory, 'lookup')
+        processes = [Process(target=write_lookup_entries, args=(file_name, i)) for i in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        from pump.vivopump import _LockedShelf
+        with _LockedShelf(file_name) as cache:
+            self.assertEqual(80, len(cache.keys()))
+
+    def test_concurrent_lookups(self):
+        """
+        Filters of a pipeline look up the same query at the same time.  VIVO is queried once
+        """
+        import os
+        import time
+        from multiprocessing import Process
+        from testserver import TestServer
+
+        def slow_ufid_result(fields):
+            time.sleep(0.2)
+            return self.ufid_result(fields)
+        with TestServer(slow_ufid_result) as server:
+            parms = dict(QUERY_PARMS, queryuri=server.uri, lookupcache=os.path.join(self.directory, 'lookup'))
+            processes = [Process(target=lookup_ufids, args=(parms,)) for i in range(4)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            self.assertEqual(1, len(server.requests))
+            self.assertEqual([0, 0, 0, 0], [process.exitcode for process in processes])
+
+
+def lookup_ufids(parms):
+    from pump.vivopump import get_vivo_ufid
+    assert get_vivo_ufid(parms) == {u'12345678': u'http://vivo.school.edu/individual/n1'}
+
+
+def write_lookup_entries(file_name, n):
+    from pump.vivopump import _LockedShelf
+    for i in range(20):
+        with _LockedShelf(file_name) as cache:
+            cache[str(n) + '_' + str(i)] = {'results': range(100)}
+
+
+class UriAllocatorTestCase(unittest.TestCase):
+
+    def test_block_allocation(self):
+        import re
+        from testserver import TestServer
+        from pump.vivopump import UriAllocator, get_query_pool
+        used = []
+
+        def first_in_use(fields):
+            uri = re.findall('VALUES \\?uri { <([^>]*)>', fields['query'])[0]
+            used.append(uri)
+            return 200, 'application/sparql-results+json', \
+                '{"head": {"vars": ["uri"]}, "results": {"bindings": [{"uri": {"type": "uri", "value": "' + uri + \
+                '"}}]}}'
+        with TestServer(first_in_use) as server:
+            allocator = UriAllocator(dict(QUERY_PARMS, queryuri=server.uri), block_size=5)
+            uris = [allocator.new_uri() for i in range(10)]
+            get_query_pool().close()
+        self.assertEqual(len(set(uris)), 10)
+        self.assertTrue(all(uri.startswith(QUERY_PARMS['uriprefix']) for uri in uris))
+        self.assertEqual(set(uris) & set(used), set())
+        self.assertEqual(len(server.requests), 4)
+
+    def test_reserve(self):
+        from testserver import TestServer
+        from pump.vivopump import UriAllocator, get_query_pool
+        with TestServer() as server:
+            allocator = UriAllocator(dict(QUERY_PARMS, queryuri=server.uri), block_size=5)
+            allocator.reserve(20)
+            uris = [allocator.new_uri() for i in range(20)]
+            get_query_pool().close()
+        self.assertEqual(len(set(uris)), 20)
+        self.assertEqual(len(server.requests), 1)
+
+    def test_reserve_batches(self):
+        from testserver import TestServer
+        from pump.vivopump import UriAllocator, get_query_pool, VALUES_BATCH_SIZE
+        with TestServer() as server:
+            allocator = UriAllocator(dict(QUERY_PARMS, queryuri=server.uri), block_size=5)
+            allocator.reserve(2 * VALUES_BATCH_SIZE + 1)
+            get_query_pool().close()
+        self.assertEqual(len(allocator.available), 2 * VALUES_BATCH_SIZE + 1)
+        self.assertEqual(len(server.requests), 3)
+
+
 class VIVOGetTypesTestCase(unittest.TestCase):
 
     def test_vivo_get_types(self):
@@ -366,6 +731,81 @@ class PumpGetTestCase(unittest.TestCase):
         self.assertEqual(5, nfac)
 
 
+class PumpGetSortTestCase(unittest.TestCase):
+
+    def test_sorted_single_pass(self):
+        import os
+        import json
+        import tempfile
+        from testserver import TestServer
+        from pump.vivopump import read_csv, get_query_pool
+        names = {'n1': u'Zeta Hall', 'n2': u'Alpha Hall', 'n3': u'Mu Ελληνικά Hall', 'n4': u'Alpha Hall'}
+
+        def buildings(fields):
+            bindings = [{"uri": {"type": "uri", "value": "http://vivo.school.edu/individual/" + uri},
+                         "name": {"type": "literal", "value": name}} for uri, name in names.items()]
+            return 200, 'application/sparql-results+json', json.dumps({"head": {"vars": ["uri", "name"]},
+                                                                       "results": {"bindings": bindings}})
+        handle, filename = tempfile.mkstemp()
+        os.close(handle)
+        p = Pump("data/building_def.json", filename)
+        p.filter = False
+        with TestServer(buildings) as server:
+            p.query_parms['queryuri'] = server.uri
+            n_rows = p.get()
+            get_query_pool().close()
+        lines = open(filename).readlines()
+        data = read_csv(filename, delimiter='\t')
+        os.remove(filename)
+        self.assertEqual(n_rows, 4)
+        self.assertEqual(lines[0].strip().split('\t'), ['uri'] + p.update_def['entity_def']['order'])
+        self.assertEqual([data[row]['uri'][-2:] for row in sorted(data)], ['n2', 'n4', 'n3', 'n1'])
+        self.assertEqual(data[3]['name'], u'Mu &#917;&#955;&#955;&#951;&#957;&#953;&#954;&#940; Hall')
+
+    def test_filter_distinct_values(self):
+        import os
+        import json
+        import tempfile
+        import improve.improve
+        from testserver import TestServer
+        from pump.vivopump import read_csv, get_query_pool
+        calls = []
+        improve_function = improve.improve.improve
+
+        def counting_improve(filter_name, s):
+            calls.append(s)
+            return improve_function(filter_name, s)
+
+        def buildings(fields):
+            bindings = [{"uri": {"type": "uri", "value": "http://vivo.school.edu/individual/n" + str(i)},
+                         "name": {"type": "literal", "value": "smith hall" if i % 2 else "jones hall"}}
+                        for i in range(10)]
+            return 200, 'application/sparql-results+json', json.dumps({"head": {"vars": ["uri", "name"]},
+                                                                       "results": {"bindings": bindings}})
+        handle, filename = tempfile.mkstemp()
+        os.close(handle)
+        p = Pump("data/building_def.json", filename)
+        improve.improve.improve = counting_improve
+        try:
+            with TestServer(buildings) as server:
+                p.query_parms['queryuri'] = server.uri
+                p.get()
+                get_query_pool().close()
+        finally:
+            improve.improve.improve = improve_function
+        data = read_csv(filename, delimiter='\t')
+        os.remove(filename)
+        self.assertEqual(sorted(calls), ['jones hall', 'smith hall'])
+        self.assertEqual([data[row]['name'] for row in sorted(data)], ['Jones Hall'] * 5 + ['Smith Hall'] * 5)
+
+    def test_external_sort(self):
+        import random
+        from pump.vivopump import external_sort
+        items = [(random.random(), str(i)) for i in range(100)]
+        self.assertEqual(list(external_sort(items, run_size=7)), sorted(items))
+        self.assertEqual(list(external_sort([], run_size=7)), [])
+
+
 class PumpUpdateCallTestCase(unittest.TestCase):
 
     def test_default_usage(self):
@@ -406,6 +846,61 @@ class PumpUpdateCallTestCase(unittest.TestCase):
                                                  URIRef("http://vivoweb.org/ontology/core#Building")) in add)
 
 
+class CompileUpdateDefTestCase(unittest.TestCase):
+    def test_plan(self):
+        from rdflib import URIRef
+        from pump.vivopump import compile_update_def
+        update_def = read_update_def('data/grant_def.json', prefix=QUERY_PARMS['prefix'])
+        plan = compile_update_def(update_def)
+        self.assertEqual(update_def['column_defs'].keys(), [column.name for column in plan.columns])
+        self.assertEqual(URIRef('http://vivoweb.org/ontology/core#Grant'), plan.entity_type)
+        end_date = plan.column_defs['end_date']
+        self.assertEqual(3, end_date.path_length)
+        self.assertTrue(end_date.unique)
+        self.assertTrue(end_date.leaf is end_date.steps[-1])
+        self.assertEqual('end_date', end_date.leaf.name)
+        self.assertTrue(end_date.leaf.literal)
+        self.assertEqual(update_def['column_defs']['end_date'][-1]['predicate']['ref'], end_date.leaf.predicate)
+        pis = plan.column_defs['pis']
+        self.assertFalse(pis.unique)
+        self.assertTrue(pis.leaf.multiple)
+        self.assertEqual(update_def['column_defs']['pis'][-1]['object']['enum'], pis.leaf.enum)
+
+    def test_closure_columns(self):
+        from pump.vivopump import compile_update_def
+        update_def = read_update_def('data/teaching_def.json', prefix=QUERY_PARMS['prefix'])
+        plan = compile_update_def(update_def)
+        closures = [column for column in plan.columns if column.closure]
+        self.assertEqual(sorted(update_def['closure_defs'].keys()), sorted(column.name for column in closures))
+        self.assertTrue(all(column.leaf.closure and column.leaf.last for column in closures))
+        self.assertEqual(sorted(update_def['column_defs'].keys()), sorted(plan.column_defs.keys()))
+
+    def test_slots(self):
+        from pump.vivopump import compile_update_def
+        plan = compile_update_def(read_update_def('data/grant_def.json', prefix=QUERY_PARMS['prefix']))
+        with self.assertRaises(AttributeError):
+            plan.columns[0].leaf.extra = 1
+
+    def test_boolean_values_step(self):
+        from pump.vivopump import Column
+        path = [{"predicate": {"single": False, "ref": "http://a"}, "object": {"literal": False, "multiple": True}},
+                {"predicate": {"single": "boolean", "ref": "http://b"},
+                 "object": {"literal": True, "value": "x", "multiple": True}}]
+        column = Column('b', path)
+        self.assertTrue(column.leaf.boolean)
+        self.assertFalse(column.values_step.boolean)
+        self.assertEqual('boolean', path[1]['predicate']['single'])
+
+    def test_prepare_column_values(self):
+        from pump.vivopump import prepare_column_values, compile_update_def
+        update_def = read_update_def('data/grant_def.json', prefix=QUERY_PARMS['prefix'])
+        plan = compile_update_def(update_def)
+        self.assertEqual(prepare_column_values(u' Award ', ';', update_def['column_defs']['award_id'][-1], {}, 1,
+                                               'award_id'),
+                         prepare_column_values(u' Award ', ';', plan.column_defs['award_id'].values_step, {}, 1,
+                                               'award_id'))
+
+
 class MakeRdfTermFromSourceTestCase(unittest.TestCase):
     def test_empty(self):
         from rdflib import Literal
@@ -476,6 +971,402 @@ class MakeRdfTermFromSourceTestCase(unittest.TestCase):
         self.assertTrue(unicode(rdf_term) == unicode(URIRef("http://any")))
 
 
+class QualifiedStepTestCase(unittest.TestCase):
+
+    def test_prefetch(self):
+        import json
+        from rdflib import Graph, URIRef, Literal, RDF, XSD
+        from testserver import TestServer
+        from pump.vivopump import get_query_pool
+        n = 'http://vivo.school.edu/individual/n'
+        vcard = 'http://www.w3.org/2006/vcard/ns#'
+        original = Graph()
+        for i in ['1', '2']:
+            original.add((URIRef(n + i), URIRef('http://purl.obolibrary.org/obo/ARG_2000028'), URIRef(n + 'v' + i)))
+            original.add((URIRef(n + 'v' + i), RDF.type, URIRef(vcard + 'Kind')))
+            original.add((URIRef(n + 'v' + i), URIRef(vcard + 'hasURL'), URIRef(n + 'u' + i)))
+            original.add((URIRef(n + 'u' + i), RDF.type, URIRef(vcard + 'URL')))
+            original.add((URIRef(n + 'u' + i), URIRef(vcard + 'url'), Literal('http://old' + i)))
+
+        def home_pages(fields):
+            bindings = [{"uri": {"type": "uri", "value": n + 'v' + i}, "o": {"type": "uri", "value": n + 'u' + i}}
+                        for i in ['1', '2']]
+            return 200, 'application/sparql-results+json', json.dumps({"head": {"vars": ["uri", "o"]},
+                                                                       "results": {"bindings": bindings}})
+        p = Pump("data/org_def.json")
+        p.update_data = {1: {u'uri': n + '1', u'home_page': u'http://new1'},
+                         2: {u'uri': n + '2', u'home_page': u'http://new2'}}
+        p.original_graph = original
+        with TestServer(home_pages) as server:
+            p.query_parms['queryuri'] = server.uri
+            [add, sub] = p.update()
+            get_query_pool().close()
+        self.assertEqual(len(server.requests), 1)
+        self.assertTrue('VALUES ?uri { <' + n + 'v1> <' + n + 'v2> }' in server.requests[0]['query'])
+        self.assertEqual(set(add.objects(None, URIRef(vcard + 'url'))),
+                         {Literal('http://new1', datatype=XSD.string), Literal('http://new2', datatype=XSD.string)})
+        self.assertEqual(len(sub), 2)
+
+
+class PathUpdateTestCase(unittest.TestCase):
+
+    def test_path_length_four(self):
+        from rdflib import Graph, URIRef, Literal, RDF
+        from pump.vivopump import UriAllocator
+        n = 'http://vivo.school.edu/individual/n'
+        vivo = 'http://vivoweb.org/ontology/core#'
+        datetime = URIRef('http://www.w3.org/2001/XMLSchema#datetime')
+        original = Graph()
+        original.add((URIRef(n + '1'), RDF.type, URIRef(vivo + 'Grant')))
+        original.add((URIRef(n + '1'), URIRef(vivo + 'dateTimeInterval'), URIRef(n + 'i1')))
+        original.add((URIRef(n + 'i1'), RDF.type, URIRef(vivo + 'DateTimeInterval')))
+        original.add((URIRef(n + 'i1'), URIRef(vivo + 'start'), URIRef(n + 's1')))
+        original.add((URIRef(n + 's1'), RDF.type, URIRef(vivo + 'DateTimeValue')))
+        original.add((URIRef(n + 's1'), URIRef(vivo + 'dateTime'), URIRef(n + 'd1')))
+        original.add((URIRef(n + 'd1'), RDF.type, URIRef(vivo + 'DateTimeValue')))
+        original.add((URIRef(n + 'd1'), URIRef(vivo + 'evenMore'), Literal('2015-01-01', datatype=datetime)))
+        original.add((URIRef(n + '2'), RDF.type, URIRef(vivo + 'Grant')))
+        p = Pump('data/grant_path_length_four_def.json')
+        p.update_data = {1: {u'uri': n + '1', u'length_four': u'2016-01-01'},
+                         2: {u'uri': n + '2', u'length_four': u'2017-01-01'}}
+        p.original_graph = original
+        p.uri_allocator = UriAllocator(p.query_parms)
+        p.uri_allocator.available.extend([n + 'i2', n + 's2', n + 'd2'])
+        [add, sub] = p.update()
+        self.assertEqual(set(sub), {(URIRef(n + 'd1'), URIRef(vivo + 'evenMore'),
+                                     Literal('2015-01-01', datatype=datetime))})
+        self.assertEqual(len(add), 8)
+        self.assertTrue((URIRef(n + 'd1'), URIRef(vivo + 'evenMore'), Literal('2016-01-01', datatype=datetime))
+                        in add)
+        self.assertTrue((URIRef(n + '2'), URIRef(vivo + 'dateTimeInterval'), URIRef(n + 'i2')) in add)
+        self.assertTrue((URIRef(n + 's2'), URIRef(vivo + 'dateTime'), URIRef(n + 'd2')) in add)
+        self.assertTrue((URIRef(n + 'd2'), URIRef(vivo + 'evenMore'), Literal('2017-01-01', datatype=datetime))
+                        in add)
+
+
+class OverlayGraphTestCase(unittest.TestCase):
+
+    def test_changes(self):
+        from rdflib import URIRef, Literal, RDFS
+        from testgraph import TestGraph
+        from pump.vivopump import OverlayGraph
+        original = TestGraph()
+        n = len(original)
+        g = OverlayGraph(original)
+        uri = URIRef('http://vivo.school.edu/individual/n25674')
+        label = (uri, RDFS.label, Literal("Doe, John"))
+        new_label = (uri, RDFS.label, Literal("Doe, Jane"))
+        self.assertTrue(label in g)
+        g.remove((uri, RDFS.label, None))
+        g.add(new_label)
+        self.assertFalse(label in g)
+        self.assertTrue(new_label in g)
+        self.assertTrue((uri, RDFS.label, None) in g)
+        self.assertEqual(list(g.objects(uri, RDFS.label)), [Literal("Doe, Jane")])
+        self.assertEqual(len(g), n)
+        self.assertEqual(len(original), n)
+        self.assertEqual(set(g.add_graph()), {new_label})
+        self.assertEqual(set(g.sub_graph()), {label})
+        self.assertTrue(g.add_graph() is g.added and g.sub_graph() is g.removed)
+
+    def test_undo(self):
+        from rdflib import URIRef, Literal, RDFS
+        from testgraph import TestGraph
+        from pump.vivopump import OverlayGraph
+        original = TestGraph()
+        g = OverlayGraph(original)
+        uri = URIRef('http://vivo.school.edu/individual/n25674')
+        g.remove((uri, None, None))
+        g.remove((None, None, uri))
+        for triple in original:
+            g.add(triple)
+        g.add((uri, RDFS.label, Literal("Doe, Jane")))
+        g.remove((uri, RDFS.label, Literal("Doe, Jane")))
+        self.assertEqual(len(g.add_graph()), 0)
+        self.assertEqual(len(g.sub_graph()), 0)
+        self.assertEqual(set(g), set(original))
+
+
+class StepIndexTestCase(unittest.TestCase):
+
+    def test_index_follows_overlay(self):
+        from rdflib import URIRef, Literal, RDF, RDFS
+        from testgraph import TestGraph
+        from pump.vivopump import OverlayGraph
+        g = OverlayGraph(TestGraph())
+        uri = URIRef('http://vivo.school.edu/individual/n25674')
+        self.assertEqual(g.index.objects(uri, RDFS.label), {Literal("Doe, John")})
+        self.assertTrue(g.index.has_type(uri, URIRef('http://xmlns.com/foaf/0.1/Person')))
+        g.remove((uri, RDFS.label, None))
+        g.add((uri, RDFS.label, Literal("Doe, Jane")))
+        g.remove((uri, RDF.type, None))
+        self.assertEqual(g.index.objects(uri, RDFS.label), {Literal("Doe, Jane")})
+        self.assertFalse(g.index.has_type(uri, URIRef('http://xmlns.com/foaf/0.1/Person')))
+        self.assertEqual(g.index.objects(URIRef('http://vivo.school.edu/individual/n0'), RDFS.label), set())
+
+
+class LazyLoggingTestCase(unittest.TestCase):
+
+    def test_lazy_format(self):
+        from pump.vivopump import LazyFormat
+        message = LazyFormat(u"{} {name}", u'ქართული', name=1)
+        self.assertEqual(unicode(message), u'ქართული 1')
+        self.assertEqual(str(message), u'ქართული 1'.encode('utf-8'))
+
+    def test_not_formatted(self):
+        import logging
+        from pump.vivopump import LazyFormat
+
+        class Unformattable(object):
+            def __format__(self, spec):
+                raise AssertionError("formatted")
+        logger = logging.getLogger('pump.test')
+        logger.setLevel(logging.INFO)
+        logger.debug(LazyFormat(u"{}", Unformattable()))
+
+    def test_diff_file(self):
+        import os
+        import logging
+        import tempfile
+        from testgraph import TestGraph
+        from pump.vivopump import log_diffs, diff_logger
+        handle, filename = tempfile.mkstemp()
+        os.close(handle)
+        log_diffs(filename)
+        try:
+            p = Pump("data/person_def.json")
+            p.update_data = {1: {u'uri': u'http://vivo.school.edu/individual/n711', u'name': u'Ann'}}
+            p.original_graph = TestGraph()
+            p.update()
+        finally:
+            for handler in diff_logger.handlers:
+                handler.close()
+                diff_logger.removeHandler(handler)
+            diff_logger.setLevel(logging.CRITICAL)
+        diffs = open(filename).read()
+        os.remove(filename)
+        self.assertTrue('"Ann"' in diffs)
+        self.assertTrue('Triples to sub' in diffs)
+
+
+class NTriplesWriterTestCase(unittest.TestCase):
+
+    def test_write(self):
+        import os
+        import tempfile
+        from rdflib import Graph
+        from testgraph import TestGraph
+        from pump.vivopump import NTriplesWriter
+        handle, filename = tempfile.mkstemp()
+        os.close(handle)
+        with NTriplesWriter(filename) as writer:
+            writer.write_graph(TestGraph())
+        g = Graph()
+        g.parse(filename, format='nt')
+        os.remove(filename)
+        self.assertEqual(set(g), set(TestGraph()))
+        self.assertEqual(writer.count, len(TestGraph()))
+
+    def test_sorted_compressed(self):
+        import os
+        import gzip
+        import tempfile
+        from testgraph import TestGraph
+        from pump.vivopump import NTriplesWriter
+        handle, filename = tempfile.mkstemp()
+        os.close(handle)
+        triples = list(TestGraph())
+        with NTriplesWriter(filename, compress=True, sort=True, run_size=3) as writer:
+            writer.write_graph(triples)
+            writer.write_graph(reversed(triples))
+        lines = gzip.open(filename).readlines()
+        os.remove(filename)
+        self.assertEqual(len(lines), len(triples))
+        self.assertEqual(lines, sorted(lines))
+        self.assertEqual(writer.count, len(triples))
+
+    def test_nt_line(self):
+        from rdflib import Graph, URIRef, Literal, BNode, XSD
+        from pump.vivopump import nt_line
+        s = URIRef('http://vivo.school.edu/individual/n1')
+        p = URIRef('http://xmlns.com/foaf/0.1/name')
+        self.assertEqual('<http://vivo.school.edu/individual/n1> <http://xmlns.com/foaf/0.1/name> '
+                         '"M\\u00FCller \\"Q\\" \\\\\\n\\U0001F600"@de .\n',
+                         nt_line((s, p, Literal(u'M\xfcller "Q" \\\n\U0001F600', lang='de'))))
+        self.assertEqual('<http://vivo.school.edu/individual/n1> <http://xmlns.com/foaf/0.1/name> _:b1 .\n',
+                         nt_line((s, p, BNode('b1'))))
+        triples = [(s, p, Literal(u'M\xfcller "Q" \\\n\r\u2603')), (s, p, Literal('2016-01-01', datatype=XSD.date)),
+                   (s, p, URIRef(u'http://vivo.school.edu/individual/\xe9'))]
+        g = Graph()
+        g.parse(data=''.join(nt_line(triple) for triple in triples), format='nt')
+        self.assertEqual(set(triples), set(g))
+
+
+class ApplyUpdateFilesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        from testgraph import TestGraph
+        from pump.vivopump import NTriplesWriter
+        self.directory = tempfile.mkdtemp()
+        self.add_filename = self.directory + '/pump_add.nt'
+        self.sub_filename = self.directory + '/pump_sub.nt'
+        self.checkpoint_filename = self.directory + '/pump_apply.txt'
+        triples = sorted(TestGraph())
+        self.n = len(triples)
+        with NTriplesWriter(self.add_filename) as writer:
+            writer.write_graph(triples[:10])
+        with NTriplesWriter(self.sub_filename) as writer:
+            writer.write_graph(triples[10:])
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.directory)
+
+    def apply(self, server, **kwargs):
+        from pump.vivopump import apply_update_files, get_query_pool
+        parms = dict(QUERY_PARMS, updateuri=server.uri)
+        result = apply_update_files(self.add_filename, self.sub_filename, parms, batch_size=3,
+                                    checkpoint_filename=self.checkpoint_filename, retry_delay=0, **kwargs)
+        get_query_pool().close()
+        return result
+
+    def test_batches(self):
+        from testserver import TestServer
+        with TestServer(lambda fields: (200, 'text/plain', '')) as server:
+            [n_sub, n_add] = self.apply(server, workers=2)
+        self.assertEqual([n_sub, n_add], [self.n - 10, 10])
+        inserts = [x['update'] for x in server.requests if x['update'].startswith('INSERT DATA')]
+        deletes = [x['update'] for x in server.requests if x['update'].startswith('DELETE DATA')]
+        self.assertEqual(len(inserts), 4)
+        self.assertEqual(len(inserts) + len(deletes), len(server.requests))
+        self.assertEqual(sum(x.count(' .\n') for x in inserts + deletes), self.n)
+        self.assertEqual(len(open(self.checkpoint_filename).readlines()), len(server.requests) + 1)
+
+    def test_retry_and_resume(self):
+        from testserver import TestServer
+        failures = []
+
+        def fail_once(fields):
+            if len(failures) == 0:
+                failures.append(fields)
+                return 500, 'text/plain', 'Internal error'
+            return 200, 'text/plain', ''
+        from pump.vivopump import make_checkpoint_header
+        open(self.checkpoint_filename, 'w').write(make_checkpoint_header(self.add_filename, self.sub_filename, 3) +
+                                                  '\nadd 0\nadd 1\n')
+        with TestServer(fail_once) as server:
+            [n_sub, n_add] = self.apply(server)
+        self.assertEqual([n_sub, n_add], [self.n - 10, 4])
+        self.assertEqual(len(failures), 1)
+        self.assertEqual(server.requests[0], server.requests[1])
+
+    def test_checkpoint_mismatch(self):
+        """
+        A checkpoint of other update files or another batch size is not resumed
+        """
+        import os
+        from testserver import TestServer
+        from pump.vivopump import make_checkpoint_header
+        header = make_checkpoint_header(self.add_filename, self.sub_filename, 3)
+        for checkpoint in ['add 0\nadd 1\n', header.replace('batch_size 3', 'batch_size 2') + '\nadd 0\n']:
+            open(self.checkpoint_filename, 'w').write(checkpoint)
+            with TestServer(lambda fields: (200, 'text/plain', '')) as server:
+                self.assertEqual([self.n - 10, 10], self.apply(server))
+            self.assertEqual(header, open(self.checkpoint_filename).readline().strip())
+        os.utime(self.add_filename, (0, 0))
+        with TestServer(lambda fields: (200, 'text/plain', '')) as server:
+            self.assertEqual([self.n - 10, 10], self.apply(server))
+
+    def test_read_checkpoint(self):
+        from pump.vivopump import make_checkpoint_header, read_checkpoint
+        self.assertIsNone(read_checkpoint(self.checkpoint_filename, self.add_filename, self.sub_filename, 3))
+        open(self.checkpoint_filename, 'w').write(make_checkpoint_header(self.add_filename, self.sub_filename, 3) +
+                                                  '\nadd 0\n')
+        self.assertEqual({'add 0'}, read_checkpoint(self.checkpoint_filename, self.add_filename, self.sub_filename,
+                                                    3))
+        self.assertIsNone(read_checkpoint(self.checkpoint_filename, self.add_filename, self.sub_filename, 2))
+
+    def test_failure(self):
+        import urllib2
+        from testserver import TestServer
+        with TestServer(lambda fields: (503, 'text/plain', 'Unavailable')) as server:
+            with self.assertRaises(urllib2.URLError):
+                self.apply(server, retries=1)
+        self.assertEqual(len(server.requests), 2)
+
+    def test_rejected(self):
+        """
+        An update VIVO rejects is not retried
+        """
+        import urllib2
+        from testserver import TestServer
+        with TestServer(lambda fields: (403, 'text/plain', 'Forbidden')) as server:
+            with self.assertRaises(urllib2.HTTPError):
+                self.apply(server, retries=3)
+        self.assertEqual(len(server.requests), 1)
+
+
+class PumpUpdateChunksTestCase(unittest.TestCase):
+
+    def test_add_values_clause(self):
+        from pump.vivopump import add_values_clause
+        self.assertEqual(add_values_clause('?uri a foaf:Person .', ['http://a', 'http://b']),
+                         'VALUES ?uri { <http://a> <http://b> }\n    ?uri a foaf:Person .')
+
+    def test_chunks(self):
+        from testserver import TestServer
+        from pump.vivopump import get_query_pool
+        p = Pump("data/person_def.json")
+        p.update_data = {1: {u'uri': u'http://vivo.school.edu/individual/n1', u'name': u'Ann'},
+                         2: {u'uri': u'http://vivo.school.edu/individual/n2', u'name': u'Bob'},
+                         3: {u'uri': u'http://vivo.school.edu/individual/n1', u'name': u'Cat'},
+                         4: {u'uri': u'http://vivo.school.edu/individual/n3', u'name': u'Dan'}}
+        with TestServer() as server:
+            p.query_parms['queryuri'] = server.uri
+            updates = list(p.update_chunks(2))
+            get_query_pool().close()
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(sum(len(add) for add, sub in updates), 6)
+        values = [x['query'] for x in server.requests if 'VALUES ?uri' in x['query']]
+        self.assertEqual(len(values), len(server.requests))
+        self.assertTrue('<http://vivo.school.edu/individual/n3>' in values[-1])
+        self.assertEqual(len(p.update_data), 4)
+
+    def test_merge_chunk(self):
+        from testserver import TestServer
+        from pump.vivopump import get_query_pool
+        p = Pump("data/person_def.json")
+        p.update_data = {1: {u'uri': u'http://vivo.school.edu/individual/n1', u'name': u'Ann', u'action': u'a1'},
+                         2: {u'uri': u'http://vivo.school.edu/individual/n2', u'name': u'Bob', u'action': u''},
+                         3: {u'uri': u'http://vivo.school.edu/individual/n3', u'name': u'Ann', u'action': u'a'}}
+        with TestServer() as server:
+            p.query_parms['queryuri'] = server.uri
+            updates = list(p.update_chunks(1))
+            get_query_pool().close()
+        self.assertEqual(len(updates), 2)
+
+    def test_merge_chunk_uri_rows(self):
+        """
+        All the rows of a uri with a merge action are in the merge chunk
+        """
+        from testserver import TestServer
+        from pump.vivopump import get_query_pool
+        p = Pump("data/person_def.json")
+        p.update_data = {1: {u'uri': u'http://vivo.school.edu/individual/n1', u'name': u'Ann', u'action': u''},
+                         2: {u'uri': u'http://vivo.school.edu/individual/n2', u'name': u'Bob', u'action': u''},
+                         3: {u'uri': u'http://vivo.school.edu/individual/n1', u'name': u'Ann', u'action': u'a1'},
+                         4: {u'uri': u'http://vivo.school.edu/individual/n3', u'name': u'Ann', u'action': u'a'}}
+        with TestServer() as server:
+            p.query_parms['queryuri'] = server.uri
+            updates = list(p.update_chunks(1))
+            get_query_pool().close()
+        self.assertEqual(len(updates), 2)
+        values = [x['query'] for x in server.requests if 'VALUES ?uri' in x['query']]
+        self.assertFalse(any('individual/n1>' in query for query in values if 'individual/n2>' in query))
+        self.assertTrue(any('individual/n1>' in query and 'individual/n3>' in query for query in values))
+
+
 class PumpUpdateLiteralsTestCase(unittest.TestCase):
 
     def test_add_unicode(self):
@@ -0,0 +1,77 @@
+#!/usr/bin/env/python
+# coding=utf-8
+""" testserver.py -- A local stand-in for a VIVO SPARQL API, for tests that must not depend on a live VIVO.  Other
+    form posting APIs, such as Entrez, can be stood in for at base_uri
+"""
+
+import threading
+import urlparse
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+__author__ = "Michael Conlon"
+__copyright__ = "Copyright 2016 (c) Michael Conlon"
+__license__ = "New BSD license"
+__version__ = "1.1.2"
+
+
+def empty_result(fields):
+    """
+    Default responder.  Return an empty SPARQL result set for every request
+    """
+    return 200, 'application/sparql-results+json', '{"head": {"vars": []}, "results": {"bindings": []}}'
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class TestServer(object):
+    """
+    A keep-alive HTTP server on localhost.  Each POST is answered by the responder, a function of the posted
+    form fields returning status, content type and body.  The server counts the connections it accepts and
+    records the fields of each request.
+    """
+    def __init__(self, responder=empty_result):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                with server.lock:
+                    server.connections += 1
+
+            def do_POST(self):
+                length = int(self.headers.getheader('content-length', 0))
+                fields = dict(urlparse.parse_qsl(self.rfile.read(length)))
+                with server.lock:
+                    server.requests.append(fields)
+                status, content_type, body = server.responder(fields)
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.responder = responder
+        self.connections = 0
+        self.requests = []
+        self.lock = threading.Lock()
+        self.httpd = _ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_uri = 'http://127.0.0.1:' + str(self.httpd.server_address[1]) + '/'
+        self.uri = self.base_uri + 'vivo/api/sparqlQuery'
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
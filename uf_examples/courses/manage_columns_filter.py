@@ -9,36 +9,29 @@ __copyright__ = "Copyright 2016 (c) Michael Conlon"
 __license__ = "New BSD License"
 __version__ = "0.01"
 
-import sys
+from improve.improve import improve
+from pump.pipeline import run_row_filter
 
-from pump.vivopump import read_csv_fp, write_csv_fp, improve_course_title
 
-data_in = read_csv_fp(sys.stdin)
-var_names = data_in[data_in.keys()[1]].keys()  # create a list of var_names from the first row
-print >>sys.stderr, "Columns in", var_names
-data_out = {}
-for row, data in data_in.items():
-    new_data =dict(data)
+def filter_row(row, parms):
+    """
+    Add the columns the pump needs and delete the upper case source columns
+    """
 
     # Add these columns
 
-    new_data['remove'] = ''
-    new_data['uri'] = ''
-    new_data['title'] = improve_course_title(new_data['UF_COURSE_TITLE'])
-    new_data['ccn'] = new_data['UF_COURSE_CD']
+    row['remove'] = ''
+    row['uri'] = ''
+    row['title'] = improve('improve_course_title', row['UF_COURSE_TITLE'])
+    row['ccn'] = row['UF_COURSE_CD']
 
     # Delete all the upper case column names
 
-    for name in new_data.keys():
+    for name in row.keys():
         if name == name.upper():
-            del new_data[name]
-
-    data_out[row] = new_data
-var_names = data_out[data_out.keys()[1]].keys()  # create a list of var_names from the first row
-print >>sys.stderr, "Columns out", var_names
-write_csv_fp(sys.stdout, data_out)
-
-
-
+            del row[name]
+    return row
 
 
+if __name__ == "__main__":
+    run_row_filter(filter_row)
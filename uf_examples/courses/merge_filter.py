@@ -23,27 +23,30 @@ __version__ = "0.02"
 
 import sys
 
-from pump.vivopump import read_csv_fp, write_csv_fp, get_vivo_ccn, get_parms
+from pump.vivopump import get_vivo_ccn, get_parms
+from pump.pipeline import run_data_filter
 
-parms = get_parms()
-data_in = read_csv_fp(sys.stdin)
-print >>sys.stderr, len(data_in)
-data_out = {}
-vivo_courses = get_vivo_ccn(parms)  # get dictionary of course uri keyed by ccn
-print >>sys.stderr, 'VIVO courses', len(vivo_courses)
-
-for row, data in data_in.items():
-    new_data = dict(data)
-    if data['ccn'] in vivo_courses:  # ccn is in vivo and source
-        new_data['uri'] = vivo_courses[data['ccn']]
-    else:  # key is in source, not in vivo
-        new_data['uri'] = ''
-    data_out[row] = new_data
-
-print >>sys.stderr, 'data out', len(data_out)
-write_csv_fp(sys.stdout, data_out)
 
+def filter_data(data_in, parms):
+    """
+    Add the VIVO uri of each course found in VIVO
+    """
+    print >>sys.stderr, len(data_in)
+    data_out = {}
+    vivo_courses = get_vivo_ccn(parms)  # get dictionary of course uri keyed by ccn
+    print >>sys.stderr, 'VIVO courses', len(vivo_courses)
 
+    for row, data in data_in.items():
+        new_data = dict(data)
+        if data['ccn'] in vivo_courses:  # ccn is in vivo and source
+            new_data['uri'] = vivo_courses[data['ccn']]
+        else:  # key is in source, not in vivo
+            new_data['uri'] = ''
+        data_out[row] = new_data
 
+    print >>sys.stderr, 'data out', len(data_out)
+    return data_out
 
 
+if __name__ == "__main__":
+    run_data_filter(filter_data, get_parms())
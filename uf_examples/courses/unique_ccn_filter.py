@@ -11,21 +11,23 @@ __version__ = "0.01"
 
 import sys
 
-from pump.vivopump import read_csv_fp, write_csv_fp
-
-data_in = read_csv_fp(sys.stdin)
-print >>sys.stderr, "Input rows", len(data_in)
-data_out = {}
-ccn_out = set()
-for row, data in data_in.items():
-    new_data = dict(data)
-    if data['ccn'] not in ccn_out:
-        data_out[row] = new_data
-        ccn_out.add(data['ccn'])
-print >>sys.stderr, "Output rows", len(data_out)
-write_csv_fp(sys.stdout, data_out)
-
-
-
-
-
+from pump.pipeline import run_data_filter
+
+
+def filter_data(data_in, parms):
+    """
+    Keep the first row for each ccn
+    """
+    print >>sys.stderr, "Input rows", len(data_in)
+    data_out = {}
+    ccn_out = set()
+    for row, data in data_in.items():
+        if data['ccn'] not in ccn_out:
+            data_out[row] = dict(data)
+            ccn_out.add(data['ccn'])
+    print >>sys.stderr, "Output rows", len(data_out)
+    return data_out
+
+
+if __name__ == "__main__":
+    run_data_filter(filter_data)
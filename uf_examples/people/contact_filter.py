@@ -10,41 +10,44 @@ __license__ = "New BSD License"
 __version__ = "0.01"
 
 import shelve
-import sys
+from collections import OrderedDict
 
-from pump.vivopump import read_csv_fp, write_csv_fp, improve_phone_number, improve_display_name, \
-    improve_jobcode_description
+from improve.improve import improve
+from pump.pipeline import run_row_filter
 
 contact_shelve = shelve.open('contact.db')
 contact_ufids = set(contact_shelve.keys())  # a set of ufids that will not be in the output
-contact_names = set(contact_shelve[contact_ufids.pop()].keys())
-data_in = read_csv_fp(sys.stdin)
-print >>sys.stderr, len(data_in)
-found = 0
-not_found = 0
-data_out = {}
-for row, data in data_in.items():
-    new_data = dict(data)
-    if data['UFID'] in contact_ufids:
-        found += 1
-        contact_data = contact_shelve[data['UFID']]
+contact_names = set(contact_shelve[next(iter(contact_ufids))].keys())
+counts = OrderedDict([('Found', 0), ('Not found', 0)])
+
+
+def filter_row(row, parms):
+    """
+    Add the contact data for the ufid, or empty contact data if the ufid has none
+    """
+    if row['UFID'] in contact_ufids:
+        counts['Found'] += 1
+        contact_data = contact_shelve[row['UFID']]
         for name, value in contact_data.items():
-            new_data[name] = value
-        new_data['UF_BUSINESS_FAX'] = improve_phone_number(new_data['UF_BUSINESS_FAX'])
-        new_data['UF_BUSINESS_PHONE'] = improve_phone_number(new_data['UF_BUSINESS_PHONE'])
-        new_data['DISPLAY_NAME'] = improve_display_name(new_data['DISPLAY_NAME'])
-        new_data['WORKINGTITLE'] = improve_jobcode_description(new_data['WORKINGTITLE'])
+            row[name] = value
+        row['UF_BUSINESS_FAX'] = improve('improve_phone_number', row['UF_BUSINESS_FAX'])
+        row['UF_BUSINESS_PHONE'] = improve('improve_phone_number', row['UF_BUSINESS_PHONE'])
+        row['DISPLAY_NAME'] = improve('improve_display_name', row['DISPLAY_NAME'])
+        row['WORKINGTITLE'] = improve('improve_jobcode_description', row['WORKINGTITLE'])
     else:
-        not_found += 1
+        counts['Not found'] += 1
         for name in contact_names:
-            new_data[name] = ''
-    data_out[row] = new_data
-print >>sys.stderr, 'Found', found
-print >>sys.stderr, 'Not found', not_found
-write_csv_fp(sys.stdout, data_out)
-contact_shelve.close()
-
+            row[name] = ''
+    return row
 
 
+def close():
+    """
+    Close the contact shelve
+    """
+    contact_shelve.close()
 
 
+if __name__ == "__main__":
+    run_row_filter(filter_row, counts=counts)
+    close()
@@ -14,29 +14,28 @@ import shelve
 import sys
 import re
 
-from pump.vivopump import read_csv_fp, write_csv_fp
+from pump.pipeline import run_row_filter
 
 homedept_shelve = shelve.open('deptid_exceptions.db')
-data_in = read_csv_fp(sys.stdin)
-data_out = {}
-reassign_count = 0
-for row, data in data_in.items():
-    new_data = dict(data)
-
-    # check each pattern
-
-    for pattern_string, action in homedept_shelve.items():
-        pattern = re.compile(pattern_string)
-        if pattern.search(new_data['HOME_DEPT']) is not None:
-            new_data['HOME_DEPT'] = action['assigned_deptid']
-            print >>sys.stderr, "Reassign from", data['HOME_DEPT'], 'to', new_data['HOME_DEPT']
-            reassign_count += 1
-    data_out[row] = new_data
-print >>sys.stderr, 'Reassign count', reassign_count
-write_csv_fp(sys.stdout, data_out)
+homedept_patterns = [(re.compile(pattern_string), action['assigned_deptid'])
+                     for pattern_string, action in homedept_shelve.items()]
 homedept_shelve.close()
 
 
+def filter_row(row, parms):
+    """
+    Reassign the home department of the row if it matches a pattern
+    """
+    home_dept = row['HOME_DEPT']
+
+    # check each pattern
 
+    for pattern, assigned_deptid in homedept_patterns:
+        if pattern.search(row['HOME_DEPT']) is not None:
+            row['HOME_DEPT'] = assigned_deptid
+            print >>sys.stderr, "Reassign from", home_dept, 'to', row['HOME_DEPT']
+    return row
 
 
+if __name__ == "__main__":
+    run_row_filter(filter_row)
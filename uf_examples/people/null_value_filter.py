@@ -9,24 +9,23 @@ __copyright__ = "Copyright 2016 (c) Michael Conlon"
 __license__ = "New BSD License"
 __version__ = "0.01"
 
-import sys
+from collections import OrderedDict
 
-from pump.vivopump import read_csv_fp, write_csv_fp
-
-data_in = read_csv_fp(sys.stdin)
-data_out = {}
-null_count = 0
-for row, data in data_in.items():
-    new_data =dict(data)
-    for name, val in new_data.items():
-        if val == "NULL":
-            new_data[name] = ""
-            null_count += 1
-    data_out[row] = new_data
-print >>sys.stderr, "NULL values replaced", null_count
-write_csv_fp(sys.stdout, data_out)
+from pump.pipeline import run_row_filter
 
+counts = OrderedDict([('NULL values replaced', 0)])
 
 
+def filter_row(row, parms):
+    """
+    Replace "NULL" with empty string
+    """
+    for name, val in row.items():
+        if val == "NULL":
+            row[name] = ""
+            counts['NULL values replaced'] += 1
+    return row
 
 
+if __name__ == "__main__":
+    run_row_filter(filter_row, counts=counts)
@@ -10,36 +10,37 @@ __license__ = "New BSD License"
 __version__ = "0.01"
 
 import shelve
-import sys
+from collections import OrderedDict
 
-from pump.vivopump import read_csv_fp, write_csv_fp
+from pump.pipeline import run_row_filter
 
 privacy_shelve = shelve.open('privacy.db')
 privacy_ufids = set(privacy_shelve.keys())  # a set of ufids that have privacy information
-data_in = read_csv_fp(sys.stdin)
-print >>sys.stderr, "Privacy start", len(data_in)
-okay = 0
-protected = 0
-not_found = 0
-data_out = {}
-for row, data in data_in.items():
-    if data['UFID'] in privacy_ufids:  # must have privacy information
-        if privacy_shelve[data['UFID']]['UF_SECURITY_FLG'] == 'N' and privacy_shelve[data['UFID']][
+counts = OrderedDict([('Okay', 0), ('Protected', 0), ('Not Found', 0)])
+
+
+def filter_row(row, parms):
+    """
+    Keep the row if the ufid has privacy information and is not protected
+    """
+    if row['UFID'] in privacy_ufids:  # must have privacy information
+        if privacy_shelve[row['UFID']]['UF_SECURITY_FLG'] == 'N' and privacy_shelve[row['UFID']][
                 'UF_PROTECT_FLG'] == 'N':
-            data_out[row] = data
-            okay += 1
-        else:
-            protected += 1
+            counts['Okay'] += 1
+            return row
+        counts['Protected'] += 1
     else:
-        not_found +=1
-print >>sys.stderr, "Okay", okay
-print >>sys.stderr, "Protected", protected
-print >>sys.stderr, "Not Found", not_found
-print >>sys.stderr, "Privacy End", len(data_out)
-write_csv_fp(sys.stdout, data_out)
-privacy_shelve.close()
-
+        counts['Not Found'] += 1
+    return None
 
 
+def close():
+    """
+    Close the privacy shelve
+    """
+    privacy_shelve.close()
 
 
+if __name__ == "__main__":
+    run_row_filter(filter_row, counts=counts)
+    close()
@@ -9,32 +9,22 @@ __copyright__ = "Copyright 2016 (c) Michael Conlon"
 __license__ = "New BSD License"
 __version__ = "0.01"
 
-import sys
-
-from pump.vivopump import read_csv_fp, read_csv, write_csv_fp
+from pump.vivopump import read_csv
+from pump.pipeline import run_row_filter
 
 plan_data = read_csv('salary_plan_enum.txt', delimiter='\t')
-vivo_plans = [plan_data[x]['short'] for x in plan_data if plan_data[x]['vivo'] != "None"]  # list of qualifying plans
-data_in = read_csv_fp(sys.stdin)
-print >>sys.stderr, 'Data in', len(data_in)
-data_out = {}
-qualify = 0
-do_not_qualify = 0
-for row, data in data_in.items():
-    new_data = dict(data)
-    if new_data['SAL_ADMIN_PLAN'] in vivo_plans:
-        qualify += 1
-        new_data['types'] = new_data['SAL_ADMIN_PLAN']
-        data_out[row] = new_data
-    else:
-        do_not_qualify += 1
-
-print >>sys.stderr, 'Qualify', qualify
-print >>sys.stderr, 'Do not qualify', do_not_qualify
-print >>sys.stderr, 'Data out', len(data_out)
-write_csv_fp(sys.stdout, data_out)
-
+vivo_plans = set([plan_data[x]['short'] for x in plan_data if plan_data[x]['vivo'] != "None"])  # qualifying plans
 
 
+def filter_row(row, parms):
+    """
+    Keep the row if its salary plan qualifies
+    """
+    if row['SAL_ADMIN_PLAN'] in vivo_plans:
+        row['types'] = row['SAL_ADMIN_PLAN']
+        return row
+    return None
 
 
+if __name__ == "__main__":
+    run_row_filter(filter_row)
@@ -20,57 +20,59 @@ __copyright__ = "Copyright 2016 (c), Michael Conlon"
 __license__ = "New BSD License"
 __version__ = "0.01"
 
-import sys
+from pump.vivopump import get_vivo_types, get_parms, read_csv
+from pump.pipeline import run_data_filter
 
-from pump.vivopump import read_csv_fp, write_csv_fp, get_vivo_types, get_parms, read_csv
-
-parms = get_parms()
 type_data = read_csv('person_types.txt', delimiter='\t')
 type_enum = {type_data[row]['vivo']: type_data[row]['short'] for row in type_data}  # convert spreadsheet to dict
 plan_data = read_csv('salary_plan_enum.txt', delimiter='\t')
 plan_enum = {plan_data[row]['short']: plan_data[row]['vivo'] for row in plan_data}  # convert spreadsheet to dict
-vivo_types = get_vivo_types("?uri a uf:UFEntity . ?uri a foaf:Person .", parms)  # must match entity_sparql
-data_in = read_csv_fp(sys.stdin)
-data_out = {}
-for row, data in data_in.items():
-    new_data =dict(data)
-
-    #   Convert the source type to a VIVO type.  The source has an HR code.  Convert that to a VIVO person type URI
-    #   using the plan_enum.  Then convert that to the value to be stored in the type data.  Whew.
 
-    src_type = new_data['types']
-    if src_type in plan_enum:
-        src_type = type_enum[plan_enum[src_type]]
 
-    #   Prepare the types column with values from VIVO, if any
+def filter_data(data_in, parms):
+    """
+    Set the types of each person from their types in VIVO, their source type and whether they are current
+    """
+    vivo_types = get_vivo_types("?uri a uf:UFEntity . ?uri a foaf:Person .", parms)  # must match entity_sparql
+    data_out = {}
+    for row, data in data_in.items():
+        new_data =dict(data)
 
-    if new_data['uri'] in vivo_types:
-        type_list = vivo_types[new_data['uri']].split(';')
-        enum_list = []
-        for type_uri in type_list:
-            if type_uri in type_enum:
-                enum_list.append(type_enum[type_uri])
-        types = ';'.join(enum_list)
-    else:
-        types = 'uf'
+        #   Convert the source type to a VIVO type.  The source has an HR code.  Convert that to a VIVO person type URI
+        #   using the plan_enum.  Then convert that to the value to be stored in the type data.  Whew.
 
-    if types.find(src_type) < 0:
-        types = types + ';' + src_type
+        src_type = new_data['types']
+        if src_type in plan_enum:
+            src_type = type_enum[plan_enum[src_type]]
 
-    #   Update the "ufc" code in types (UFCurrentEntity) based on the values in the 'current' column
+        #   Prepare the types column with values from VIVO, if any
 
-    if new_data['current'] == 'yes' and types.find('ufc') < 0:
-        types += ';ufc'
-    elif new_data['current'] == 'no' and types.find('ufc') > -1:
-        types = types.replace('ufc', '')
+        if new_data['uri'] in vivo_types:
+            type_list = vivo_types[new_data['uri']].split(';')
+            enum_list = []
+            for type_uri in type_list:
+                if type_uri in type_enum:
+                    enum_list.append(type_enum[type_uri])
+            types = ';'.join(enum_list)
+        else:
+            types = 'uf'
 
-    #   All done.  Assign the new types
+        if types.find(src_type) < 0:
+            types = types + ';' + src_type
 
-    new_data['types'] = types
-    data_out[row] = new_data
-write_csv_fp(sys.stdout, data_out)
+        #   Update the "ufc" code in types (UFCurrentEntity) based on the values in the 'current' column
 
+        if new_data['current'] == 'yes' and types.find('ufc') < 0:
+            types += ';ufc'
+        elif new_data['current'] == 'no' and types.find('ufc') > -1:
+            types = types.replace('ufc', '')
 
+        #   All done.  Assign the new types
 
+        new_data['types'] = types
+        data_out[row] = new_data
+    return data_out
 
 
+if __name__ == "__main__":
+    run_data_filter(filter_data, get_parms())
@@ -9,36 +9,29 @@ __copyright__ = "Copyright 2015 (c) Michael Conlon"
 __license__ = "New BSD License"
 __version__ = "0.01"
 
-import sys
+from improve.improve import improve
+from pump.pipeline import run_row_filter
 
-from pump.vivopump import read_csv_fp, write_csv_fp, improve_jobcode_description
 
-data_in = read_csv_fp(sys.stdin)
-var_names = data_in[data_in.keys()[1]].keys()  # create a list of var_names from the first row
-print >>sys.stderr, "Columns in", var_names
-data_out = {}
-for row, data in data_in.items():
-    new_data =dict(data)
+def filter_row(row, parms):
+    """
+    Add the columns the pump needs and delete the columns it does not use
+    """
 
     # Add these columns
 
-    new_data['remove'] = ''
-    new_data['uri'] = ''
-    new_data['title'] = improve_jobcode_description(new_data['JOBCODE_DESCRIPTION'])
-    new_data['hr_title'] = new_data['JOBCODE_DESCRIPTION']
+    row['remove'] = ''
+    row['uri'] = ''
+    row['title'] = improve('improve_jobcode_description', row['JOBCODE_DESCRIPTION'])
+    row['hr_title'] = row['JOBCODE_DESCRIPTION']
 
     # Delete these columns
 
-    del new_data['JOBCODE']
-    del new_data['HR_POSITION']
-    del new_data['JOBCODE_DESCRIPTION']
-
-    data_out[row] = new_data
-var_names = data_out[data_out.keys()[1]].keys()  # create a list of var_names from the first row
-print >>sys.stderr, "Columns out", var_names
-write_csv_fp(sys.stdout, data_out)
-
-
-
+    del row['JOBCODE']
+    del row['HR_POSITION']
+    del row['JOBCODE_DESCRIPTION']
+    return row
 
 
+if __name__ == "__main__":
+    run_row_filter(filter_row)
@@ -23,27 +23,30 @@ __version__ = "0.02"
 
 import sys
 
-from pump.vivopump import read_csv_fp, write_csv_fp, get_vivo_positions, get_parms
+from pump.vivopump import get_vivo_positions, get_parms
+from pump.pipeline import run_data_filter
 
-parms = get_parms
-data_in = read_csv_fp(sys.stdin)
-print >>sys.stderr, len(data_in)
-data_out = {}
-vivo_positions = get_vivo_positions(parms)  # get dictionary of position uri keyed by ufid, deptid, hr_title, start_date
-print >>sys.stderr, 'VIVO positions', len(vivo_positions)
-
-for row, data in data_in.items():
-    key = ';'.join([data['UFID'], data['DEPTID'], data['hr_title'], data['START_DATE']])
-    data_out[row] = data
-    if key in vivo_positions:  # ufid is in vivo and source
-        data_out[row]['uri'] = vivo_positions[key]
-    else:  # key is in source, not in vivo
-        data_out[row]['uri'] = ''
-
-print >>sys.stderr, 'data out', len(data_out)
-write_csv_fp(sys.stdout, data_out)
 
+def filter_data(data_in, parms):
+    """
+    Add the VIVO uri of each position found in VIVO
+    """
+    print >>sys.stderr, len(data_in)
+    data_out = {}
+    vivo_positions = get_vivo_positions(parms)  # dictionary of position uri keyed by ufid, deptid, hr_title, start_date
+    print >>sys.stderr, 'VIVO positions', len(vivo_positions)
 
+    for row, data in data_in.items():
+        key = ';'.join([data['UFID'], data['DEPTID'], data['hr_title'], data['START_DATE']])
+        data_out[row] = dict(data)
+        if key in vivo_positions:  # ufid is in vivo and source
+            data_out[row]['uri'] = vivo_positions[key]
+        else:  # key is in source, not in vivo
+            data_out[row]['uri'] = ''
 
+    print >>sys.stderr, 'data out', len(data_out)
+    return data_out
 
 
+if __name__ == "__main__":
+    run_data_filter(filter_data, get_parms())
@@ -11,22 +11,18 @@ __version__ = "0.01"
 
 import sys
 
-from pump.vivopump import read_csv_fp, write_csv_fp
-
-data_in = read_csv_fp(sys.stdin)
-data_out = {}
-null_count = 0
-for row, data in data_in.items():
-    new_data =dict(data)
-    for name, val in new_data.items():
-        if val == "NULL":
-            new_data[name] = ""
-            null_count += 1
-    data_out[row] = new_data
-print >>sys.stderr, "NULL values replaced", null_count
-write_csv_fp(sys.stdout, data_out)
-
+from pump.pipeline import run_row_filter
 
 
+def filter_row(row, parms):
+    """
+    Replace "NULL" with empty string
+    """
+    for name, val in row.items():
+        if val == "NULL":
+            row[name] = ""
+    return row
 
 
+if __name__ == "__main__":
+    run_row_filter(filter_row)
@@ -12,35 +12,23 @@ class NoLastNameForAuthor(Exception):
     pass
 
 
-def get_entrez_record(pmid):
+def get_entrez_record(pmid, fetcher=None):
     """
-    Given a pmid, use Entrez to get first record from PubMed
+    Given a pmid, use Entrez to get first record from PubMed.  Records are
+    fetched by the shared EntrezFetcher unless a fetcher is given.  Fetch
+    the pmids of a run with fetcher.fetch(pmids) first to get them in
+    batches
     """
-    from Bio import Entrez
-    from time import sleep
-    Entrez.email = 'mconlon@ufl.edu'
-
-    # Get record(s) from Entrez.  Retry if Entrez does not respond
-
-    start = 2.0
-    retries = 10
-    count = 0
-    while True:
-        try:
-            handle = Entrez.efetch(db="pubmed", id=pmid, retmode="xml")
-            records = Entrez.parse(handle)
-            for record in records:
-                pass
-            break
-        except IOError:
-            count += 1
-            if count > retries:
-                raise TimeOut
-            sleep_seconds = start ** count
-            print "<!-- Failed Entrez query. Count = " + str(count) + \
-                  " Will sleep now for " + str(sleep_seconds) + \
-                  " seconds and retry -->"
-            sleep(sleep_seconds)  # increase the wait time with each retry
+    from pubmed.pubmed import get_entrez_fetcher, parse_pubmed_records
+    if fetcher is None:
+        fetcher = get_entrez_fetcher()
+    try:
+        articles = fetcher.fetch([pmid])
+    except IOError:
+        raise TimeOut
+    record = None
+    for record in parse_pubmed_records(articles.values()):
+        pass
     return record
 
 
@@ -293,17 +281,33 @@ def make_pub_rdf(pub):
     return [ardf, pub_uri]
 
 
-def get_pubmed(pmid, author_uris=None):
+def get_pubmeds(pmids, author_uris=None, cache_file=None):
+    """
+    Given a list of pubmed identifiers, fetch their records from Entrez in
+    batches, then return the [rdf, pub] of each, as returned by get_pubmed.
+    With a cache_file, records are cached in that file, and a later run
+    fetches only the papers that are new or changed in PubMed
+    """
+    from pubmed.pubmed import get_entrez_fetcher
+    fetcher = get_entrez_fetcher(cache_file)
+    try:
+        fetcher.fetch(pmids)
+    except IOError:
+        raise TimeOut
+    return [get_pubmed(pmid, author_uris, fetcher) for pmid in pmids]
+
+
+def get_pubmed(pmid, author_uris=None, fetcher=None):
     """
     Given a pubmid identifer, return a structure containing the elements
     of the publication of interest to VIVO. Optionally, provide a set of
     author_uris for use in disambiguation.  When find_author returns a
     set of size > 1, the author_uris will be examined for matches to
-    assist with disambiguation.
+    assist with disambiguation.  Use get_pubmeds for many pmids
     """
     from pump.vivopump import new_uri
     ardf = ""
-    record = get_entrez_record(pmid)
+    record = get_entrez_record(pmid, fetcher)
     if record is None:
         return ["", None]
     pub = document_from_pubmed(record)
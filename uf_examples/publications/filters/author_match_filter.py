@@ -17,7 +17,9 @@ There are two cases:
     are the same.
 2.  The source indicates the author is at UF.  In this case, extensive
     disambiguation matching occurs, based on name and name parts.  If no match
-    occurs, the author will be added as a UFEntity.  If multiple matches occur,
+    occurs, the author will be added as a UFEntity.  A name not found exactly
+    is matched to the most similar name, as a misspelling might be, and the
+    match is reported.  If multiple matches occur,
     one is selected at random and a disambiguation report entry is produced
     showing all the possible matches and the one that was selected.  Many
     disambiguation cases involve two URI.  Randomly selecting one cuts the
@@ -35,6 +37,7 @@ import sys
 
 from pump.vivopump import read_csv_fp, write_csv_fp, get_parms
 from disambiguate import utils
+from disambiguate.index import open_disambiguation_index
 
 parms = get_parms()
 data_in = read_csv_fp(sys.stdin)
@@ -43,14 +46,30 @@ print >>sys.stderr, len(data_in)
 # file_name = '/Users/asura/git/vivo-pump/author_list.csv'
 # @TODO: pass file name path as a command line parameter
 file_name = 'author_list.csv'
+index_file_name = 'author_list.idx'
 utils.print_err("Using static disambiguation file: {}".format(file_name))
 
-# get dictionaries of authors keyed by name parts
-vivo_auth_disambig_data = utils.get_vivo_disambiguation_data_from_csv(
-    file_name)
-
-utils.print_err("Finished loading {} entries from: {}"
-                .format(len(vivo_auth_disambig_data), file_name))
+# get the index of authors keyed by name parts.  The index is built from the
+# disambiguation file the first time, and when the file changes the new
+# authors are added to the index
+vivo_auth_disambig_data = open_disambiguation_index(index_file_name,
+                                                    file_name)
+
+utils.print_err("Opened index: {}".format(index_file_name))
+
+# match all the UF authors at once.  Names not found exactly are matched to
+# the most similar name in the index
+
+fuzzy_rows = {}
+uf_uris = utils.match_authors(vivo_auth_disambig_data,
+                              dict((row_index, row_data) for row_index, row_data
+                                   in data_in.items()
+                                   if row_data['uf'] != 'false'),
+                              fuzzy_rows=fuzzy_rows)
+for row_index, (key, close_key) in sorted(fuzzy_rows.items()):
+    utils.print_err("row {} - similar name: {} -> {}"
+                    .format(row_index, key, close_key))
+utils.print_err("{} authors matched by similar name".format(len(fuzzy_rows)))
 data_out = {}
 row_out = 0
 
@@ -69,11 +88,7 @@ for row_index, row_data in data_in.items():
         data_out[row_out] = row_data
         data_out[row_out]['uri'] = ''
     else:
-        author_uris = utils.get_author_disambiguation_data(
-            vivo_auth_disambig_data,
-            row_data['last'],
-            row_data['first'],
-            row_data['middle'])
+        author_uris = uf_uris[row_index]
 
         count = len(author_uris)
         if count == 0:
@@ -83,6 +98,7 @@ for row_index, row_data in data_in.items():
             data_out[row_out]['uri'] = ''
         elif count == 1:
             # Bingo! Disambiguated UF author. Add URI
+            row_out += 1
             data_out[row_out] = row_data
             utils.print_err("row {} - author_uris: {}"
                             .format(row_out, author_uris))
@@ -91,6 +107,7 @@ for row_index, row_data in data_in.items():
             action = "Found UF"
         else:
             # More than one UF author matches. Add to the disambiguation list.
+            row_out += 1
             data_out[row_out] = row_data
             data_out[row_out]['uri'] = ";".join(author_uris)
             action = 'Disambig'
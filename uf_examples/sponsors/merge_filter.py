@@ -23,29 +23,32 @@ __version__ = "0.02"
 
 import sys
 
-from pump.vivopump import read_csv_fp, write_csv_fp, get_vivo_sponsorid, get_parms
-
-parms = get_parms()
-if parms['verbose']:
-    print >>sys.stderr, parms
-data_in = read_csv_fp(sys.stdin)
-print >>sys.stderr, len(data_in)
-data_out = {}
-vivo_sponsors = get_vivo_sponsorid(parms)  # get dictionary of sponsor uri keyed by sponsorid
-print >>sys.stderr, 'VIVO sponsors', len(vivo_sponsors)
-
-for row, data in data_in.items():
-    new_data = dict(data)
-    if data['sponsorid'] in vivo_sponsors:  # sponsorid is in vivo and source
-        new_data['uri'] = vivo_sponsors[data['sponsorid']]
-    else:  # key is in source, not in vivo
-        new_data['uri'] = ''
-    data_out[row] = new_data
-
-print >>sys.stderr, 'data out', len(data_out)
-write_csv_fp(sys.stdout, data_out)
-
-
-
-
-
+from pump.vivopump import get_vivo_sponsorid, get_parms
+from pump.pipeline import run_data_filter
+
+
+def filter_data(data_in, parms):
+    """
+    Add the VIVO uri of each sponsor found in VIVO
+    """
+    if parms['verbose']:
+        print >>sys.stderr, parms
+    print >>sys.stderr, len(data_in)
+    data_out = {}
+    vivo_sponsors = get_vivo_sponsorid(parms)  # get dictionary of sponsor uri keyed by sponsorid
+    print >>sys.stderr, 'VIVO sponsors', len(vivo_sponsors)
+
+    for row, data in data_in.items():
+        new_data = dict(data)
+        if data['sponsorid'] in vivo_sponsors:  # sponsorid is in vivo and source
+            new_data['uri'] = vivo_sponsors[data['sponsorid']]
+        else:  # key is in source, not in vivo
+            new_data['uri'] = ''
+        data_out[row] = new_data
+
+    print >>sys.stderr, 'data out', len(data_out)
+    return data_out
+
+
+if __name__ == "__main__":
+    run_data_filter(filter_data, get_parms())